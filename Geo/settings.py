@@ -151,6 +151,29 @@ else:
         'django.contrib.staticfiles.finders.AppDirectoriesFinder',
     )
 
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+# Кэш "sync" хранится на диске и общий для всех процессов (команд manage.py и воркеров)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'sync': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv("SYNC_CACHE_DIR", os.path.join(BASE_DIR, '.cache', 'sync')),
+    },
+    # Кэш ответов внешних сервисов. Используется, если задана переменная окружения HTTP_CACHE_ENABLED
+    'http': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv("HTTP_CACHE_DIR", os.path.join(BASE_DIR, '.cache', 'http')),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv("HTTP_CACHE_MAX_ENTRIES", 500)),
+        },
+    },
+}
+
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 
@@ -43,7 +43,7 @@ class MoySkladDBGoodAdmin(admin.ModelAdmin):
         "brewery",
         "name",
     )
-    list_filter = (AlcoListFilter,)
+    list_filter = (AlcoListFilter, "is_archived")
     ordering = ("brewery", "name")
 
     save_on_top = True
@@ -64,6 +64,7 @@ class MoySkladDBGoodAdmin(admin.ModelAdmin):
         "is_draft",
         "bev_type",
         "capacity",
+        "is_archived",
     )
 
     filter_vertical = ("egais_code",)
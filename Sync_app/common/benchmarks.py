@@ -0,0 +1,510 @@
+"""Модуль содержит синтетические замеры производительности, запускаемые командой manage.py benchmark."""
+import datetime
+import gzip
+import json
+import random
+import time
+import tracemalloc
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+import Sync_app.googledrive.googledrive_diff as gs_diff
+import Sync_app.googledrive.googledrive_suggestions as gs_suggest
+import Sync_app.models.konturmarket_models as km_models
+import Sync_app.models.moysklad_models as ms_models
+import Sync_app.moysklad.moysklad_class_lib as ms_class
+import Sync_app.moysklad.moysklad_urls as ms_urls
+from Sync_app.konturmarket.konturmarket_allocation import allocate
+from Sync_app.moysklad.moysklad_parser import parse_name
+from Sync_app.moysklad.moysklad_retail import RetailAggregation
+
+_BREWERIES: Tuple[str, ...] = ("Lux In Tenebris", "Alaska", "Butch & Dutch", "Coven", "4Пивовара", "Бакунин")
+_STYLES: Tuple[str, ...] = (
+    "Sour - Gose - Fruited",
+    "Lager - IPL (India Pale Lager)",
+    "IPA - New England",
+    "Stout - Imperial / Double",
+    "Cider - Rose",
+    "Kombucha",
+)
+_MODIFICATIONS: Tuple[str, ...] = ("Банка 0,33", "Бутылка 0,5", "Бутылка 0,75")
+
+# Наименования из описаний методов разбора Good и пограничные случаи
+NAME_CORPUS: Tuple[Tuple[str, str], ...] = (
+    ("Lux In Tenebris - Der Grusel (Sour - Gose - Fruited. OG 11.5%, ABV 4,2%)", ""),
+    ("Coven - GLAM (Lager - IPL (India Pale Lager). ABV 5.5%, IBU 15)", ""),
+    ("Molson Coors (UK) - Carling Original (Lager - Pale. ABV 3,7%)", ""),
+    ("Barista Chocolate Quad (Belgian Quadrupel. ABV 11%)", ""),
+    ("Кер Сари Пшеничное (Wheat Beer - Other. ABV 4,5%)", ""),
+    ("Butch & Dutch - IPA 100 IBU (IPA - International. ABV 7%, IBU 100)", ""),
+    ("Trappistes Rochefort 6 (Belgian Dubbel. ABV 7,5%, IBU 22)", ""),
+    ("Fournier - Frères Producteurs - Eleveurs - Cidre Rose (Cider - Rose. ABV 3%)", "Сидр/Fournier"),
+    ("Shepherd Neame - Classic Collection - India Pale Ale (IPA - English. OG 14,6%, ABV 6,1%)", "Пиво/Shepherd Neame"),
+    ("Alaska - Нигилист (Lager - IPL (India Pale Lager). OG 16%, ABV 6,8%, IBU 60) (Бутылка 0,5)", ""),
+    ("Степь и Ветер - Smoothie Mead: Raspberry, Black Currant, Mint (Mead - Melomel. ABV 6%) (0,33)", ""),
+    ("Rebel Apple - Груша (Cider - Perry. ABV 5%) ж\\б", ""),
+    ("Chaga - Kombucha Original (Kombucha)", "Комбуча"),
+    ("Лимонад Тархун (Lemonade. Non-alcoholic)", ""),
+    ("Пиво без описания", ""),
+    ("Пивоварня - Пиво без описания", ""),
+    ("", ""),
+)
+
+
+def synthetic_assortment_row(index: int) -> Dict[str, Any]:
+    """Функция возвращает строку ассортимента в формате JSON ответа МойСклад."""
+    rnd = random.Random(index)
+    brewery = _BREWERIES[index % len(_BREWERIES)]
+    style = _STYLES[index % len(_STYLES)]
+    characteristics = f"OG {rnd.randint(10, 25)},{rnd.randint(0, 9)}%, ABV {rnd.randint(3, 12)}%, IBU {rnd.randint(0, 90)}"
+    name = f"{brewery} - Beer {index} ({style}. {characteristics})"
+    row: Dict[str, Any] = {
+        "id": f"00000000-0000-0000-0000-{index:012d}",
+        "name": name,
+        "quantity": rnd.randint(-1, 50),
+        "salePrices": [{"value": rnd.randint(100, 999) * 100}],
+        "attributes": [{"name": "Алкогольная продукция", "value": True}],
+    }
+    if index % 4 == 0:
+        modification = _MODIFICATIONS[index % len(_MODIFICATIONS)]
+        row["name"] = f"{name} ({modification})"
+        row["characteristics"] = [{"name": "Тара", "value": modification}]
+        row["product"] = {"meta": {"uuidHref": f"https://online.moysklad.ru/app/#good/edit?id=parent-{index}"}}
+    else:
+        row["pathName"] = f"Пиво/{brewery}"
+        row["volume"] = 0.5
+        if index % 3 == 0:
+            row["attributes"].insert(0, {"name": "Розлив", "value": "да"})
+    return row
+
+
+def synthetic_retail_check(index: int, day: datetime.date, goods: int = 500, lean: bool = False) -> Dict[str, Any]:
+    """Функция возвращает чек продажи (возврата) в формате JSON ответа МойСклад.
+
+    :param lean: False - с развернутыми карточками товаров (expand=positions.assortment), True - только ссылки на товары.
+    """
+    rnd = random.Random(index)
+    created = datetime.datetime.combine(day, datetime.time()) + datetime.timedelta(seconds=rnd.randint(0, 86399))
+    positions = []
+    for position in range(rnd.randint(1, 6)):
+        good = synthetic_assortment_row(rnd.randrange(goods))
+        assortment = {"meta": {"href": f"{ms_urls.JSON_URL}entity/product/{good['id']}", "type": "product"}} if lean else good
+        positions.append({"id": f"{index}-{position}", "quantity": float(rnd.randint(1, 4)), "assortment": assortment})
+    return {
+        "id": str(index),
+        "name": f"{index:05d}",
+        "created": created.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],
+        "positions": {"meta": {"size": len(positions)}, "rows": positions},
+    }
+
+
+class SyntheticMoySklad(ms_class.MoySklad):
+    """Класс подменяет запросы к сервису МойСклад страницами синтетического ассортимента."""
+
+    def __init__(self, size: int, latency: float = 0.0) -> None:
+        """Конструктор.
+
+        :param size: количество строк в ассортименте.
+        :param latency: искусственная задержка ответа на одну страницу, в секундах.
+        """
+        super().__init__(_token="synthetic")
+        self.size = size
+        self.latency = latency
+
+    def _get_page(self, url: ms_urls.MoySkladUrl) -> Optional[Dict[str, Any]]:
+        offset = int(url.request_filter.get("offset", 0))
+        limit = int(url.request_filter.get("limit", ms_urls.ASSORTMENT_LIMIT))
+        if self.latency:
+            time.sleep(self.latency)
+        return {
+            "meta": {"size": self.size},
+            "rows": [synthetic_assortment_row(i) for i in range(offset, min(offset + limit, self.size))],
+        }
+
+
+def _measure(func: Callable[[], Any]) -> Tuple[float, int, Any]:
+    """Функция возвращает время выполнения func, пиковый объем выделенной памяти и результат func."""
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def bench_assortment_stream(size: int, latency: float = 0.05) -> List[str]:
+    """Сравнение списочной и потоковой загрузки ассортимента.
+
+    В качестве записи в БД используется разбор наименования каждого товара.
+    """
+    ms = SyntheticMoySklad(size=size, latency=latency)
+
+    def list_path() -> float:
+        started = time.perf_counter()
+        goods = ms.get_assortment()
+        first_batch = time.perf_counter() - started
+        for good in goods:
+            good.parse_object()
+        return first_batch
+
+    def stream_path() -> float:
+        started = time.perf_counter()
+        first_batch: Optional[float] = None
+        for page in ms.iter_assortment():
+            if first_batch is None:
+                first_batch = time.perf_counter() - started
+            for good in page:
+                good.parse_object()
+        return first_batch or 0.0
+
+    report: List[str] = []
+    for title, path in (("list", list_path), ("stream", stream_path)):
+        elapsed, peak, first_batch = _measure(path)
+        report.append(
+            f"{title:>8}: rows={size} total={elapsed:.2f}s first_batch={first_batch:.2f}s peak_memory={peak / 2 ** 20:.1f}MiB",
+        )
+    return report
+
+
+def bench_transport(size: int) -> List[str]:
+    """Сравнение объема и времени разбора ответов ассортимента.
+
+    Сравниваются ответы с форматированием JSON (Lognex-Pretty-Print-JSON) и без него, без сжатия и со сжатием gzip.
+    requests запрашивает сжатые ответы по умолчанию, поэтому по сети передается объем из столбца gzip.
+    """
+    pages = [
+        {"meta": {"size": size}, "rows": [synthetic_assortment_row(i) for i in range(offset, min(offset + ms_urls.ASSORTMENT_LIMIT, size))]}
+        for offset in range(0, size, ms_urls.ASSORTMENT_LIMIT)
+    ]
+    report: List[str] = []
+    for title, indent in (("pretty", 2), ("compact", None)):
+        bodies = [json.dumps(page, ensure_ascii=False, indent=indent).encode() for page in pages]
+        compressed = sum(len(gzip.compress(body)) for body in bodies)
+
+        started = time.perf_counter()
+        for body in bodies:
+            json.loads(body)
+        elapsed = time.perf_counter() - started
+
+        report.append(
+            f"{title:>8}: rows={size} pages={len(bodies)} raw={sum(map(len, bodies)) / 2 ** 20:.2f}MiB "
+            f"gzip={compressed / 2 ** 20:.2f}MiB json_parse={elapsed:.2f}s",
+        )
+    return report
+
+
+def bench_good_parsing(size: int) -> List[str]:
+    """Сравнение разбора строк ассортимента pydantic моделью Good и облегченной записью GoodRecord."""
+    rows = [synthetic_assortment_row(i) for i in range(size)]
+    report: List[str] = []
+    for title, parse in (("pydantic", lambda row: ms_class.Good(**row)), ("record", ms_class.GoodRecord.from_row)):
+        elapsed, peak, _ = _measure(lambda: [parse(row) for row in rows])
+        report.append(f"{title:>8}: rows={size} parse={elapsed:.2f}s peak_memory={peak / 2 ** 20:.1f}MiB")
+    return report
+
+
+def bench_name_parser(size: int) -> List[str]:
+    """Сравнение однопроходного разбора наименований с пошаговым разбором Good.
+
+    Корпус - наименования из описаний методов Good, пограничные случаи и синтетический ассортимент.
+    Синтетический ассортимент разбирается дважды: второй проход показывает выигрыш от запоминания результатов
+    (если количество строк не превышает MOYSKLAD_PARSE_CACHE_SIZE).
+    """
+    rows = [
+        {"id": str(i), "name": name, "pathName": path_name, "salePrices": [{"value": 0}]}
+        for i, (name, path_name) in enumerate(NAME_CORPUS)
+    ]
+    rows.extend(synthetic_assortment_row(i) for i in range(size))
+    records = [ms_class.GoodRecord.from_row(row) for row in rows]
+
+    def parse(by_steps: bool) -> List[ms_class.GoodTuple]:
+        parse_fields = ms_class.Good._parse_fields_by_steps if by_steps else ms_class.Good._parse_fields
+        return [
+            parse_fields(
+                name=record.name,
+                modifications=record.modifications,
+                path_name=record.path_name,
+                attributes=record.attributes,
+                volume=record.volume,
+            )
+            for record in records
+        ]
+
+    parse_name.cache_clear()
+    started = time.perf_counter()
+    parse(by_steps=True)
+    by_steps_elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    parse(by_steps=False)
+    cold_elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    parse(by_steps=False)
+    warm_elapsed = time.perf_counter() - started
+
+    return [
+        f"by_steps: rows={len(records)} parse={by_steps_elapsed:.2f}s",
+        f"    cold: rows={len(records)} parse={cold_elapsed:.2f}s",
+        f"    warm: rows={len(records)} parse={warm_elapsed:.2f}s {parse_name.cache_info()}",
+    ]
+
+
+def _aggregate_by_models(checks: List[Dict[str, Any]]) -> Dict[Tuple[str, str], int]:
+    """Прежний способ агрегации: чек разбирается моделью RetailDemand, позиция пересоздается при каждом сложении."""
+    goods: Dict[Tuple[str, str], ms_class.RetailDemandPosition] = {}
+    for check in checks:
+        retail_demand = ms_class.RetailDemand(**check)
+        demand_date = retail_demand.created.strftime("%Y-%m-%d")
+        if retail_demand.positions is None:
+            continue
+        for position in retail_demand.positions.all_:
+            key = (position.good.good_id, demand_date)
+            if not goods.get(key):
+                goods[key] = ms_class.RetailDemandPosition(
+                    good_id=position.good.good_id, quantity=int(position.quantity), demand_date=demand_date,
+                )
+            else:
+                goods[key] = goods[key]._replace(quantity=goods[key].quantity + int(position.quantity))
+    return {key: good.quantity for key, good in goods.items()}
+
+
+def bench_retail_aggregation(size: int) -> List[str]:
+    """Сравнение агрегации розничных продаж за синтетический день из size чеков моделями и RetailAggregation."""
+    day = datetime.date(2022, 10, 5)
+    checks = [synthetic_retail_check(index, day) for index in range(size)]
+
+    elapsed_models, peak_models, expected = _measure(lambda: _aggregate_by_models(checks))
+    elapsed, peak, aggregation = _measure(lambda: RetailAggregation().add_checks(checks))
+    positions = aggregation.to_positions(ms_class.RetailDemandPosition)
+
+    return [
+        f"  models: checks={size} positions={len(expected)} total={elapsed_models:.2f}s peak_memory={peak_models / 2 ** 20:.1f}MiB",
+        f"counters: checks={size} positions={len(positions)} total={elapsed:.2f}s peak_memory={peak / 2 ** 20:.1f}MiB",
+    ]
+
+
+def bench_retail_payload(size: int) -> List[str]:
+    """Сравнение объема и времени разбора продаж за синтетический день из size чеков с карточками товаров и без них."""
+    day = datetime.date(2022, 10, 5)
+    report: List[str] = []
+    for title, lean in (("expand", False), ("lean", True)):
+        checks = [synthetic_retail_check(index, day, lean=lean) for index in range(size)]
+        pages = [
+            json.dumps({"meta": {"size": size}, "rows": checks[offset: offset + ms_urls.RETAIL_LIMIT]}, ensure_ascii=False).encode()
+            for offset in range(0, size, ms_urls.RETAIL_LIMIT)
+        ]
+        compressed = sum(len(gzip.compress(page)) for page in pages)
+
+        started = time.perf_counter()
+        aggregation = RetailAggregation()
+        for page in pages:
+            aggregation.add_checks(json.loads(page)["rows"])
+        elapsed = time.perf_counter() - started
+
+        report.append(
+            f"{title:>8}: checks={size} raw={sum(map(len, pages)) / 2 ** 20:.2f}MiB gzip={compressed / 2 ** 20:.2f}MiB "
+            f"parse_and_aggregate={elapsed:.2f}s",
+        )
+    return report
+
+
+def _create_sales_history(goods: int, days: int, day: datetime.date) -> int:
+    """Функция заполняет БД синтетической историей продаж за days дней до day включительно и возвращает количество продаж.
+
+    Каждый товар МойСклад связан с 1-3 кодами ЕГАИС, часть кодов общая для нескольких товаров.
+    """
+    rnd = random.Random(goods)
+    producer = km_models.KonturMarketDBProducer.objects.create(fsrar="bench", short_name="bench", full_name="bench")
+    km_goods = km_models.KonturMarketDBGood.objects.bulk_create(
+        km_models.KonturMarketDBGood(
+            egais_code=f"bench{index:014d}", full_name=f"ЕГАИС {index}", capacity=0.5, kind_code=261, fsrar=producer,
+        )
+        for index in range(goods)
+    )
+    km_models.KonturMarketDBStock.objects.bulk_create(
+        km_models.KonturMarketDBStock(egais_code=km_good, quantity=rnd.randint(0, 20)) for km_good in km_goods
+    )
+    ms_goods = ms_models.MoySkladDBGood.objects.bulk_create(
+        ms_models.MoySkladDBGood(
+            uuid=f"bench-{index:031d}", parent_uuid="", full_name=f"bench {index}", path_name="", style="", price=100,
+            brewery="", name="", abv=5, og=12, ibu=0, is_alco=True, bev_type="beer", capacity=0.5,
+        )
+        for index in range(goods)
+    )
+    through = ms_models.MoySkladDBGood.egais_code.through
+    through.objects.bulk_create(
+        through(moyskladdbgood=ms_good, konturmarketdbgood=km_goods[(index + shift * 7) % goods])
+        for index, ms_good in enumerate(ms_goods)
+        for shift in range(rnd.randint(1, 3))
+    )
+    sales = ms_models.MoySkladDBRetailDemand.objects.bulk_create(
+        ms_models.MoySkladDBRetailDemand(uuid=ms_good, demand_date=day - datetime.timedelta(days=shift), quantity=rnd.randint(1, 6))
+        for shift in range(days)
+        for ms_good in rnd.sample(ms_goods, goods // 5)
+    )
+    return len(sales)
+
+
+def bench_sales_journal(size: int) -> List[str]:
+    """Замер построения журнала продаж за день на синтетической истории продаж size товаров за 365 дней.
+
+    История создается в настроенной БД внутри транзакции, которая откатывается после замера.
+    """
+    day = datetime.date(2022, 10, 5)
+    with transaction.atomic():
+        sales = _create_sales_history(goods=size, days=365, day=day)
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            rows = km_models.KonturMarketDBGood.get_sales_journal_from_db(day)
+            elapsed = time.perf_counter() - started
+        transaction.set_rollback(True)
+    return [f"history: goods={size} sales={sales}; journal: rows={len(rows)} queries={len(queries)} total={elapsed:.2f}s"]
+
+
+def _suggest_by_pairs(
+    candidates: List[gs_suggest.MatchCandidate], text: str, brewery: str, capacity: Optional[Decimal], count: int,
+) -> List[gs_suggest.Suggestion]:
+    """Эталонный подбор похожих товаров: попарное сравнение строки со всеми товарами."""
+    query = gs_suggest.get_trigrams(text)
+    suggestions = []
+    for candidate in candidates:
+        similarity = gs_suggest.get_similarity(query, gs_suggest.get_trigrams(f"{candidate.brewery} {candidate.name}"))
+        if similarity < gs_suggest.MIN_SIMILARITY:
+            continue
+        score = similarity
+        if brewery and candidate.brewery.lower() == brewery.lower():
+            score += gs_suggest.BREWERY_WEIGHT
+        if capacity is not None and candidate.capacity == capacity:
+            score += gs_suggest.CAPACITY_WEIGHT
+        suggestions.append(gs_suggest.Suggestion(candidate=candidate, score=round(score, 3)))
+    return sorted(suggestions, key=lambda suggestion: (-suggestion.score, suggestion.candidate.uuid))[:count]
+
+
+def _misspell(rnd: random.Random, text: str) -> str:
+    """Функция вносит в строку text случайную опечатку: пропуск, замену или перестановку символов."""
+    position = rnd.randrange(len(text) - 1)
+    kind = rnd.randrange(3)
+    if kind == 0:
+        return text[:position] + text[position + 1 :]  # noqa
+    if kind == 1:
+        return text[:position] + rnd.choice("aeiouxyz") + text[position + 1 :]  # noqa
+    return text[:position] + text[position + 1] + text[position] + text[position + 2 :]  # noqa
+
+
+def bench_match_suggestions(size: int) -> List[str]:
+    """Подбор похожих товаров по обратному индексу триграмм на синтетическом ассортименте из size товаров.
+
+    Строки таблицы соответствия - названия товаров с опечатками, в другом регистре, часть - без пивоварни.
+    Для части строк результат сверяется с попарным сравнением со всем ассортиментом (может отличаться для строк,
+    похожих на товары только частыми триграммами), считается доля строк, для которых исходный товар попал в предложенные.
+    """
+    rnd = random.Random(size)
+    words = sorted({"".join(rnd.choices("abcdefghiklmnoprstuvyz", k=rnd.randint(4, 9))) for _ in range(5000)})
+    styles = ["IPA", "Stout", "Sour", "Lager", "Porter", "Gose", "Pils", "Ale"]
+    breweries = [" ".join(rnd.sample(words, 2)).title() for _ in range(300)]
+    candidates = []
+    for index in range(size):
+        name = " ".join(rnd.sample(words, rnd.randint(1, 3)) + [rnd.choice(styles)]).title()
+        brewery = breweries[index % len(breweries)]
+        candidates.append(
+            gs_suggest.MatchCandidate(
+                uuid=f"bench-{index:031d}", full_name=f"{brewery} - {name}", brewery=brewery, name=name,
+                capacity=rnd.choice((Decimal("0.33"), Decimal("0.44"), Decimal("0.5"), Decimal("0.75"))),
+            ),
+        )
+
+    queries = []
+    for candidate in rnd.sample(candidates, min(size, 2000)):
+        name = _misspell(rnd, candidate.name).lower()
+        brewery = candidate.brewery if rnd.random() < 0.7 else ""
+        queries.append((candidate, f"{brewery} {name}", brewery, candidate.capacity))
+
+    started = time.perf_counter()
+    suggestion_index = gs_suggest.SuggestionIndex(candidates)
+    build = time.perf_counter() - started
+    started = time.perf_counter()
+    results = [suggestion_index.suggest(text, brewery, capacity) for _, text, brewery, capacity in queries]
+    elapsed = time.perf_counter() - started
+    found = sum(source in [suggestion.candidate for suggestion in result] for (source, *_), result in zip(queries, results))
+    report = [
+        f"   index: candidates={size} rows={len(queries)} build={build:.2f}s suggest={elapsed:.2f}s "
+        f"recall@{gs_suggest.SUGGESTIONS_COUNT}={found / len(queries):.3f}",
+    ]
+
+    sample = queries[:50]
+    started = time.perf_counter()
+    reference = [
+        _suggest_by_pairs(candidates, text, brewery, capacity, gs_suggest.SUGGESTIONS_COUNT) for _, text, brewery, capacity in sample
+    ]
+    pairs = time.perf_counter() - started
+    report.append(
+        f"   pairs: rows={len(sample)} total={pairs:.2f}s (~{pairs / len(sample) * len(queries):.1f}s for {len(queries)} rows)",
+    )
+    equal = sum(result == expected for result, expected in zip(results, reference))
+    first_equal = sum(result[:1] == expected[:1] for result, expected in zip(results, reference))
+    report.append(f"equal to pairs: top-1 {first_equal}/{len(sample)}, top-{gs_suggest.SUGGESTIONS_COUNT} {equal}/{len(sample)}")
+    return report
+
+
+def bench_sheet_diff(size: int) -> List[str]:
+    """Замер вычисления изменений диапазона Google Sheets из size строк по 7 столбцов.
+
+    Изменяется часть ячеек, часть строк удаляется с конца или добавляется. Считается количество записываемых
+    ячеек и блоков.
+    """
+    rnd = random.Random(size)
+    current: List[List[Any]] = [
+        [f"Товар {row}", f"Пивоварня {row % 50}", "Стиль", rnd.choice((0.33, 0.5)), rnd.randint(0, 20), 250.0, ""]
+        for row in range(size)
+    ]
+    report: List[str] = []
+    for share in (0.001, 0.01, 0.5):
+        data = [list(row) for row in current]
+        for _ in range(int(size * 7 * share)):
+            data[rnd.randrange(size)][rnd.randrange(7)] = rnd.randint(0, 1000)
+        if share < 0.5:
+            del data[size - max(1, int(size * share)):]
+            data.extend([f"Новый товар {row}", "Пивоварня", "", 0.5, 1, 300] for row in range(int(size * share)))
+
+        started = time.perf_counter()
+        blocks = gs_diff.get_changed_blocks(current=current, data=data)
+        elapsed = time.perf_counter() - started
+        cells = gs_diff.count_cells(blocks)
+        full = sum(len(row) for row in data)
+        report.append(
+            f"changed {share:>6.1%}: blocks={len(blocks)} cells={cells} full={full} "
+            f"{'diff' if cells <= full else 'full rewrite'} total={elapsed:.2f}s",
+        )
+    return report
+
+
+def bench_allocation(size: int) -> List[str]:
+    """Замер распределения size продаж по кодам ЕГАИС (в среднем по две продажи на код, у продажи 1-3 кода)."""
+    rnd = random.Random(size)
+    codes = [f"code{index}" for index in range(max(1, size // 2))]
+    stock = {code: rnd.randint(0, 50) for code in codes}
+    sold = [rnd.randint(1, 6) for _ in range(size)]
+    links = [rnd.sample(codes, min(len(codes), rnd.randint(1, 3))) for _ in sold]
+    started = time.perf_counter()
+    allocations = allocate(sold, links, stock)
+    elapsed = time.perf_counter() - started
+    return [f"allocate: sales={size} allocations={len(allocations)} total={elapsed:.2f}s"]
+
+
+BENCHMARKS: Dict[str, Callable[[int], List[str]]] = {
+    "name_parser": bench_name_parser,
+    "good_parsing": bench_good_parsing,
+    "assortment_stream": bench_assortment_stream,
+    "transport": bench_transport,
+    "retail_aggregation": bench_retail_aggregation,
+    "retail_payload": bench_retail_payload,
+    "sales_journal": bench_sales_journal,
+    "allocation": bench_allocation,
+    "match_suggestions": bench_match_suggestions,
+    "sheet_diff": bench_sheet_diff,
+}
@@ -0,0 +1,90 @@
+"""Модуль содержит дисковый кэш ответов внешних сервисов: МойСклад, Контур.Маркет, Google Sheets.
+
+Кэш включается переменной окружения HTTP_CACHE_ENABLED и нужен, чтобы несколько команд, запущенных друг за другом,
+не загружали одни и те же данные повторно. В кэше хранятся разобранные JSON ответы, ключ - url и параметры запроса.
+Размер кэша ограничен настройкой MAX_ENTRIES кэша "http" в settings.py, при превышении старые записи вытесняются.
+"""
+import hashlib
+import json
+import os
+from typing import Any, Callable, Dict, Optional
+
+from django.core.cache import caches
+
+# Название кэша в settings.CACHES
+HTTP_CACHE = "http"
+
+# Время жизни ответа в кэше в зависимости от endpoint'а, сек. Ответы остальных endpoint'ов не кэшируются
+ENDPOINT_TTL: Dict[str, int] = {
+    "entity/assortment": 5 * 60,
+    "entity/retaildemand": 5 * 60,
+    "entity/retailsalesreturn": 5 * 60,
+    "report/profit": 5 * 60,
+    "Rests/List": 5 * 60,
+    "spreadsheets": 2 * 60,
+}
+
+
+def get_ttl(url: str) -> int:
+    """Функция возвращает время жизни ответа на запрос url в кэше. 0 - ответ не кэшируется."""
+    for endpoint, ttl in ENDPOINT_TTL.items():
+        if endpoint in url:
+            return ttl
+    return 0
+
+
+class ResponseCache:
+    """Класс описывает кэш ответов внешних сервисов."""
+
+    def __init__(self, enabled: bool = False, bypass: bool = False) -> None:
+        """Конструктор.
+
+        :param enabled: True - ответы сохраняются в кэш.
+        :param bypass: True - ответы из кэша не используются, но свежие ответы в кэш сохраняются.
+        """
+        self.enabled = enabled
+        self.bypass = bypass
+
+    def configure(self, enabled: Optional[bool] = None, bypass: Optional[bool] = None) -> None:
+        """Метод меняет настройки кэша. Параметры, равные None, не меняются."""
+        if enabled is not None:
+            self.enabled = enabled
+        if bypass is not None:
+            self.bypass = bypass
+
+    @staticmethod
+    def get_key(url: str, params: Optional[Dict[str, Any]] = None) -> str:
+        """Метод возвращает ключ кэша для запроса url с параметрами params."""
+        raw_key = json.dumps([url, params or {}], sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(raw_key.encode()).hexdigest()
+
+    def get_or_fetch(
+        self,
+        url: str,
+        params: Optional[Dict[str, Any]],
+        fetch: Callable[[], Optional[Any]],
+        ttl: Optional[int] = None,
+    ) -> Optional[Any]:
+        """Метод возвращает ответ на запрос из кэша, а если его там нет - результат fetch().
+
+        Результат fetch(), отличный от None, сохраняется в кэш на ttl секунд (по умолчанию - get_ttl(url)).
+        """
+        ttl = get_ttl(url) if ttl is None else ttl
+        if not self.enabled or ttl <= 0:
+            return fetch()
+
+        cache = caches[HTTP_CACHE]
+        key = self.get_key(url, params)
+        if not self.bypass:
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+
+        result = fetch()
+        if result is not None:
+            cache.set(key, result, timeout=ttl)
+        return result
+
+
+# Кэш, общий для всех клиентов процесса
+RESPONSE_CACHE = ResponseCache(enabled=os.getenv("HTTP_CACHE_ENABLED", "").lower() in ("1", "true", "yes"))
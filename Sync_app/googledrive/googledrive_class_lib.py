@@ -1,42 +1,160 @@
 """Модуль для работы с Google Sheets."""
+import hashlib
+import json
 import os
-from dataclasses import dataclass
-from typing import Any, List, NamedTuple
+from collections import defaultdict
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 
 import googleapiclient.discovery
+import googleapiclient.errors
 import httplib2
-from django.db.models import QuerySet
 from oauth2client.service_account import ServiceAccountCredentials
 
+import Sync_app.googledrive.googledrive_diff as gs_diff
 import Sync_app.googledrive.googlesheets_constants as gs_const
+import Sync_app.models.googlesheets_models as gs_model
 import Sync_app.models.konturmarket_models as km_model
 import Sync_app.models.moysklad_models as ms_model
 from Sync_app.common.functions import string_title
+from Sync_app.common.http_cache import RESPONSE_CACHE
+from Sync_app.googledrive.googledrive_suggestions import SUGGESTIONS_COUNT, MatchCandidate, Suggestion, SuggestionIndex
 
 
 class CompilanceRow(NamedTuple):
-    """Вспомогательный класс для хранения записи из таблицы соответствия, описанной в googlesheets."""
+    """Вспомогательный класс для хранения записи из таблицы соответствия, описанной в googlesheets.
+
+    Название пивоварни и продукта выделяются из коммерческого названия один раз, при создании записи (from_sheet).
+    """
 
     commercial_name: str
     egais_code: str
-
-    @property
-    def brewery(self) -> str:
-        """Название пивоварни."""
-        return self.commercial_name.split(" - ")[0] if len(self.commercial_name.split(" - ")) > 1 else ""
-
-    @property
-    def name(self) -> str:
-        """Название продукта."""
+    # Название пивоварни
+    brewery: str = ""
+    # Название продукта
+    name: str = ""
+
+    @classmethod
+    def from_sheet(cls, commercial_name: str, egais_code: str) -> "CompilanceRow":
+        """Метод создает запись из ячеек таблицы соответствия."""
         separator = " - "
-        count = self.commercial_name.count(separator)
-        name: str
-        if count == 0:
-            name = self.commercial_name
+        parts = commercial_name.split(separator)
+        brewery = parts[0] if len(parts) > 1 else ""
+        name = commercial_name if len(parts) == 1 else "".join(parts[1:])
+        return cls(commercial_name=commercial_name, egais_code=egais_code, brewery=brewery, name=string_title(list_=name))
+
+    def fingerprint(self) -> str:
+        """Метод возвращает отпечаток записи - хэш коммерческого названия и кода ЕГАИС."""
+        raw = json.dumps([self.commercial_name, self.egais_code], ensure_ascii=False)
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+
+class CompilanceMatcher:
+    """Класс сопоставляет записи таблицы соответствия с товарами МойСклад и ЕГАИС в памяти.
+
+    Товары загружаются из БД один раз и раскладываются в индексы по названию (без учета регистра)
+    и по паре название + пивоварня, поэтому на строку таблицы соответствия запросов к БД нет.
+    """
+
+    def __init__(self) -> None:
+        """Конструктор. Загружает фасованные неархивные товары МойСклад и объемы товаров ЕГАИС."""
+        self._goods: List[MatchCandidate] = [
+            MatchCandidate(*good)
+            for good in ms_model.MoySkladDBGood.objects.filter(is_draft=False, is_archived=False).values_list(
+                "uuid", "full_name", "brewery", "name", "capacity",
+            )
+        ]
+        # {название в нижнем регистре: [товары]}
+        self._by_name: Dict[str, List[MatchCandidate]] = defaultdict(list)
+        # {(название в нижнем регистре, пивоварня): [товары]}
+        self._by_name_brewery: Dict[Tuple[str, str], List[MatchCandidate]] = defaultdict(list)
+        for good in self._goods:
+            self._by_name[good.name.lower()].append(good)
+            self._by_name_brewery[(good.name.lower(), good.brewery)].append(good)
+        # {код ЕГАИС: объем}
+        self._km_capacity: Dict[str, Decimal] = dict(km_model.KonturMarketDBGood.objects.values_list("egais_code", "capacity"))
+        # Индекс для подбора похожих товаров, строится при первом обращении
+        self._suggestion_index: Optional[SuggestionIndex] = None
+
+    def match(self, row: CompilanceRow) -> List[str]:
+        """Метод возвращает uuid товаров МойСклад, соответствующих записи row. Пустой список - соответствие не найдено.
+
+        В таблице из googlesheets будут встречаться записи 2ух видов:
+        1. 4Пивовара - Вброс, Бакунин - How Much Is Too Much [Raspberry],
+        1.1 Степь и Ветер - Smoothie Mead: Raspberry, Black Currant, Mint
+        2. Barbe Ruby
+        2.1 Barista Chocolate Quad
+        Для записей вида 1 товар ищется по названию и пивоварне, для записей вида 2 - только по названию.
+        Если нашлось несколько товаров, выбираются товары с объемом товара ЕГАИС.
+        """
+        # В googlesheets указывается только фасованная продукция и не указывается разливное пиво
+        km_capacity = self._km_capacity.get(row.egais_code)
+        if km_capacity is None:
+            return []
+
+        if row.brewery:
+            goods = self._by_name_brewery.get((row.name.lower(), row.brewery), [])
         else:
-            name = "".join(self.commercial_name.split(separator)[1:])
+            goods = self._by_name.get(row.name.lower(), [])
+
+        # Если в выборке из таблицы товаров для МойСклад нашлось товаров больше одного, фильтруем по объему
+        if len(goods) >= 2:
+            goods = [good for good in goods if good.capacity == km_capacity]
+        return [good.uuid for good in goods]
 
-        return string_title(list_=name)
+    def set_matches(self, googlesheets_copm_table: List[List[str]]) -> List[List[str]]:
+        """Метод сопоставляет всю таблицу соответствия и записывает связи товаров в БД одним запросом.
+
+        :return: Строки таблицы, для которых не удалось установить соответствие.
+        """
+        not_proceeded_good: List[List[str]] = []
+        through = ms_model.MoySkladDBGood.egais_code.through
+        links: Dict[Tuple[str, str], Any] = {}
+
+        for gs_row in googlesheets_copm_table:
+            # Если в таблице соответствия из googlesheets, не установлено соответствие - второй элемент gs_good[1]
+            # будет пустой, то пропускаем строку.
+            if len(gs_row) < 2:
+                not_proceeded_good.append(gs_row)
+                continue
+
+            gs_good = CompilanceRow.from_sheet(commercial_name=gs_row[0].strip(), egais_code=gs_row[1].strip())
+            uuids = self.match(gs_good)
+            if not uuids:
+                not_proceeded_good.append(gs_row)
+            for uuid in uuids:
+                links[(uuid, gs_good.egais_code)] = through(moyskladdbgood_id=uuid, konturmarketdbgood_id=gs_good.egais_code)
+
+        # Уже существующие связи пропускаются, как при egais_code.add()
+        through.objects.bulk_create(links.values(), batch_size=ms_model.BULK_BATCH_SIZE, ignore_conflicts=True)
+        return not_proceeded_good
+
+    def suggest(self, googlesheets_copm_table: List[List[str]], count: int = SUGGESTIONS_COUNT) -> List[Tuple[List[str], List[Suggestion]]]:
+        """Метод подбирает для строк таблицы соответствия (как правило, несопоставленных) похожие товары МойСклад.
+
+        Кандидаты ищутся по триграммам пивоварни и названия (SuggestionIndex), совпадение пивоварни и объема
+        товара ЕГАИС повышает оценку. Для строк без кода ЕГАИС объем не учитывается.
+        :return: Список пар (строка таблицы, не больше count кандидатов по убыванию оценки).
+        """
+        if self._suggestion_index is None:
+            self._suggestion_index = SuggestionIndex(self._goods)
+
+        result: List[Tuple[List[str], List[Suggestion]]] = []
+        for gs_row in googlesheets_copm_table:
+            if not gs_row or not gs_row[0].strip():
+                continue
+            gs_good = CompilanceRow.from_sheet(
+                commercial_name=gs_row[0].strip(), egais_code=gs_row[1].strip() if len(gs_row) > 1 else "",
+            )
+            suggestions = self._suggestion_index.suggest(
+                text=f"{gs_good.brewery} {gs_good.name}",
+                brewery=gs_good.brewery,
+                capacity=self._km_capacity.get(gs_good.egais_code),
+                count=count,
+            )
+            result.append((gs_row, suggestions))
+        return result
 
 
 @dataclass
@@ -45,15 +163,21 @@ class GoogleSheets:
 
     # Cервисный объект для работы с Google API.
     service: Any = None
+    # Cервисный объект для работы с Google Drive API.
+    drive_service: Any = None
     # Переменная устанавливается в True, в случае успешного логина в сервисе.
     connection_ok: bool = False
+    # Строки таблицы соответствия, для которых не удалось установить соответствие при последней синхронизации.
+    not_matched: List[List[str]] = field(default_factory=list)
+    # Переменная устанавливается в True, если таблица соответствия не изменилась с последней синхронизации.
+    compl_table_unchanged: bool = False
 
     @staticmethod
     def db_set_matches(googlesheets_copm_table: list[list[str]]) -> list[list[str]]:
         """Функция устанавливает соответствия между товарами в таблице БД moyskladdbgood и таблицей БД konturmarketdbgood.
 
         Связи устанавливаются на основе таблицы "Соответствия" в googlesheets, передаваемой
-        параметром googlesheets_copm_table.
+        параметром googlesheets_copm_table. Сопоставление выполняется в памяти (CompilanceMatcher).
         :param googlesheets_copm_table: Список вида:
         ['Коммерческое название', 'Код алкогольной продукции'].
         :return: Возвращает список наименований для которых не удалось сделать запись в БД.
@@ -61,55 +185,84 @@ class GoogleSheets:
         if not googlesheets_copm_table:
             return []
 
-        not_proceeded_good = []
-        ms_db_good: QuerySet
-        km_db_good: km_model.KonturMarketDBGood
+        return CompilanceMatcher().set_matches(googlesheets_copm_table)
 
+    @staticmethod
+    def db_apply_changes(googlesheets_copm_table: List[List[str]], full: bool = False) -> List[List[str]]:
+        """Функция применяет к связям товаров только изменения таблицы соответствия с последней синхронизации.
+
+        Строки таблицы сравниваются со снимком (GoogleSheetsDBCompilanceRow) по отпечаткам. Сопоставляются
+        добавленные и измененные строки, а также строки, для которых соответствие ранее не было найдено.
+        Связи, установленные только удаленными строками, удаляются.
+        :param googlesheets_copm_table: Список вида:
+        ['Коммерческое название', 'Код алкогольной продукции'].
+        :param full: True - сопоставить заново все строки таблицы.
+        :return: Возвращает список наименований для которых не удалось сделать запись в БД.
+        """
+        rows: Dict[str, CompilanceRow] = {}
+        # Отпечатки строк в порядке таблицы. None - в строке не указан код ЕГАИС
+        row_hashes: List[Optional[str]] = []
         for gs_row in googlesheets_copm_table:
-            # Если в таблице соответствия из googlesheets, не установлено соответствие - второй элемент gs_good[1]
-            # будет пустой, то пропускаем строку.
-            if len(gs_row) > 1:
-                gs_good = CompilanceRow(commercial_name=gs_row[0].strip(), egais_code=gs_row[1].strip())
-
-                # В googlesheets указывается только фасованная продукция и не указывается разливное пиво
-                km_db_good = km_model.KonturMarketDBGood.objects.get(egais_code=gs_good[1])
-
-                # В таблице из googlesheets будут встречаться записи 2ух видов. В нулевом элементе good[0] может быть:
-                # 1. 4Пивовара - Вброс, Бакунин - How Much Is Too Much [Raspberry],
-                # 1.1 Степь и Ветер - Smoothie Mead: Raspberry, Black Currant, Mint
-                # 2. Barbe Ruby
-                # 2.1 Barista Chocolate Quad
-
-                # Вариант 2:
-                ms_db_good = ms_model.MoySkladDBGood.objects.filter(name__iexact=gs_good.name).filter(is_draft=False)
-                if gs_good.brewery:
-                    # Вариант 1:
-                    ms_db_good = ms_db_good.filter(brewery=gs_good.brewery)
-
-                # Если не нашли товар в таблице МойСклад
-                if len(ms_db_good) == 0:
-                    not_proceeded_good.append(gs_row)
-
-                # Если в выборке из таблицы товаров для МойСклад нашлось товаров больше одного
-                elif len(ms_db_good) >= 2:
-                    # Фильтруем по объему
-                    ms_db_good = ms_db_good.filter(capacity__exact=km_db_good.capacity)
-                    # Если опять нашлось более одного товара, исключаем запись из обработки
-                    if len(ms_db_good):
-                        # Если нашлись совпадения
-                        for element in ms_db_good:
-                            element.egais_code.add(km_db_good)
-                    else:
-                        # Исключаем запись из обработки
-                        not_proceeded_good.append(gs_row)
-                # Если товар найден
-                else:
-                    # Добавляем связь между товарами МойСклад и товарами из ЕГАИС
-                    ms_db_good.first().egais_code.add(km_db_good)
-            else:
-                not_proceeded_good.append(gs_row)
+            if len(gs_row) < 2:
+                row_hashes.append(None)
+                continue
+            gs_good = CompilanceRow.from_sheet(commercial_name=gs_row[0].strip(), egais_code=gs_row[1].strip())
+            row_hash = gs_good.fingerprint()
+            rows[row_hash] = gs_good
+            row_hashes.append(row_hash)
+
+        saved = gs_model.GoogleSheetsDBCompilanceRow.get_saved_state()
+        changed = [row_hash for row_hash in rows if full or not saved.get(row_hash)]
+        removed = [row_hash for row_hash in saved if row_hash not in rows]
+
+        matches: Dict[str, Tuple[CompilanceRow, List[str]]] = {}
+        if changed:
+            matcher = CompilanceMatcher()
+            matches = {row_hash: (rows[row_hash], matcher.match(rows[row_hash])) for row_hash in changed}
+        gs_model.GoogleSheetsDBCompilanceRow.save_objects_to_db(matches=matches, removed=removed)
+
+        # Строки, не изменившиеся с последней синхронизации, уже сопоставлены
+        return [
+            gs_row
+            for gs_row, row_hash in zip(googlesheets_copm_table, row_hashes)
+            if row_hash is None or (row_hash in matches and not matches[row_hash][1])
+        ]
 
-        return not_proceeded_good
+    @staticmethod
+    def db_retry_not_matched() -> List[List[str]]:
+        """Функция повторно сопоставляет строки снимка таблицы соответствия, для которых соответствие не было найдено.
+
+        Используется, когда таблица не менялась: товары МойСклад и ЕГАИС, появившиеся в БД после последней
+        синхронизации, могут подойти строкам, которые раньше сопоставить не удалось. Строки без кода ЕГАИС
+        в снимок не попадают и не проверяются.
+        :return: Возвращает список наименований для которых по-прежнему не удалось сделать запись в БД.
+        """
+        rows: Dict[str, CompilanceRow] = {
+            row_hash: CompilanceRow.from_sheet(commercial_name=commercial_name, egais_code=egais_code)
+            for row_hash, commercial_name, egais_code in gs_model.GoogleSheetsDBCompilanceRow.get_not_matched()
+        }
+        if not rows:
+            return []
+
+        matcher = CompilanceMatcher()
+        matches = {row_hash: (row, matcher.match(row)) for row_hash, row in rows.items()}
+        # Строки, которые по-прежнему не сопоставлены, не перезаписываются
+        matches = {row_hash: match for row_hash, match in matches.items() if match[1]}
+        gs_model.GoogleSheetsDBCompilanceRow.save_objects_to_db(matches=matches, removed=[])
+        return [[row.commercial_name, row.egais_code] for row_hash, row in rows.items() if row_hash not in matches]
+
+    @staticmethod
+    def get_match_suggestions(
+        googlesheets_copm_table: List[List[str]], count: int = SUGGESTIONS_COUNT,
+    ) -> List[Tuple[List[str], List[Suggestion]]]:
+        """Функция подбирает товары МойСклад, похожие на строки таблицы соответствия googlesheets_copm_table.
+
+        :return: Список пар (строка таблицы, не больше count кандидатов по убыванию оценки).
+        """
+        if not googlesheets_copm_table:
+            return []
+
+        return CompilanceMatcher().suggest(googlesheets_copm_table, count=count)
 
     def get_access(self) -> bool:
         """Метод получения доступа сервисного объекта Google API.
@@ -128,55 +281,139 @@ class GoogleSheets:
         )
         http_auth = credentials.authorize(httplib2.Http())
         self.service = googleapiclient.discovery.build("sheets", "v4", http=http_auth)
+        self.drive_service = googleapiclient.discovery.build("drive", "v3", http=http_auth)
         self.connection_ok = True
 
         return True
 
+    def get_revision(self, spreadsheets_id: str) -> Optional[str]:
+        """Метод возвращает версию файла таблицы в Google Drive.
+
+        Версия составляется из номера версии файла и времени его изменения и меняется при любой правке таблицы.
+        :return: Версия таблицы, None в случае ошибки.
+        """
+        try:
+            metadata = self.drive_service.files().get(fileId=spreadsheets_id, fields="version,modifiedTime").execute()
+        except googleapiclient.errors.HttpError:
+            return None
+        return f"{metadata.get('version', '')}:{metadata.get('modifiedTime', '')}"
+
+    @staticmethod
+    def _iter_rows(values: Iterable[List[str]]) -> Iterator[List[str]]:
+        """Метод возвращает непустые строки диапазона в порядке листа.
+
+        googlesheets отдает диапазон, отсекая в запрашиваемом диапазоне пустые ячейки снизу,
+        но пустые строки могут оказаться в середине текста, они пропускаются.
+        """
+        for row in values:
+            if any(str(cell).strip() for cell in row):
+                yield row
+
+    def get_data_batch(
+        self, spreadsheets_id: str, ranges: Dict[str, str], revision: str = "",
+    ) -> Dict[str, Iterator[List[str]]]:
+        """Метод получения данных нескольких листов таблицы GoogleSheets одним запросом (values().batchGet).
+
+        :param spreadsheets_id: id таблицы в Google Sheets
+        :param ranges: Словарь {текстовое имя листа: запрашиваемый диапазон A1:H100}
+        :param revision: Версия таблицы (get_revision()). Входит в ключ кэша ответов, чтобы после правки таблицы
+            не использовался ответ, сохраненный до нее.
+        :return: Словарь {текстовое имя листа: генератор непустых строк листа}. Пустой словарь в случае не удачи.
+        """
+        if not spreadsheets_id or not ranges:
+            return {}
+
+        a1_ranges = [f"{list_name}!{list_range}" for list_name, list_range in ranges.items()]
+        # Если включен кэш ответов, ответ берется из кэша
+        response = RESPONSE_CACHE.get_or_fetch(
+            f"spreadsheets/{spreadsheets_id}/values:batchGet",
+            {"ranges": a1_ranges, "revision": revision},
+            lambda: self.service.spreadsheets()
+            .values()
+            .batchGet(
+                spreadsheetId=spreadsheets_id,
+                ranges=a1_ranges,
+                majorDimension="ROWS",
+            )
+            .execute(),
+        )
+        if not response:
+            return {}
+
+        # Диапазоны в ответе идут в порядке запроса
+        return {
+            list_name: self._iter_rows(value_range.get("values", []))
+            for list_name, value_range in zip(ranges, response.get("valueRanges", []))
+        }
+
     def get_data(self, spreadsheets_id: str, list_name: str, list_range: str) -> List[List[str]]:
         """Метод получения данных из таблицы GoogleSheets.
 
         :param spreadsheets_id: id таблицы в Google Sheets
         :param list_name: текстовое имя листа
         :param list_range: запрашиваемый диапазон A1:H100
-        :return: Возвращает список списков [[], []..]. Каждый элемент списка - список из 2 элементов.
-            1 - коммерческое # pylint: disable=line-too-long название,
-            2 - наименование ЕГАИС. Пустой список в случае не удачи.
+        :return: Возвращает список списков [[], []..]. Каждый элемент - список ячеек строки.
+            Пустые строки пропускаются. Пустой список в случае не удачи.
         """
-        if not spreadsheets_id or not list_name or not list_range:
-            return []
+        return list(self.get_data_batch(spreadsheets_id=spreadsheets_id, ranges={list_name: list_range}).get(list_name, ()))
 
-        values = (
-            self.service.spreadsheets()
-            .values()
-            .get(
-                spreadsheetId=spreadsheets_id,
-                range=f"{list_name}!{list_range}",
-                majorDimension="ROWS",
+    def get_current_values(self, spreadsheets_id: str, list_name: str, list_range: str) -> Optional[List[List[Any]]]:
+        """Метод возвращает текущие значения диапазона таблицы GoogleSheets, включая пустые строки, без кэша ответов.
+
+        Для ячеек с формулами возвращаются формулы, как они были записаны (valueRenderOption=FORMULA).
+        :return: Значения диапазона по строкам, None в случае ошибки.
+        """
+        try:
+            response = (
+                self.service.spreadsheets()
+                .values()
+                .get(
+                    spreadsheetId=spreadsheets_id,
+                    range=f"{list_name}!{list_range}",
+                    majorDimension="ROWS",
+                    valueRenderOption="FORMULA",
+                )
+                .execute()
             )
-            .execute()
-        )
-        if not values["values"]:
-            return []
+        except googleapiclient.errors.HttpError:
+            return None
+        return response.get("values", [])
 
-        # googlesheets отдает диапазон, отсекая в запрашиваемом диапазоне пустые ячейки снизу,
-        # но пустые строки # pylint: disable=line-too-long
-        # могут оказаться в середине текста
-        # отсортируем, чтобы пустые строки оказались вверху, а потом удалим их
-        values = sorted(values["values"])
-        i = 0
-        while not values[i]:
-            i += 1
-        return values[i:]
-
-    def send_data(self, data: List[Any], spreadsheets_id: str, list_name: str, list_range: str) -> bool:
+    def send_data(self, data: List[Any], spreadsheets_id: str, list_name: str, list_range: str, diff: bool = True) -> bool:
         """Метод записи данных в таблицу GoogleSheets.
 
+        Записываются только измененные ячейки (блоками, одним запросом batchUpdate), а если изменений больше,
+        чем ячеек в data, или текущие значения прочитать не удалось - диапазон очищается и записывается целиком.
         :param data: Данные для записи.
         :param spreadsheets_id: id таблицы в Google Sheets
         :param list_name: Текстовое имя листа.
         :param list_range: Запрашиваемый диапазон A1:H100.
+        :param diff: False - всегда записывать диапазон целиком.
         :return: Возвращает True в случае удачной записи, False в случае ошибки.
         """
+        current = self.get_current_values(spreadsheets_id, list_name, list_range) if diff else None
+        if current is not None:
+            blocks = gs_diff.get_changed_blocks(current=current, data=data)
+            if gs_diff.count_cells(blocks) <= sum(len(row) for row in data):
+                if not blocks:
+                    return True
+                start_row, start_column = gs_diff.parse_start_cell(list_range)
+                self.service.spreadsheets().values().batchUpdate(
+                    spreadsheetId=spreadsheets_id,
+                    body={
+                        "valueInputOption": "USER_ENTERED",
+                        "data": [
+                            {
+                                "range": f"{list_name}!{gs_diff.get_block_range(block, start_row, start_column)}",
+                                "majorDimension": "ROWS",
+                                "values": block.values,
+                            }
+                            for block in blocks
+                        ],
+                    },
+                ).execute()
+                return True
+
         # В начале очищаем диапазон.
         # https://developers.google.com/sheets/api/reference/rest/v4/spreadsheets.values/clear?hl=ru
         self.service.spreadsheets().values().clear(
@@ -200,18 +437,38 @@ class GoogleSheets:
         ).execute()
         return True
 
-    def sync_compl_table(self) -> bool:
-        """Метод заполняет таблицу соответствия."""
+    def sync_compl_table(self, full: bool = False) -> bool:
+        """Метод заполняет таблицу соответствия.
+
+        Если версия таблицы в Google Drive не изменилась с последней синхронизации, таблица не читается
+        (compl_table_unchanged), а повторно сопоставляются только строки, для которых соответствие не было найдено
+        (db_retry_not_matched()). Иначе применяются только изменения строк (db_apply_changes()).
+        :param full: True - прочитать таблицу и сопоставить заново все строки, независимо от версии.
+        """
         if not self.get_access():
             return False
 
-        compl_table: List[List[str]] = self.get_data(
+        revision = self.get_revision(gs_const.SPREEDSHEET_ID_EGAIS)
+        saved_revision = gs_model.GoogleSheetsDBSyncState.get_revision(gs_const.SPREEDSHEET_ID_EGAIS)
+        self.compl_table_unchanged = not full and revision is not None and revision == saved_revision
+        if self.compl_table_unchanged:
+            self.not_matched = self.db_retry_not_matched()
+            return True
+
+        sheets = self.get_data_batch(
             spreadsheets_id=gs_const.SPREEDSHEET_ID_EGAIS,
-            list_name=gs_const.LIST_NAME_EGAIS,
-            list_range=f"{gs_const.FIRST_CELL_EGAIS}:{gs_const.LAST_COLUMN_EGAIS}",
+            ranges={gs_const.LIST_NAME_EGAIS: f"{gs_const.FIRST_CELL_EGAIS}:{gs_const.LAST_COLUMN_EGAIS}"},
+            revision=revision or "",
         )
+        if not sheets:
+            return False
+
         # Оставляем только коммерческое название и код алкогольной продукции
-        compl_table = [i[: len(i) : 2] for i in compl_table]  # noqa
-        self.db_set_matches(googlesheets_copm_table=compl_table)
+        compl_table = [i[: len(i) : 2] for i in sheets[gs_const.LIST_NAME_EGAIS]]  # noqa
+        self.not_matched = self.db_apply_changes(googlesheets_copm_table=compl_table, full=full)
+
+        # Версия сохраняется только после применения изменений, иначе при ошибке таблица была бы пропущена
+        if revision is not None:
+            gs_model.GoogleSheetsDBSyncState.set_revision(gs_const.SPREEDSHEET_ID_EGAIS, revision)
 
         return True
@@ -0,0 +1,125 @@
+"""Модуль содержит вычисление изменений диапазона таблицы Google Sheets, чтобы записывать только измененные ячейки.
+
+Текущие значения диапазона сравниваются с записываемыми построчно. В каждой строке изменения объединяются в один
+отрезок от первой до последней измененной ячейки, соседние строки с одинаковыми отрезками - в один блок.
+Ячейки, которых нет в записываемых данных, но которые заполнены в таблице, очищаются (записывается "").
+"""
+import re
+from decimal import Decimal, InvalidOperation
+from typing import Any, List, NamedTuple, Sequence, Tuple
+
+# Ячейка в нотации A1: столбец и необязательный номер строки
+_CELL_RE = re.compile(r"^([A-Za-z]+)(\d*)$")
+# Строка, которую Google Sheets запишет как число. Строки с ведущими нулями (коды ЕГАИС и т.п.) числами не считаются
+_NUMBER_RE = re.compile(r"^-?(0|[1-9]\d*)(\.\d+)?$")
+
+
+class CellBlock(NamedTuple):
+    """Класс описывает прямоугольный блок измененных ячеек. Смещения отсчитываются от начала диапазона."""
+
+    # Смещение первой строки блока
+    row: int
+    # Смещение первого столбца блока
+    column: int
+    # Значения ячеек блока по строкам
+    values: List[List[Any]]
+
+
+def column_index(letters: str) -> int:
+    """Функция возвращает номер столбца по его буквенному обозначению, начиная с 0: A - 0, Z - 25, AA - 26."""
+    index = 0
+    for letter in letters.upper():
+        index = index * 26 + ord(letter) - ord("A") + 1
+    return index - 1
+
+
+def column_letters(index: int) -> str:
+    """Функция возвращает буквенное обозначение столбца по его номеру, начиная с 0."""
+    letters = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
+
+
+def parse_start_cell(list_range: str) -> Tuple[int, int]:
+    """Функция возвращает номер строки (начиная с 1) и номер столбца (начиная с 0) первой ячейки диапазона A1:H100."""
+    match = _CELL_RE.match(list_range.split(":")[0])
+    if not match:
+        raise ValueError(f"Некорректный диапазон {list_range}")
+    return int(match.group(2) or 1), column_index(match.group(1))
+
+
+def get_block_range(block: CellBlock, start_row: int, start_column: int) -> str:
+    """Функция возвращает диапазон блока block в нотации A1 для диапазона, начинающегося с ячейки (start_row, start_column)."""
+    first_row = start_row + block.row
+    first_column = start_column + block.column
+    last_column = first_column + len(block.values[0]) - 1
+    return f"{column_letters(first_column)}{first_row}:{column_letters(last_column)}{first_row + len(block.values) - 1}"
+
+
+def normalize_value(value: Any) -> str:
+    """Функция приводит значение ячейки к строке для сравнения.
+
+    Числа и числовые строки приводятся к каноническому виду без экспоненты и незначащих нулей,
+    поэтому Decimal("250.00"), 250.0, 250 и "250" равны.
+    """
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return str(value).upper()
+    if isinstance(value, (int, float, Decimal)) or (isinstance(value, str) and _NUMBER_RE.match(value)):
+        try:
+            number = Decimal(str(value))
+        except InvalidOperation:
+            return str(value)
+        if number.is_finite():
+            return format(number.normalize(), "f")
+    return str(value)
+
+
+def _cells_equal(old: Any, new: Any) -> bool:
+    """Функция сравнивает значения ячеек. Значения одного типа сравниваются без приведения к строке."""
+    if type(old) is type(new) and old == new:
+        return True
+    return normalize_value(old) == normalize_value(new)
+
+
+def get_changed_blocks(current: Sequence[Sequence[Any]], data: Sequence[Sequence[Any]]) -> List[CellBlock]:
+    """Функция возвращает блоки ячеек, которые нужно записать, чтобы диапазон со значениями current стал равен data.
+
+    :param current: текущие значения диапазона по строкам (строки могут быть разной длины).
+    :param data: записываемые значения по строкам.
+    """
+    blocks: List[CellBlock] = []
+    for row in range(max(len(current), len(data))):
+        old = current[row] if row < len(current) else ()
+        new = data[row] if row < len(data) else ()
+        changed = [
+            column
+            for column in range(max(len(old), len(new)))
+            if not _cells_equal(old[column] if column < len(old) else None, new[column] if column < len(new) else None)
+        ]
+        if not changed:
+            continue
+
+        first, last = changed[0], changed[-1]
+        values = [new[column] if column < len(new) else "" for column in range(first, last + 1)]
+        previous = blocks[-1] if blocks else None
+        # Строка продолжает предыдущий блок, если идет сразу за ним и изменена в тех же столбцах
+        if (
+            previous is not None
+            and previous.row + len(previous.values) == row
+            and previous.column == first
+            and len(previous.values[0]) == len(values)
+        ):
+            previous.values.append(values)
+        else:
+            blocks.append(CellBlock(row=row, column=first, values=[values]))
+    return blocks
+
+
+def count_cells(blocks: Sequence[CellBlock]) -> int:
+    """Функция возвращает количество ячеек во всех блоках."""
+    return sum(len(block.values) * len(block.values[0]) for block in blocks)
@@ -0,0 +1,118 @@
+"""Модуль содержит подбор товаров МойСклад, похожих на несопоставленные строки таблицы соответствия.
+
+Названия товаров раскладываются на триграммы (как в pg_trgm: каждое слово в нижнем регистре дополняется двумя
+пробелами слева и одним справа). По триграммам строится обратный индекс: триграмма - список товаров, в названии
+которых она встречается. Для строки таблицы перебираются только товары, у которых есть хотя бы одна общая
+с ней редкая триграмма, попарного сравнения со всем ассортиментом нет. Частые триграммы (слова IPA, Stout и т.п.)
+учитываются в оценке, но кандидатов не порождают: товар, похожий на строку только частыми триграммами,
+не предлагается. Если в строке нет редких триграмм, кандидаты ищутся по всем ее триграммам.
+
+Оценка кандидата - коэффициент Дайса по триграммам пивоварни и названия (от 0 до 1), к которому прибавляется
+BREWERY_WEIGHT при совпадении пивоварни и CAPACITY_WEIGHT при совпадении объема.
+"""
+import re
+from collections import defaultdict
+from decimal import Decimal
+from heapq import nsmallest
+from typing import DefaultDict, FrozenSet, Iterable, List, NamedTuple, Optional, Set
+
+# Количество предлагаемых кандидатов для строки таблицы
+SUGGESTIONS_COUNT = 3
+# Минимальное сходство названий, при котором товар предлагается
+MIN_SIMILARITY = 0.3
+# Надбавка к оценке при совпадении пивоварни
+BREWERY_WEIGHT = 0.2
+# Надбавка к оценке при совпадении объема
+CAPACITY_WEIGHT = 0.1
+# Триграмма считается частой, если встречается у большей доли товаров, чем FREQUENT_TRIGRAM_SHARE,
+# и у большего количества товаров, чем FREQUENT_TRIGRAM_MIN
+FREQUENT_TRIGRAM_SHARE = 0.02
+FREQUENT_TRIGRAM_MIN = 50
+
+_WORD_RE = re.compile(r"\w+")
+
+
+class MatchCandidate(NamedTuple):
+    """Класс описывает товар МойСклад, с которым сопоставляются строки таблицы соответствия."""
+
+    uuid: str
+    full_name: str
+    brewery: str
+    name: str
+    capacity: Optional[Decimal]
+
+
+class Suggestion(NamedTuple):
+    """Класс описывает предлагаемый товар МойСклад и его оценку."""
+
+    candidate: MatchCandidate
+    score: float
+
+
+def get_trigrams(text: str) -> FrozenSet[str]:
+    """Функция возвращает множество триграмм слов строки text."""
+    trigrams: Set[str] = set()
+    for word in _WORD_RE.findall(text.lower()):
+        padded = f"  {word} "
+        trigrams.update(padded[i : i + 3] for i in range(len(padded) - 2))  # noqa
+    return frozenset(trigrams)
+
+
+def get_similarity(first: FrozenSet[str], second: FrozenSet[str]) -> float:
+    """Функция возвращает коэффициент Дайса двух множеств триграмм."""
+    if not first or not second:
+        return 0.0
+    return 2 * len(first & second) / (len(first) + len(second))
+
+
+class SuggestionIndex:
+    """Класс описывает обратный индекс триграмм названий товаров МойСклад."""
+
+    def __init__(self, candidates: Iterable[MatchCandidate]) -> None:
+        """Конструктор. Раскладывает названия товаров candidates на триграммы и строит индекс."""
+        self.candidates: List[MatchCandidate] = list(candidates)
+        self._trigrams: List[FrozenSet[str]] = [
+            get_trigrams(f"{candidate.brewery} {candidate.name}") for candidate in self.candidates
+        ]
+        # {триграмма: [индексы товаров в self.candidates]}
+        self._postings: DefaultDict[str, List[int]] = defaultdict(list)
+        for index, trigrams in enumerate(self._trigrams):
+            for trigram in trigrams:
+                self._postings[trigram].append(index)
+        # Максимальное количество товаров у редкой триграммы
+        self._frequent_limit = max(FREQUENT_TRIGRAM_MIN, int(FREQUENT_TRIGRAM_SHARE * len(self.candidates)))
+
+    def suggest(
+        self, text: str, brewery: str = "", capacity: Optional[Decimal] = None, count: int = SUGGESTIONS_COUNT,
+    ) -> List[Suggestion]:
+        """Метод возвращает не больше count товаров, похожих на text, по убыванию оценки.
+
+        :param text: пивоварня и название из строки таблицы соответствия.
+        :param brewery: пивоварня из строки таблицы. Пустая строка - пивоварня не указана.
+        :param capacity: объем товара ЕГАИС. None - объем неизвестен.
+        """
+        query = get_trigrams(text)
+        if not query or count <= 0:
+            return []
+
+        # Товары, у которых есть общие с text редкие триграммы
+        postings = [self._postings[trigram] for trigram in query if trigram in self._postings]
+        rare = [posting for posting in postings if len(posting) <= self._frequent_limit]
+        shared = set().union(*(rare or postings))
+
+        brewery = brewery.lower()
+        suggestions: List[Suggestion] = []
+        for index in shared:
+            similarity = get_similarity(query, self._trigrams[index])
+            if similarity < MIN_SIMILARITY:
+                continue
+            candidate = self.candidates[index]
+            score = similarity
+            if brewery and candidate.brewery.lower() == brewery:
+                score += BREWERY_WEIGHT
+            if capacity is not None and candidate.capacity == capacity:
+                score += CAPACITY_WEIGHT
+            suggestions.append(Suggestion(candidate=candidate, score=round(score, 3)))
+
+        # При равной оценке порядок определяется uuid, чтобы результат не зависел от порядка товаров в БД
+        return nsmallest(count, suggestions, key=lambda suggestion: (-suggestion.score, suggestion.candidate.uuid))
@@ -0,0 +1,52 @@
+"""Модуль содержит распределение проданного количества товаров по кодам ЕГАИС для журнала продаж.
+
+Товар МойСклад может быть связан с несколькими кодами алкогольной продукции (разные импортеры, объемы и т.п.),
+а один код - с несколькими товарами. Проданное количество списывается с остатков кодов на 2ом регистре ЕГАИС.
+
+Правило распределения:
+1. Продажи обрабатываются в переданном порядке. Для нескольких дней продажи передаются упорядоченными по дням,
+   тогда остаток, списанный продажами более раннего дня, не доступен продажам следующих дней.
+2. Внутри продажи коды перебираются по убыванию текущего остатка (самый большой остаток - первым),
+   при равных остатках - по возрастанию кода. Порядок связанных кодов во входных данных на результат не влияет.
+3. С каждого кода списывается не больше его текущего остатка и не больше, чем осталось списать по продаже.
+   Если остатков не хватает, несписанное количество в журнал не попадает.
+"""
+from typing import Dict, List, Mapping, NamedTuple, Sequence
+
+
+class Allocation(NamedTuple):
+    """Класс описывает списание части продажи с одного кода ЕГАИС."""
+
+    # Индекс продажи во входных данных
+    sale: int
+    # Код алкогольной продукции
+    egais_code: str
+    # Списываемое количество
+    quantity: int
+
+
+def allocate(sold: Sequence[int], links: Sequence[Sequence[str]], stock: Mapping[str, int]) -> List[Allocation]:
+    """Функция распределяет проданное количество по кодам ЕГАИС.
+
+    :param sold: проданное количество по каждой продаже.
+    :param links: коды ЕГАИС, связанные с товаром каждой продажи. links[i] относится к sold[i].
+    :param stock: остатки кодов ЕГАИС на 2ом регистре. Коды, которых нет в stock, считаются с нулевым остатком.
+    :return: Списания в порядке продаж, внутри продажи - в порядке списания. Списаний с нулевым количеством нет.
+    """
+    if len(sold) != len(links):
+        raise ValueError("Количество продаж и списков связанных кодов не совпадает")
+
+    remaining_stock: Dict[str, int] = {code: quantity for code, quantity in stock.items() if quantity > 0}
+    allocations: List[Allocation] = []
+    for sale, (quantity, codes) in enumerate(zip(sold, links)):
+        if quantity <= 0:
+            continue
+        available = [code for code in set(codes) if remaining_stock.get(code, 0) > 0]
+        for code in sorted(available, key=lambda code_: (-remaining_stock[code_], code_)):
+            allocated = min(quantity, remaining_stock[code])
+            remaining_stock[code] -= allocated
+            quantity -= allocated
+            allocations.append(Allocation(sale=sale, egais_code=code, quantity=allocated))
+            if not quantity:
+                break
+    return allocations
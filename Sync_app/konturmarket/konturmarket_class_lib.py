@@ -3,7 +3,7 @@ import datetime
 import json
 import os
 from dataclasses import dataclass
-from typing import List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 import requests
 from pydantic import BaseModel, Field
@@ -11,6 +11,7 @@ from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 
 import Sync_app.models.konturmarket_models as km_models
+from Sync_app.common.http_cache import RESPONSE_CACHE
 from Sync_app.konturmarket.konturmarket_urls import (
     KonturMarketUrl, UrlType, get_url,
 )
@@ -83,16 +84,24 @@ class KonturMarket:
         # Переменная устанавливается в True, в случае успешного логина в сервисе
         self._session = requests.Session()
 
+    def _get_json(self, url: str) -> Optional[Dict[str, Any]]:
+        """Метод возвращает JSON ответ сервиса на GET запрос url. None - в случае ошибки."""
+        response = self._session.get(url)
+        if not response.ok:
+            return None
+        return response.json()
+
     def get_egais_assortment(self) -> List[StockEGAIS]:
         """Метод возвращает список инстансов GoodEGAIS, полученных из сервиса."""
         goods_list: List[StockEGAIS] = []
         url: KonturMarketUrl = get_url(UrlType.EGAIS_ASSORTMENT)
-        response = self._session.get(url.url)
+        # Если включен кэш ответов, ответ берется из кэша
+        response_json: Optional[Dict[str, Any]] = RESPONSE_CACHE.get_or_fetch(url.url, None, lambda: self._get_json(url.url))
 
-        if not response.ok:
+        if response_json is None:
             return []
 
-        goods = response.json().get("list", [])
+        goods = response_json.get("list", [])
         # Проходим по всему списку товаров, наименований.
         for good in goods:
             # Получаем словарь с информацией о товаре
@@ -0,0 +1,29 @@
+"""Команда запуска синтетических замеров производительности."""
+from typing import Any, Dict, Tuple
+
+from django.core.management.base import BaseCommand, CommandParser
+
+from Sync_app.common.benchmarks import BENCHMARKS
+
+
+class Command(BaseCommand):  # noqa: D101
+    help = "Синтетические замеры производительности синхронизации. "  # noqa
+
+    def add_arguments(self, parser: CommandParser) -> None:  # noqa: D102
+        parser.add_argument(
+            "case",
+            choices=sorted(BENCHMARKS),
+            help="Название замера.",
+        )
+
+        parser.add_argument(
+            "-s",
+            "--size",
+            type=int,
+            default=20000,
+            help="Размер синтетических данных. По умолчанию - 20000.",
+        )
+
+    def handle(self, *args: Tuple[str], **kwargs: Dict[str, Any]) -> None:  # noqa: D102
+        for line in BENCHMARKS[kwargs["case"]](kwargs["size"]):
+            self.stdout.write(line)
@@ -7,7 +7,9 @@ from django.core.management.base import BaseCommand, CommandParser
 
 import Sync_app.konturmarket.konturmarket_class_lib as km_class
 import Sync_app.moysklad.moysklad_class_lib as ms_class
+from Sync_app.common.http_cache import RESPONSE_CACHE
 from Sync_app.googledrive.googledrive_class_lib import GoogleSheets
+from Sync_app.googledrive.googledrive_suggestions import SUGGESTIONS_COUNT
 
 
 class Command(BaseCommand):  # noqa: D101
@@ -23,6 +25,32 @@ class Command(BaseCommand):  # noqa: D101
             help="Запустить синхронизацию ассортимента из МойСклад.",
         )
 
+        parser.add_argument(
+            "-mw",
+            "--moysklad_workers",
+            type=int,
+            default=1,
+            help="Количество одновременных запросов страниц ассортимента, продаж и возвратов МойСклад. "
+            "По умолчанию - 1 (последовательно).",
+        )
+
+        parser.add_argument(
+            "-ms",
+            "--moysklad_stream",
+            action="store_true",
+            default=False,
+            help="Записывать ассортимент МойСклад в БД постранично, не дожидаясь загрузки всех страниц.",
+        )
+
+        parser.add_argument(
+            "-mi",
+            "--moysklad_incremental",
+            action="store_true",
+            default=False,
+            help="Загрузить только товары МойСклад, измененные с последней синхронизации. Остатки неизмененных "
+            "товаров при этом не обновляются.",
+        )
+
         parser.add_argument(
             "-mrd",
             "--moysklad_retaildemand",
@@ -34,6 +62,44 @@ class Command(BaseCommand):  # noqa: D101
             help="Запустить импорт товаров, проданных за указанную дату. Если не указывать, по умолчанию - today.",
         )
 
+        parser.add_argument(
+            "-mrr",
+            "--moysklad_retaildemand_range",
+            type=datetime.date.fromisoformat,
+            nargs=2,
+            metavar=("START_DATE", "END_DATE"),
+            default=None,
+            help="Запустить импорт товаров, проданных за каждый день периода. Дни загружаются одновременно.",
+        )
+
+        parser.add_argument(
+            "-ml",
+            "--moysklad_lean",
+            action="store_true",
+            default=False,
+            help="Запрашивать продажи и возвраты МойСклад без карточек товаров. Товары берутся из БД, "
+            "неизвестные товары запрашиваются отдельно.",
+        )
+
+        parser.add_argument(
+            "-mrs",
+            "--moysklad_retail_source",
+            choices=ms_class.RETAIL_SOURCES,
+            default=ms_class.RETAIL_SOURCE_CHECKS,
+            help="Источник розничных продаж МойСклад: checks - чеки продаж и возвратов (по умолчанию), "
+            "report - отчет о прибыльности по товарам, просуммированный сервисом.",
+        )
+
+        parser.add_argument(
+            "-mrv",
+            "--moysklad_retail_verify",
+            type=datetime.date.fromisoformat,
+            nargs=2,
+            metavar=("START_DATE", "END_DATE"),
+            default=None,
+            help="Сверить продажи за каждый день периода по чекам и по отчету о прибыльности. БД не изменяется.",
+        )
+
         parser.add_argument(
             "-ka",
             "--konturmarket_assortment",
@@ -50,26 +116,66 @@ class Command(BaseCommand):  # noqa: D101
             help="Запустить синхронизацию таблицы соответствия из GoogleSheets.",
         )
 
+        parser.add_argument(
+            "-gcf",
+            "--google_compl_full",
+            action="store_true",
+            default=False,
+            help="Вместе с --google_compl_table: сопоставить заново все строки таблицы соответствия, "
+            "даже если таблица не изменилась с последней синхронизации.",
+        )
+
+        parser.add_argument(
+            "-gcs",
+            "--google_compl_suggest",
+            type=int,
+            nargs="?",
+            const=SUGGESTIONS_COUNT,
+            default=0,
+            metavar="COUNT",
+            help="Вместе с --google_compl_table: подобрать для несопоставленных строк таблицы соответствия "
+            f"похожие товары МойСклад. По умолчанию - {SUGGESTIONS_COUNT} товара на строку.",
+        )
+
+        parser.add_argument(
+            "--no_cache",
+            action="store_true",
+            default=False,
+            help="Не использовать кэш ответов внешних сервисов (свежие ответы в кэш сохраняются).",
+        )
+
     def handle(self, *args: Tuple[str], **kwargs: Dict[str, Any]) -> None:  # noqa: D102
 
         moysklad_assortment = kwargs["moysklad_assortment"]
+        moysklad_workers = kwargs["moysklad_workers"]
+        moysklad_stream = kwargs["moysklad_stream"]
+        moysklad_incremental = kwargs["moysklad_incremental"]
         moysklad_retaildemand = kwargs["moysklad_retaildemand"]
+        moysklad_retaildemand_range = kwargs["moysklad_retaildemand_range"]
         konturmarket_assortment = kwargs["konturmarket_assortment"]
         google_compl_table = kwargs["google_compl_table"]
 
-        ms: ms_class.MoySklad = ms_class.MoySklad()
+        RESPONSE_CACHE.configure(bypass=kwargs["no_cache"])
+
+        ms: ms_class.MoySklad = ms_class.MoySklad(
+            lean_retail=kwargs["moysklad_lean"], retail_source=kwargs["moysklad_retail_source"],
+        )
 
         # Синхронизация МойСклад
         if moysklad_assortment:
 
-            if ms.sync_assortment():
-                self.stdout.write(self.style.SUCCESS("ОК. МойСклад синхронизация товаров."))
+            if ms.sync_assortment(workers=moysklad_workers, stream=moysklad_stream, incremental=moysklad_incremental):
+                self.stdout.write(self.style.SUCCESS(f"ОК. МойСклад синхронизация товаров ({ms.save_stats})."))
             else:
                 self.stdout.write(self.style.ERROR("Ошибка. Не удалось получить данные из сервиса МойСклад."))
+            if ms.save_stats.errors:
+                self.stdout.write(self.style.WARNING(f"Товары не сохранены: {len(ms.save_stats.errors)}."))
+                for uuid, error in ms.save_stats.errors.items():
+                    self.stdout.write(f"{uuid}: {error}")
 
         # Импорт товаров, проданных за смену
         if moysklad_retaildemand:
-            if ms.sync_retail_demand(date_=moysklad_retaildemand):
+            if ms.sync_retail_demand(date_=moysklad_retaildemand, workers=moysklad_workers):
                 self.stdout.write(
                     self.style.SUCCESS(f"ОК. МойСклад розничные продажи за {moysklad_retaildemand.__str__()}.")
                 )
@@ -78,6 +184,34 @@ class Command(BaseCommand):  # noqa: D101
                     self.style.ERROR("Ошибка. Не удалось получить товары, проданные за смену из сервиса МойСклад.")
                 )
 
+        # Импорт товаров, проданных за период
+        if moysklad_retaildemand_range:
+            start_date, end_date = moysklad_retaildemand_range
+            if ms.sync_retail_demand_range(start_date=start_date, end_date=end_date, workers=moysklad_workers):
+                self.stdout.write(self.style.SUCCESS(f"ОК. МойСклад розничные продажи за {start_date} - {end_date}."))
+            else:
+                self.stdout.write(
+                    self.style.ERROR(f"Ошибка. Не удалось получить все продажи за {start_date} - {end_date} из сервиса МойСклад.")
+                )
+
+        # Сверка продаж по чекам и по отчету
+        if kwargs["moysklad_retail_verify"]:
+            start_date, end_date = kwargs["moysklad_retail_verify"]
+            mismatches = ms.verify_retail_report(start_date=start_date, end_date=end_date, workers=moysklad_workers)
+            if mismatches is None:
+                self.stdout.write(self.style.ERROR(f"Ошибка. Не удалось получить продажи за {start_date} - {end_date}."))
+            elif not mismatches:
+                self.stdout.write(self.style.SUCCESS(f"ОК. Продажи по чекам и по отчету за {start_date} - {end_date} совпадают."))
+            else:
+                self.stdout.write(self.style.WARNING(f"Расхождения продаж по чекам и по отчету: {len(mismatches)}."))
+                for (good_id, demand_date), (by_checks, by_report) in sorted(mismatches.items(), key=lambda item: item[0][::-1]):
+                    self.stdout.write(f"{demand_date} {good_id}: по чекам {by_checks}, по отчету {by_report}")
+
+        if ms.transfer_stats.requests:
+            self.stdout.write(f"МойСклад: {ms.transfer_stats}.")
+            for endpoint, stats in sorted(ms.endpoint_transfer_stats.items()):
+                self.stdout.write(f"    {endpoint}: {stats}.")
+
         # Синхронизация КонтурМаркет
         if konturmarket_assortment:
             km: km_class.KonturMarket = km_class.KonturMarket()
@@ -91,7 +225,18 @@ class Command(BaseCommand):  # noqa: D101
         if google_compl_table:
             gs: GoogleSheets = GoogleSheets()
 
-            if gs.sync_compl_table():
-                self.stdout.write(self.style.SUCCESS("ОК. GoogleSheets таблица соответствий."))
+            if gs.sync_compl_table(full=kwargs["google_compl_full"]):
+                if gs.compl_table_unchanged:
+                    self.stdout.write(self.style.SUCCESS("ОК. GoogleSheets таблица соответствий не изменилась."))
+                else:
+                    self.stdout.write(self.style.SUCCESS("ОК. GoogleSheets таблица соответствий."))
             else:
                 self.stdout.write(self.style.ERROR("Ошибка. Не удалось создать таблицу соответствий."))
+
+            # Подбор похожих товаров для несопоставленных строк
+            if kwargs["google_compl_suggest"] and gs.not_matched:
+                self.stdout.write(self.style.WARNING(f"Несопоставленных строк таблицы соответствий: {len(gs.not_matched)}."))
+                for gs_row, suggestions in gs.get_match_suggestions(gs.not_matched, count=kwargs["google_compl_suggest"]):
+                    self.stdout.write(f"{' | '.join(gs_row)}:")
+                    for suggestion in suggestions:
+                        self.stdout.write(f"    {suggestion.score:.3f} {suggestion.candidate.full_name} ({suggestion.candidate.uuid})")
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.30 on 2026-10-18 04:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Sync_app', '0009_remove_moyskladdbgood_valid_good_type_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MoySkladDBSyncState',
+            fields=[
+                ('name', models.CharField(help_text='Название синхронизации', max_length=50, primary_key=True, serialize=False)),
+                ('watermark', models.DateTimeField(help_text='Время изменения последнего синхронизированного объекта')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 04:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Sync_app', '0010_moyskladdbsyncstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='moyskladdbgood',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', help_text='Отпечаток карточки товара в сервисе МойСклад', max_length=40, verbose_name='Отпечаток'),
+        ),
+    ]
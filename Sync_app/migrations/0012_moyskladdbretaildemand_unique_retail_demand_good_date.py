@@ -0,0 +1,35 @@
+# Generated by Django 4.2.30 on 2026-10-18 04:31
+
+from django.apps.registry import Apps
+from django.db import migrations, models
+from django.db.backends.base.schema import BaseDatabaseSchemaEditor
+from django.db.models import Count, Max
+
+
+def remove_duplicate_sales(apps: Apps, schema_editor: BaseDatabaseSchemaEditor) -> None:
+    """Оставляет для каждого товара и дня только последнюю записанную продажу."""
+    retail_demand = apps.get_model("Sync_app", "MoySkladDBRetailDemand")
+    duplicates = (
+        retail_demand.objects.values("uuid", "demand_date")
+        .annotate(last_id=Max("id"), count=Count("id"))
+        .filter(count__gt=1)
+    )
+    for duplicate in duplicates:
+        retail_demand.objects.filter(uuid=duplicate["uuid"], demand_date=duplicate["demand_date"]).exclude(
+            id=duplicate["last_id"],
+        ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Sync_app', '0011_moyskladdbgood_fingerprint'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_sales, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='moyskladdbretaildemand',
+            constraint=models.UniqueConstraint(fields=('uuid', 'demand_date'), name='unique_retail_demand_good_date'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-18 04:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Sync_app', '0012_moyskladdbretaildemand_unique_retail_demand_good_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GoogleSheetsDBSyncState',
+            fields=[
+                ('spreadsheet_id', models.CharField(help_text='ID таблицы в Google Sheets', max_length=100, primary_key=True, serialize=False)),
+                ('revision', models.CharField(help_text='Версия таблицы, примененная последней синхронизацией', max_length=100)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='GoogleSheetsDBCompilanceRow',
+            fields=[
+                ('row_hash', models.CharField(help_text='Отпечаток строки таблицы соответствия', max_length=40, primary_key=True, serialize=False)),
+                ('commercial_name', models.CharField(help_text='Коммерческое название', max_length=255)),
+                ('egais_code', models.CharField(help_text='Код алкогольной продукции (код АП) в ЕГАИС', max_length=19)),
+                ('goods', models.ManyToManyField(blank=True, help_text='Товары МойСклад, связанные строкой с кодом ЕГАИС', related_name='compilance_rows', to='Sync_app.moyskladdbgood')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 04:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Sync_app', '0013_googlesheets_compilance_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='moyskladdbgood',
+            name='is_archived',
+            field=models.BooleanField(default=False, help_text='Товар удален в сервисе МойСклад или перенесен из папки "Пиво"', verbose_name='В архиве'),
+        ),
+    ]
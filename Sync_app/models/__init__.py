@@ -1,4 +1,9 @@
+from .googlesheets_models import (
+    GoogleSheetsDBCompilanceRow, GoogleSheetsDBSyncState,
+)
 from .konturmarket_models import (
     KonturMarketDBGood, KonturMarketDBProducer, KonturMarketDBStock,
 )
-from .moysklad_models import MoySkladDBGood, MoySkladDBStock
+from .moysklad_models import (
+    MoySkladDBGood, MoySkladDBStock, MoySkladDBSyncState,
+)
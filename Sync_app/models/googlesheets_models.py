@@ -0,0 +1,154 @@
+"""Модуль содержит описание моделей для работы с таблицами Google Sheets."""
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
+
+from django.db import models, transaction
+from django.db.models import Q
+
+from Sync_app.models.moysklad_models import (
+    BULK_BATCH_SIZE, LOOKUP_BATCH_SIZE, MoySkladDBGood,
+)
+
+if TYPE_CHECKING:
+    import Sync_app.googledrive.googledrive_class_lib as gs_class
+
+
+class GoogleSheetsDBSyncState(models.Model):
+    """Класс описывает состояние последней успешной синхронизации таблицы Google Sheets."""
+
+    spreadsheet_id = models.CharField(primary_key=True, max_length=100, help_text="ID таблицы в Google Sheets")
+    # Версия файла таблицы в Google Drive, см. GoogleSheets.get_revision()
+    revision = models.CharField(max_length=100, help_text="Версия таблицы, примененная последней синхронизацией")
+
+    @staticmethod
+    def get_revision(spreadsheet_id: str) -> Optional[str]:
+        """Метод возвращает версию таблицы, примененную последней синхронизацией. None - если синхронизации еще не было."""
+        state = GoogleSheetsDBSyncState.objects.filter(spreadsheet_id=spreadsheet_id).first()
+        return state.revision if state else None
+
+    @staticmethod
+    def set_revision(spreadsheet_id: str, revision: str) -> None:
+        """Метод сохраняет версию таблицы, примененную последней синхронизацией."""
+        GoogleSheetsDBSyncState.objects.update_or_create(spreadsheet_id=spreadsheet_id, defaults={"revision": revision})
+
+
+class GoogleSheetsDBCompilanceRow(models.Model):
+    """Класс описывает строку таблицы соответствия, примененную последней синхронизацией (снимок таблицы).
+
+    Строка идентифицируется отпечатком содержимого (CompilanceRow.fingerprint()), поэтому измененная строка
+    выглядит как удаленная старая и добавленная новая. goods - товары МойСклад, связанные с кодом ЕГАИС строки.
+    Строка без товаров - соответствие не найдено, такие строки сопоставляются повторно при следующей синхронизации.
+    """
+
+    row_hash = models.CharField(primary_key=True, max_length=40, help_text="Отпечаток строки таблицы соответствия")
+    commercial_name = models.CharField(max_length=255, help_text="Коммерческое название")
+    egais_code = models.CharField(max_length=19, help_text="Код алкогольной продукции (код АП) в ЕГАИС")
+    goods = models.ManyToManyField(
+        MoySkladDBGood,
+        blank=True,
+        help_text="Товары МойСклад, связанные строкой с кодом ЕГАИС",
+        related_name="compilance_rows",
+    )
+
+    @staticmethod
+    def get_saved_state() -> Dict[str, Set[str]]:
+        """Метод возвращает снимок таблицы: {отпечаток строки: uuid связанных товаров МойСклад}."""
+        state: Dict[str, Set[str]] = {
+            row_hash: set() for row_hash in GoogleSheetsDBCompilanceRow.objects.values_list("row_hash", flat=True)
+        }
+        for row_hash, uuid in GoogleSheetsDBCompilanceRow.goods.through.objects.values_list(
+            "googlesheetsdbcompilancerow_id", "moyskladdbgood_id",
+        ):
+            state[row_hash].add(uuid)
+        return state
+
+    @staticmethod
+    def get_not_matched() -> List[Tuple[str, str, str]]:
+        """Метод возвращает строки снимка, для которых соответствие не найдено: [(отпечаток, название, код ЕГАИС)]."""
+        return list(
+            GoogleSheetsDBCompilanceRow.objects.filter(goods__isnull=True)
+            .order_by("commercial_name", "row_hash")
+            .values_list("row_hash", "commercial_name", "egais_code"),
+        )
+
+    @staticmethod
+    def save_objects_to_db(matches: Dict[str, Tuple["gs_class.CompilanceRow", List[str]]], removed: List[str]) -> None:
+        """Метод применяет изменения таблицы соответствия к связям товаров и к снимку таблицы.
+
+        :param matches: Сопоставленные заново строки: {отпечаток строки: (строка, uuid товаров МойСклад)}.
+        :param removed: Отпечатки строк, которых больше нет в таблице. Связи, установленные только этими строками,
+            удаляются.
+        """
+        ms_through = MoySkladDBGood.egais_code.through
+        row_through = GoogleSheetsDBCompilanceRow.goods.through
+
+        new_links: Set[Tuple[str, str]] = {(uuid, row.egais_code) for row, uuids in matches.values() for uuid in uuids}
+
+        with transaction.atomic():
+            if removed:
+                # Связи удаленных строк, которые не устанавливаются оставшимися и новыми строками
+                removed_links: Set[Tuple[str, str]] = set()
+                kept_links: Set[Tuple[str, str]] = set()
+                for start in range(0, len(removed), LOOKUP_BATCH_SIZE):
+                    removed_links.update(
+                        row_through.objects.filter(
+                            googlesheetsdbcompilancerow_id__in=removed[start: start + LOOKUP_BATCH_SIZE],
+                        ).values_list("moyskladdbgood_id", "googlesheetsdbcompilancerow__egais_code"),
+                    )
+                # Старые товары строк, сопоставленных заново, заменяются новыми (new_links)
+                replaced = set(removed).union(matches)
+                removed_uuids = list({uuid for uuid, _ in removed_links})
+                for start in range(0, len(removed_uuids), LOOKUP_BATCH_SIZE):
+                    kept_links.update(
+                        (uuid, egais_code)
+                        for uuid, row_hash, egais_code in row_through.objects.filter(
+                            moyskladdbgood_id__in=removed_uuids[start: start + LOOKUP_BATCH_SIZE],
+                        ).values_list("moyskladdbgood_id", "googlesheetsdbcompilancerow_id", "googlesheetsdbcompilancerow__egais_code")
+                        if row_hash not in replaced
+                    )
+                stale_links = sorted(removed_links - kept_links - new_links)
+
+                # Связи удаляются пачками, по одному условию на код ЕГАИС
+                by_code: Dict[str, List[str]] = defaultdict(list)
+                for uuid, egais_code in stale_links:
+                    by_code[egais_code].append(uuid)
+                conditions = [Q(konturmarketdbgood_id=egais_code, moyskladdbgood_id__in=uuids) for egais_code, uuids in by_code.items()]
+                for start in range(0, len(conditions), LOOKUP_BATCH_SIZE):
+                    ms_through.objects.filter(reduce(or_, conditions[start: start + LOOKUP_BATCH_SIZE])).delete()
+
+                for start in range(0, len(removed), LOOKUP_BATCH_SIZE):
+                    GoogleSheetsDBCompilanceRow.objects.filter(row_hash__in=removed[start: start + LOOKUP_BATCH_SIZE]).delete()
+
+            if matches:
+                GoogleSheetsDBCompilanceRow.objects.bulk_create(
+                    [
+                        GoogleSheetsDBCompilanceRow(
+                            row_hash=row_hash, commercial_name=row.commercial_name[:255], egais_code=row.egais_code[:19],
+                        )
+                        for row_hash, (row, _) in matches.items()
+                    ],
+                    batch_size=BULK_BATCH_SIZE,
+                    ignore_conflicts=True,
+                )
+                # Товары строк, сопоставленных заново, заменяются
+                row_hashes = list(matches)
+                for start in range(0, len(row_hashes), LOOKUP_BATCH_SIZE):
+                    row_through.objects.filter(googlesheetsdbcompilancerow_id__in=row_hashes[start: start + LOOKUP_BATCH_SIZE]).delete()
+                row_through.objects.bulk_create(
+                    [
+                        row_through(googlesheetsdbcompilancerow_id=row_hash, moyskladdbgood_id=uuid)
+                        for row_hash, (_, uuids) in matches.items()
+                        for uuid in uuids
+                    ],
+                    batch_size=BULK_BATCH_SIZE,
+                    ignore_conflicts=True,
+                )
+
+            # Уже существующие связи пропускаются, как при egais_code.add()
+            ms_through.objects.bulk_create(
+                [ms_through(moyskladdbgood_id=uuid, konturmarketdbgood_id=egais_code) for uuid, egais_code in sorted(new_links)],
+                batch_size=BULK_BATCH_SIZE,
+                ignore_conflicts=True,
+            )
@@ -1,12 +1,15 @@
 """Модуль содержит описание моделей для работы с сервисом Контур.Маркет."""
 import datetime
+import os
 import sys
 from operator import itemgetter
-from typing import TYPE_CHECKING, Dict, List, Union
+from typing import TYPE_CHECKING, Any, Dict, List, Union
 
 from django.core.exceptions import ObjectDoesNotExist
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 
+from Sync_app.konturmarket.konturmarket_allocation import allocate
 from Sync_app.models.moysklad_models import (
     MoySkladDBGood, MoySkladDBRetailDemand,
 )
@@ -15,6 +18,11 @@ from Sync_app.moysklad.moysklad_constants import GoodType
 if TYPE_CHECKING:
     import Sync_app.konturmarket.konturmarket_class_lib as km_class
 
+# Количество строк, записываемых в БД одним запросом INSERT ... ON CONFLICT DO UPDATE
+BULK_BATCH_SIZE = int(os.getenv("KONTURMARKET_BULK_BATCH_SIZE", 500))
+# Типы товаров, которые не попадают в журнал продаж алкоголя
+NON_ALCO_GOOD_TYPES = [good_type.value[0] for good_type in (GoodType.KOMBUCHA, GoodType.OTHER, GoodType.LEMONADE)]
+
 
 class KonturMarketDBProducer(models.Model):
     """Класс описывает модель производителя, продукции в соответствии с терминами ЕГАИС."""
@@ -102,11 +110,20 @@ class KonturMarketDBGood(models.Model):
     )
 
     @staticmethod
-    def save_objects_to_db(list_km_goods: List["km_class.StockEGAIS"]) -> bool:
-        """Метод сохраняет товары в БД."""
+    def save_objects_to_db(list_km_goods: List["km_class.StockEGAIS"], batch_size: int = BULK_BATCH_SIZE) -> bool:
+        """Метод сохраняет товары в БД.
+
+        Производители, товары и остатки собираются в памяти без повторов (один производитель выпускает много товаров)
+        и записываются в порядке зависимостей пакетами по batch_size строк (INSERT ... ON CONFLICT DO UPDATE)
+        в одной транзакции. Если код АП или производитель встречается несколько раз, сохраняется последнее значение.
+        """
         if not list_km_goods:
             return False
 
+        producers: Dict[str, KonturMarketDBProducer] = {}
+        goods: Dict[str, KonturMarketDBGood] = {}
+        stocks: Dict[str, KonturMarketDBStock] = {}
+
         km_good: km_class.StockEGAIS
         for km_good in list_km_goods:
             producer = KonturMarketDBProducer(
@@ -115,72 +132,101 @@ class KonturMarketDBGood(models.Model):
                 short_name=km_good.good.brewery.short_name,
                 full_name=km_good.good.brewery.full_name,
             )
+            producers[producer.fsrar] = producer
 
             good = KonturMarketDBGood(
                 egais_code=km_good.good.alco_code,
                 full_name=km_good.good.name,
-                fsrar=producer,
+                fsrar_id=producer.fsrar,
                 # Если нет объема продукции, то считаем, что товар разливной, объемом 99 л
                 capacity=km_good.good.capacity if km_good.good.capacity else 99,
                 # Т.к. km_good.good.capacity может быть None
                 is_draft=True if km_good.good.capacity is None or km_good.good.capacity > 10 else False,
                 kind_code=km_good.good.kind_code,
             )
+            goods[good.egais_code] = good
 
-            stock = KonturMarketDBStock(quantity=km_good.quantity_2, egais_code=good)
+            stocks[good.egais_code] = KonturMarketDBStock(quantity=km_good.quantity_2, egais_code_id=good.egais_code)
 
-            producer.save()
-            good.save()
-            stock.save()
+        with transaction.atomic():
+            KonturMarketDBProducer.objects.bulk_create(
+                producers.values(),
+                batch_size=batch_size,
+                update_conflicts=True,
+                unique_fields=["fsrar"],
+                update_fields=["inn", "short_name", "full_name"],
+            )
+            KonturMarketDBGood.objects.bulk_create(
+                goods.values(),
+                batch_size=batch_size,
+                update_conflicts=True,
+                unique_fields=["egais_code"],
+                update_fields=["full_name", "capacity", "is_draft", "kind_code", "fsrar"],
+            )
+            KonturMarketDBStock.objects.bulk_create(
+                stocks.values(),
+                batch_size=batch_size,
+                update_conflicts=True,
+                unique_fields=["egais_code"],
+                update_fields=["quantity"],
+            )
 
         return True
 
     @staticmethod
     def get_sales_journal_from_db(date_: datetime.date) -> List[Dict[str, Union[str, int]]]:
-        """Метод для получения журнала розничных продаж алкоголя из БД."""
-
-        sales: List[Dict[str, str | int]] = []
-
-        all_sold_ms_goods = (
-            MoySkladDBRetailDemand.objects.select_related("uuid")
-            .filter(demand_date__exact=date_)
-            .filter(uuid__is_draft=False)
-            .exclude(uuid__bev_type__in=[GoodType.KOMBUCHA, GoodType.OTHER, GoodType.LEMONADE])
-            .prefetch_related("uuid__egais_code")
-            .prefetch_related("uuid__egais_code__konturmarketdbstock")
+        """Метод для получения журнала розничных продаж алкоголя из БД.
+
+        Пары "проданный товар МойСклад - код ЕГАИС с положительным остатком" выбираются одним запросом.
+        Проданное количество распределяется по кодам ЕГАИС функцией allocate() (см. konturmarket_allocation):
+        внутри продажи первым списывается код с наибольшим остатком.
+        """
+        rows = (
+            MoySkladDBRetailDemand.objects.filter(demand_date=date_, quantity__gt=0, uuid__is_draft=False)
+            .exclude(uuid__bev_type__in=NON_ALCO_GOOD_TYPES)
             .filter(uuid__egais_code__konturmarketdbstock__quantity__gt=0)
+            .values(
+                sale_id=F("id"),
+                sold=F("quantity"),
+                commercial_name=F("uuid__full_name"),
+                price=F("uuid__price"),
+                name=F("uuid__egais_code__full_name"),
+                alcCode=F("uuid__egais_code__egais_code"),
+                apCode=F("uuid__egais_code__kind_code"),
+                volume=F("uuid__egais_code__capacity"),
+                stock=F("uuid__egais_code__konturmarketdbstock__quantity"),
+            )
+            .order_by("commercial_name", "sale_id", "alcCode")
         )
 
-        quantity: int = 0
-
-        for good in all_sold_ms_goods:
-            for km_good in good.uuid.egais_code.all():
-                # Если остаток товара в ЕГАИС = 0
-                if not km_good.konturmarketdbstock.quantity:
-                    continue
-
-                # Если товара в ЕГАИС больше, чем продано
-                if km_good.konturmarketdbstock.quantity >= good.quantity:
-                    quantity = good.quantity
-                    good.quantity = 0
-                    km_good.konturmarketdbstock.quantity -= good.quantity
-                # Если товара в ЕГАИС меньше, чем продано
-                elif km_good.konturmarketdbstock.quantity < good.quantity:
-                    quantity = km_good.konturmarketdbstock.quantity
-                    good.quantity -= km_good.konturmarketdbstock.quantity
-                    km_good.konturmarketdbstock.quantity = 0
-
-                sales.append(
-                    {
-                        "commercial_name": good.uuid.full_name,
-                        "name": km_good.full_name,
-                        "alcCode": km_good.egais_code,
-                        "apCode": km_good.kind_code,
-                        "volume": km_good.capacity,
-                        "quantity": quantity,
-                        "price": good.uuid.price,
-                    },
-                )
+        # Продажи, связанные с ними коды ЕГАИС и остатки кодов
+        sold_goods: Dict[int, Dict[str, Any]] = {}
+        links: Dict[int, List[str]] = {}
+        km_goods: Dict[str, Dict[str, Any]] = {}
+        for row in rows:
+            sold_goods.setdefault(row["sale_id"], row)
+            links.setdefault(row["sale_id"], []).append(row["alcCode"])
+            km_goods.setdefault(row["alcCode"], row)
+
+        sale_ids = list(sold_goods)
+        allocations = allocate(
+            sold=[sold_goods[sale_id]["sold"] for sale_id in sale_ids],
+            links=[links[sale_id] for sale_id in sale_ids],
+            stock={code: km_good["stock"] for code, km_good in km_goods.items()},
+        )
+
+        sales: List[Dict[str, Union[str, int]]] = [
+            {
+                "commercial_name": sold_goods[sale_ids[allocation.sale]]["commercial_name"],
+                "name": km_goods[allocation.egais_code]["name"],
+                "alcCode": allocation.egais_code,
+                "apCode": km_goods[allocation.egais_code]["apCode"],
+                "volume": km_goods[allocation.egais_code]["volume"],
+                "quantity": allocation.quantity,
+                "price": sold_goods[sale_ids[allocation.sale]]["price"],
+            }
+            for allocation in allocations
+        ]
 
         sales = sorted(sales, key=itemgetter("commercial_name"))
         return sales
@@ -1,16 +1,46 @@
 """Модуль содержит описание моделей для работы с МойСклад."""
-from typing import TYPE_CHECKING, List
+import datetime
+import os
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple, Union
 
-from django.core.exceptions import ObjectDoesNotExist
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
 from django.db.models import CheckConstraint, Q
-from django.db.utils import IntegrityError
 
 import Sync_app.moysklad.moysklad_constants as ms_const
 
 if TYPE_CHECKING:
     import Sync_app.moysklad.moysklad_class_lib as ms_class
 
+# Количество товаров, состояние которых запрашивается из БД одним запросом
+LOOKUP_BATCH_SIZE = 1000
+# Количество строк, записываемых в БД одним запросом INSERT ... ON CONFLICT DO UPDATE
+BULK_BATCH_SIZE = int(os.getenv("MOYSKLAD_BULK_BATCH_SIZE", 500))
+
+
+@dataclass
+class SaveStats:
+    """Класс описывает результат сохранения товаров в БД."""
+
+    # Товары, карточка и остаток которых не изменились. Не разбирались и не записывались в БД
+    skipped: int = 0
+    # Товары, уже существовавшие в БД, у которых изменилась карточка или остаток
+    updated: int = 0
+    # Новые товары
+    inserted: int = 0
+    # Товары, не прошедшие проверку ограничений таблицы. В БД не записывались
+    rejected: int = 0
+    # Ошибки отклоненных товаров: {uuid товара: описание ошибки}
+    errors: Dict[str, str] = field(default_factory=dict)
+
+    def __str__(self) -> str:
+        return (
+            f"товаров без изменений: {self.skipped}, обновлено: {self.updated}, добавлено: {self.inserted}, "
+            f"отклонено: {self.rejected}"
+        )
+
 
 class MoySkladDBGood(models.Model):
     """Класс описывает модель для работы с товарами из сервиса МойСклад."""
@@ -93,6 +123,20 @@ class MoySkladDBGood(models.Model):
     )
     # Емкость тары
     capacity = models.DecimalField(max_digits=5, decimal_places=3, help_text="Емкость тары", verbose_name="Объём")
+    # Признак товара, удаленного в МойСклад или перенесенного из папки "Пиво", у которого в БД есть продажи или коды ЕГАИС
+    is_archived = models.BooleanField(
+        help_text="Товар удален в сервисе МойСклад или перенесен из папки \"Пиво\"",
+        default=False,
+        verbose_name="В архиве",
+    )
+    # Отпечаток полей карточки товара, из которых получены поля записи. См. Good.fingerprint()
+    fingerprint = models.CharField(
+        max_length=40,
+        blank=True,
+        default="",
+        help_text="Отпечаток карточки товара в сервисе МойСклад",
+        verbose_name="Отпечаток",
+    )
     # Код ЕГАИС
     egais_code = models.ManyToManyField(
         "KonturMarketDBGood",
@@ -102,13 +146,98 @@ class MoySkladDBGood(models.Model):
     )
 
     @staticmethod
-    def save_objects_to_db(list_ms_goods: List["ms_class.Good"]) -> bool:
-        """Метод сохраняет объекты, созданные на основе списка list_ms_goods в БД."""
+    def _get_saved_state(uuids: List[str]) -> Dict[str, Tuple[str, Optional[int]]]:
+        """Метод возвращает отпечаток и остаток товаров uuids, уже сохраненных в БД."""
+        state: Dict[str, Tuple[str, Optional[int]]] = {}
+        for start in range(0, len(uuids), LOOKUP_BATCH_SIZE):
+            rows = MoySkladDBGood.objects.filter(uuid__in=uuids[start: start + LOOKUP_BATCH_SIZE]).values_list(
+                "uuid", "fingerprint", "moyskladdbstock__quantity",
+            )
+            state.update({uuid: (fingerprint, quantity) for uuid, fingerprint, quantity in rows})
+        return state
+
+    @staticmethod
+    def _get_constraint_errors(goods: List["MoySkladDBGood"], stocks: List["MoySkladDBStock"]) -> Dict[str, str]:
+        """Метод проверяет товары и остатки до записи в БД и возвращает ошибки в виде {uuid товара: описание ошибки}.
+
+        Проверяются длины строк, разрядность чисел, тип товара и уникальность полного наименования
+        (среди записываемых товаров и среди остальных товаров в БД).
+        """
+        errors: Dict[str, List[str]] = {}
+        # Проверяемые объекты: uuid товара, объект и поля, которые не проверяются (у остатка uuid - ссылка на товар)
+        checked: List[Tuple[str, models.Model, Optional[List[str]]]] = [
+            *((good.uuid, good, None) for good in goods),
+            *((stock.uuid_id, stock, ["uuid"]) for stock in stocks),
+        ]
+        for uuid, obj, exclude in checked:
+            try:
+                obj.clean_fields(exclude=exclude)
+            except ValidationError as error:
+                # У товаров без родителя и у модификаций parent_uuid и path_name пустые - это допустимо
+                messages = [
+                    f"{field_name}: {' '.join(field_error.messages)}"
+                    for field_name, field_errors in error.error_dict.items()
+                    for field_error in field_errors
+                    if field_error.code != "blank"
+                ]
+                if messages:
+                    errors.setdefault(uuid, []).extend(messages)
+
+        uuid_by_name: Dict[str, str] = {}
+        for good in goods:
+            if uuid_by_name.setdefault(good.full_name, good.uuid) != good.uuid:
+                errors.setdefault(good.uuid, []).append(f"full_name: совпадает с товаром {uuid_by_name[good.full_name]}")
+
+        names = list(uuid_by_name)
+        uuids = [good.uuid for good in goods]
+        for start in range(0, len(names), LOOKUP_BATCH_SIZE):
+            conflicts = (
+                MoySkladDBGood.objects.filter(full_name__in=names[start: start + LOOKUP_BATCH_SIZE])
+                .exclude(uuid__in=uuids)
+                .values_list("full_name", "uuid")
+            )
+            for full_name, uuid in conflicts:
+                errors.setdefault(uuid_by_name[full_name], []).append(f"full_name: совпадает с товаром {uuid} в БД")
+
+        return {uuid: "; ".join(messages) for uuid, messages in errors.items()}
+
+    @staticmethod
+    def save_objects_to_db(
+        list_ms_goods: List["ms_class.GoodLike"],
+        stats: Optional[SaveStats] = None,
+        batch_size: int = BULK_BATCH_SIZE,
+    ) -> bool:
+        """Метод сохраняет объекты, созданные на основе списка list_ms_goods в БД.
+
+        Товары, отпечаток и остаток которых совпадают с сохраненными в БД, пропускаются без разбора наименования.
+        Если у товара изменился только остаток, перезаписывается только остаток.
+        Товары и остатки записываются пакетами по batch_size строк (INSERT ... ON CONFLICT DO UPDATE) в одной транзакции.
+        Товары, нарушающие ограничения таблицы, проверяются заранее и не записываются.
+        :param stats: если передан, в него добавляется количество пропущенных, обновленных и добавленных товаров
+            и ошибки отклоненных товаров.
+        """
+        stats = stats if stats is not None else SaveStats()
+        # Если текущий товар - комплект из товаров, он не сохраняется
+        # (разливное пиво заведено как отдельный товар с припиской (0,5),
+        # а 1л - комплект из двух товаров 0,5
+        list_ms_goods = [ms_good for ms_good in list_ms_goods if ms_good.quantity is not None]
+        saved_state = MoySkladDBGood._get_saved_state([ms_good.good_id for ms_good in list_ms_goods])
+
+        goods: List[MoySkladDBGood] = []
+        stocks: List[MoySkladDBStock] = []
+        # Остатки товаров, карточка которых не изменилась
+        changed_stocks: List[MoySkladDBStock] = []
         for ms_good in list_ms_goods:
-            # Если текущий товар - не комплект из товаров
-            # (разливное пиво заведено как отдельный товар с припиской (0,5),
-            # а 1л - комплект из двух товаров 0,5
-            if ms_good.quantity is None:
+            # Если по какой-то причине остаток товара в МойСклад отрицательный в БД сохраняем 0
+            quantity = max(ms_good.quantity or 0, 0)
+            fingerprint = ms_good.fingerprint()
+            saved_fingerprint, saved_quantity = saved_state.get(ms_good.good_id, (None, None))
+
+            if fingerprint == saved_fingerprint:
+                if quantity == saved_quantity:
+                    stats.skipped += 1
+                else:
+                    changed_stocks.append(MoySkladDBStock(uuid_id=ms_good.good_id, quantity=quantity))
                 continue
 
             parsed_name = ms_good.parse_object()
@@ -120,7 +249,7 @@ class MoySkladDBGood(models.Model):
                 full_name=ms_good.name,
                 # Если модификация товара
                 path_name=ms_good.path_name or "",
-                price=ms_good.price[0].value / 100,
+                price=Decimal(ms_good.price[0].value) / 100,
                 brewery=parsed_name.brewery,
                 name=parsed_name.name,
                 og=parsed_name.og,
@@ -130,24 +259,64 @@ class MoySkladDBGood(models.Model):
                 is_draft=parsed_name.is_draft,
                 bev_type=parsed_name.bev_type,
                 style=parsed_name.style,
-                capacity=parsed_name.capacity,
+                # Округляем так же, как округлила бы БД, иначе clean_fields() отклонит значения вроде 0.33
+                capacity=Decimal(str(parsed_name.capacity)).quantize(Decimal("0.001")),
+                fingerprint=fingerprint,
             )
+            goods.append(good)
+            stocks.append(MoySkladDBStock(uuid=good, quantity=quantity))
+
+        errors = MoySkladDBGood._get_constraint_errors(goods, stocks + changed_stocks)
+        if errors:
+            goods = [good for good in goods if good.uuid not in errors]
+            stocks = [stock for stock in stocks if stock.uuid_id not in errors]
+            changed_stocks = [stock for stock in changed_stocks if stock.uuid_id not in errors]
+            stats.rejected += len(errors)
+            stats.errors.update(errors)
 
-            stocks = MoySkladDBStock(
-                uuid=good,
-                # Если по какой-то причине остаток товара в МойСклад отрицательный в БД сохраняем 0
-                quantity=ms_good.quantity if ms_good.quantity >= 0 else 0,
+        update_fields = [model_field.name for model_field in MoySkladDBGood._meta.concrete_fields if not model_field.primary_key]
+        with transaction.atomic():
+            MoySkladDBGood.objects.bulk_create(
+                goods, batch_size=batch_size, update_conflicts=True, unique_fields=["uuid"], update_fields=update_fields,
             )
-            try:
-                # Сохраняем товары в таблицу
-                good.save()
-                # Сохраняем остатки в таблицу
-                stocks.save()
-            except IntegrityError as error:
-                # TODO: переделать на логгер или Sentry
-                print(f"\nWARNING! {error.args[1]}")
+            MoySkladDBStock.objects.bulk_create(
+                stocks + changed_stocks,
+                batch_size=batch_size,
+                update_conflicts=True,
+                unique_fields=["uuid"],
+                update_fields=["quantity"],
+            )
+
+        inserted = sum(1 for good in goods if good.uuid not in saved_state)
+        stats.inserted += inserted
+        stats.updated += len(goods) - inserted + len(changed_stocks)
         return True
 
+    @staticmethod
+    def delete_objects_from_db(uuids: Iterable[str]) -> Tuple[int, int]:
+        """Метод убирает из БД товары, удаленные в сервисе МойСклад или перенесенные из папки "Пиво".
+
+        Товары, у которых есть продажи или коды ЕГАИС, не удаляются, а помечаются архивными (is_archived),
+        чтобы история продаж и связи с ЕГАИС сохранились. Отпечаток архивного товара сбрасывается, поэтому
+        вернувшийся в папку "Пиво" товар будет полностью перезаписан и снова станет активным.
+        Остальные товары удаляются.
+        :return: Количество удаленных и количество помеченных архивными товаров.
+        """
+        uuids = list(uuids)
+        if not uuids:
+            return 0, 0
+
+        deleted = archived = 0
+        with transaction.atomic():
+            for start in range(0, len(uuids), LOOKUP_BATCH_SIZE):
+                batch = MoySkladDBGood.objects.filter(uuid__in=uuids[start: start + LOOKUP_BATCH_SIZE])
+                with_history = batch.filter(
+                    Q(moyskladdbretaildemand__isnull=False) | Q(egais_code__isnull=False),
+                ).values_list("uuid", flat=True)
+                archived += MoySkladDBGood.objects.filter(uuid__in=list(with_history)).update(is_archived=True, fingerprint="")
+                deleted += batch.filter(is_archived=False).delete()[1].get(MoySkladDBGood._meta.label, 0)
+        return deleted, archived
+
     def __str__(self):
         return f"{self.brewery} - {self.name}"
 
@@ -170,6 +339,14 @@ class MoySkladDBStock(models.Model):
 class MoySkladDBRetailDemand(models.Model):
     """Класс описывает модель розничной продажи продаж."""
 
+    class Meta:
+        """Ограничения для таблицы."""
+
+        constraints = [
+            # Для каждого товара хранится одна запись о продажах за день
+            models.UniqueConstraint(fields=["uuid", "demand_date"], name="unique_retail_demand_good_date"),
+        ]
+
     # Дата продажи
     demand_date = models.DateField(null=True, blank=True, default=None, help_text="Дата продажи")
 
@@ -185,28 +362,72 @@ class MoySkladDBRetailDemand(models.Model):
     )
 
     @staticmethod
-    def save_objects_to_db(list_retail_demand: List["ms_class.RetailDemandPosition"]) -> bool:
-        """Метод сохраняет объекты, созданные на основе списка list_retail_demand в БД."""
-        if not list_retail_demand:
-            return False
-
-        # Получаем список всех проданного пива
-        sold_goods = MoySkladDBGood.objects.filter(uuid__in=[_.good_id for _ in list_retail_demand])
-        # Чистим таблицу
-        MoySkladDBRetailDemand.objects.all().delete()
-        save_list: List[MoySkladDBRetailDemand] = []
-        # Сохраняем проданные товары
+    def save_objects_to_db(
+        list_retail_demand: List["ms_class.RetailDemandPosition"],
+        demand_dates: Optional[Iterable[Union[str, datetime.date]]] = None,
+    ) -> bool:
+        """Метод сохраняет объекты, созданные на основе списка list_retail_demand в БД.
+
+        Продажи за дни demand_dates заменяются продажами из list_retail_demand: существующие записи обновляются
+        (INSERT ... ON CONFLICT DO UPDATE по товару и дню), лишние удаляются. Продажи за остальные дни не меняются,
+        поэтому повторная загрузка дня безопасна.
+        :param demand_dates: дни, продажи за которые перезаписываются. По умолчанию - дни продаж из list_retail_demand.
+        """
+        if demand_dates is None:
+            demand_dates = {good.demand_date for good in list_retail_demand}
+        demand_dates = list(demand_dates)
+
+        # Товары, которых нет в БД, не сохраняются. Все проданные товары получаем одним запросом
+        sold_goods = MoySkladDBGood.objects.in_bulk({good.good_id for good in list_retail_demand})
+        # Повторы товара за один день суммируются: в таблице одна запись на товар и день
+        sales: Dict[Tuple[str, str], MoySkladDBRetailDemand] = {}
         for good in list_retail_demand:
-            try:
-                save_list.append(
-                    MoySkladDBRetailDemand(
-                        uuid=sold_goods.get(uuid=good.good_id),
-                        quantity=good.quantity,
-                        demand_date=good.demand_date,
-                    ),
-                )
-            except ObjectDoesNotExist:
+            if good.good_id not in sold_goods:
                 continue
-        # Сохраняем продажи в БД
-        MoySkladDBRetailDemand.objects.bulk_create(save_list)
-        return True
+            key = (str(good.demand_date), good.good_id)
+            if key in sales:
+                sales[key].quantity += good.quantity
+            else:
+                sales[key] = MoySkladDBRetailDemand(
+                    uuid=sold_goods[good.good_id], quantity=good.quantity, demand_date=good.demand_date,
+                )
+
+        with transaction.atomic():
+            # Удаляем только продажи за перезаписываемые дни, которых больше нет в сервисе
+            stale_ids = [
+                sale_id
+                for sale_id, demand_date, uuid in MoySkladDBRetailDemand.objects.filter(demand_date__in=demand_dates).values_list(
+                    "id", "demand_date", "uuid",
+                )
+                if (str(demand_date), uuid) not in sales
+            ]
+            MoySkladDBRetailDemand.objects.filter(id__in=stale_ids).delete()
+            # Остальные продажи добавляем или обновляем
+            MoySkladDBRetailDemand.objects.bulk_create(
+                sales.values(),
+                batch_size=BULK_BATCH_SIZE,
+                update_conflicts=True,
+                unique_fields=["uuid", "demand_date"],
+                update_fields=["quantity"],
+            )
+        return bool(list_retail_demand)
+
+
+class MoySkladDBSyncState(models.Model):
+    """Класс описывает состояние последней успешной синхронизации с сервисом МойСклад."""
+
+    # Название синхронизации, например "assortment"
+    name = models.CharField(primary_key=True, max_length=50, help_text="Название синхронизации")
+    # Максимальное значение поля updated среди товаров, обработанных последней успешной синхронизацией
+    watermark = models.DateTimeField(help_text="Время изменения последнего синхронизированного объекта")
+
+    @staticmethod
+    def get_watermark(name: str) -> Optional[datetime.datetime]:
+        """Метод возвращает отметку последней успешной синхронизации. None - если синхронизации еще не было."""
+        state = MoySkladDBSyncState.objects.filter(name=name).first()
+        return state.watermark if state else None
+
+    @staticmethod
+    def set_watermark(name: str, watermark: datetime.datetime) -> None:
+        """Метод сохраняет отметку последней успешной синхронизации."""
+        MoySkladDBSyncState.objects.update_or_create(name=name, defaults={"watermark": watermark})
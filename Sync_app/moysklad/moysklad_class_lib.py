@@ -1,22 +1,53 @@
 """В модуле хранятся описание классов."""
 import datetime
+import hashlib
+import json
 import os
 import re
-from dataclasses import dataclass
-from typing import Any, Dict, List, NamedTuple, Optional, Union
-
-import requests
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from http import HTTPStatus
+from typing import Any, Deque, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from django.core.cache import caches
 from pydantic import BaseModel, Field
 
 import Sync_app.models.moysklad_models as ms_model
+from Sync_app.common.http_cache import RESPONSE_CACHE
 import Sync_app.moysklad.moysklad_urls as ms_urls
 from dotenv import load_dotenv
+from Sync_app.moysklad.moysklad_client import MoySkladClient, TransferStats
 from Sync_app.moysklad.moysklad_constants import (
     _MODIFICATION_SET, _TRASH, Characteristics, GoodType,
 )
+from Sync_app.moysklad.moysklad_parser import PARSER_VERSION, get_tara, parse_name
+from Sync_app.moysklad.moysklad_retail import RetailAggregation
 
 load_dotenv()
 
+# Название синхронизации ассортимента, под которым хранится отметка последней успешной синхронизации
+ASSORTMENT_SYNC_NAME = "assortment"
+
+# Источники розничных продаж: чеки продаж и возвратов или отчет о прибыльности, просуммированный сервисом
+RETAIL_SOURCE_CHECKS = "checks"
+RETAIL_SOURCE_REPORT = "report"
+RETAIL_SOURCES = (RETAIL_SOURCE_CHECKS, RETAIL_SOURCE_REPORT)
+
+# Кэш, общий для всех процессов, и ключ, под которым в нем хранится токен
+SYNC_CACHE = "sync"
+TOKEN_CACHE_KEY = "moysklad_token"
+# Время жизни токена в кэше, в секундах
+TOKEN_TTL = int(os.getenv("MOYSKLAD_TOKEN_TTL", 12 * 60 * 60))
+
+
+class MoySkladRequestError(Exception):
+    """Исключение, возникающее, если сервис МойСклад не вернул страницу данных."""
+
+    pass
+
 
 class RetailDemandPosition(NamedTuple):
     """Класс используется только для позиций проданных товаров."""
@@ -121,6 +152,8 @@ class Good(BaseModel):
     attributes: Optional[List[Attributes]] = Field(alias="attributes")
     # Объем продукции
     volume: Optional[float]
+    # Дата и время последнего изменения карточки товара
+    updated: Optional[datetime.datetime]
 
     @property
     def parent_id(self) -> str:
@@ -132,7 +165,7 @@ class Good(BaseModel):
         return ""
 
     @staticmethod
-    def _is_draft(attr: List[Attributes] = None) -> bool:
+    def _is_draft(attr: Optional[Sequence["AttributeLike"]] = None) -> bool:
         # Если в сервисе у товара определен аттрибут "Розлив", то индекс аттрибута "Алкогольная продукция",
         # в массиве аттрибутов будет 1, если не определен, то индекс будет 0. это происходит т.к. аттрибут
         # "Алкогольная продукция", является обязательным для всех товаров
@@ -158,7 +191,7 @@ class Good(BaseModel):
         return in_str
 
     @staticmethod
-    def _remove_modification_from_name(name: str = "", modification: List[Modification] = None) -> str:
+    def _remove_modification_from_name(name: str = "", modification: Optional[Sequence["ModificationLike"]] = None) -> str:
         """Метод удаляет из входной строки название модификации "Тара", определенных в _MODIFICATION_SET()."""
         if modification:
             for mod in modification:
@@ -167,7 +200,7 @@ class Good(BaseModel):
         return name
 
     @staticmethod
-    def _get_capacity(cap: float = None, modification: List[Modification] = None) -> float:
+    def _get_capacity(cap: Optional[float] = None, modification: Optional[Sequence["ModificationLike"]] = None) -> float:
         """Метод возвращает объем продукции."""
         # Модификации в сервисе не имеют аттрибут объем, но название модификации будет иметь вид
         # Alaska - Нигилист (Lager - IPL (India Pale Lager). OG 16%, ABV 6,8%, IBU 60) (Название модификации)
@@ -307,32 +340,120 @@ class Good(BaseModel):
 
         return good
 
+    def fingerprint(self) -> str:
+        """Метод возвращает отпечаток полей карточки товара, от которых зависит запись товара в БД."""
+        return self._get_fingerprint(
+            name=self.name,
+            price=self.price,
+            path_name=self.path_name,
+            parent_id=self.parent_id,
+            modifications=self.modifications,
+            attributes=self.attributes,
+            volume=self.volume,
+        )
+
+    @staticmethod
+    def _get_fingerprint(
+        name: str,
+        price: Sequence["PriceLike"],
+        path_name: Optional[str],
+        parent_id: str,
+        modifications: Optional[Sequence["ModificationLike"]],
+        attributes: Optional[Sequence["AttributeLike"]],
+        volume: Optional[float],
+    ) -> str:
+        """Метод возвращает отпечаток (sha1) полей товара. Используется и pydantic моделью, и GoodRecord.
+
+        Если отпечаток совпадает с сохраненным в БД, товар не разбирается и не перезаписывается.
+        Остаток в отпечаток не входит и сверяется отдельно.
+        """
+        raw = json.dumps(
+            [
+                PARSER_VERSION,
+                name,
+                [price_.value for price_ in price],
+                path_name or "",
+                parent_id,
+                [[mod.name, mod.value] for mod in modifications] if modifications is not None else None,
+                [[attr.name, attr.value] for attr in attributes] if attributes is not None else None,
+                volume,
+            ],
+            ensure_ascii=False,
+        )
+        return hashlib.sha1(raw.encode()).hexdigest()
+
     def _parse_object(self) -> GoodTuple:
-        if self.name:
-            full_name = self._remove_modification_from_name(name=self.name, modification=self.modifications)
-            full_name = self._remove_trash_from_string(full_name)
+        return self._parse_fields(
+            name=self.name,
+            modifications=self.modifications,
+            path_name=self.path_name,
+            attributes=self.attributes,
+            volume=self.volume,
+        )
+
+    @staticmethod
+    def _parse_fields(
+        name: str,
+        modifications: Optional[Sequence["ModificationLike"]],
+        path_name: Optional[str],
+        attributes: Optional[Sequence["AttributeLike"]],
+        volume: Optional[float],
+    ) -> GoodTuple:
+        """Метод раскладывает поля товара на составные части. Используется и pydantic моделью, и GoodRecord.
+
+        Наименование разбирается однопроходным парсером parse_name(), результаты которого запоминаются.
+        """
+        parsed_name = parse_name(name, tara=get_tara(modifications), path_name=path_name or "")
+        if not name:
+            return GoodTuple()
 
-            additional_info = self._get_additional_info(f_name=full_name)
-            bev_type = self._get_good_type(additional_info)
+        return GoodTuple(
+            brewery=parsed_name.brewery,
+            name=parsed_name.name,
+            style=parsed_name.style,
+            og=parsed_name.og,
+            abv=parsed_name.abv,
+            ibu=parsed_name.ibu,
+            is_alco=parsed_name.is_alco,
+            bev_type=parsed_name.bev_type,
+            is_draft=Good._is_draft(attr=attributes),
+            capacity=Good._get_capacity(cap=volume, modification=modifications),
+        )
 
-            style = self._get_style(additional_info)
-            abv = self._get_characteristics(type_=Characteristics.ABV, add_info=additional_info)
+    @staticmethod
+    def _parse_fields_by_steps(
+        name: str,
+        modifications: Optional[Sequence["ModificationLike"]],
+        path_name: Optional[str],
+        attributes: Optional[Sequence["AttributeLike"]],
+        volume: Optional[float],
+    ) -> GoodTuple:
+        """Метод пошагового разбора полей товара. Эталон, с которым сверяется parse_name() (Sync_app/tests.py)."""
+        if name:
+            full_name = Good._remove_modification_from_name(name=name, modification=modifications)
+            full_name = Good._remove_trash_from_string(full_name)
+
+            additional_info = Good._get_additional_info(f_name=full_name)
+            bev_type = Good._get_good_type(additional_info)
+
+            style = Good._get_style(additional_info)
+            abv = Good._get_characteristics(type_=Characteristics.ABV, add_info=additional_info)
             is_alco = True if abv > 1 else False
-            og = self._get_characteristics(type_=Characteristics.OG, add_info=additional_info)
-            ibu = self._get_characteristics(type_=Characteristics.IBU, add_info=additional_info)
-            brewery = self._get_brewery(
+            og = Good._get_characteristics(type_=Characteristics.OG, add_info=additional_info)
+            ibu = Good._get_characteristics(type_=Characteristics.IBU, add_info=additional_info)
+            brewery = Good._get_brewery(
                 f_name=full_name,
                 add_info=additional_info,
-                parent_path=self.path_name if self.path_name else "",
+                parent_path=path_name if path_name else "",
             )
-            name = self._get_name(f_name=full_name, add_info=additional_info, brewery=brewery)
+            good_name = Good._get_name(f_name=full_name, add_info=additional_info, brewery=brewery)
 
-            is_draft = self._is_draft(attr=self.attributes)
-            capacity = self._get_capacity(cap=dict(self).get("volume"), modification=self.modifications)
+            is_draft = Good._is_draft(attr=attributes)
+            capacity = Good._get_capacity(cap=volume, modification=modifications)
 
             return GoodTuple(
                 brewery=brewery,
-                name=name,
+                name=good_name,
                 style=style,
                 og=og,
                 abv=abv,
@@ -345,6 +466,113 @@ class Good(BaseModel):
         return GoodTuple()
 
 
+class ModificationRecord(NamedTuple):
+    """Облегченная запись модификации товара. Аналог Modification без валидации."""
+
+    name: str
+    value: str
+
+
+class AttributeRecord(NamedTuple):
+    """Облегченная запись пользовательского аттрибута товара. Аналог Attributes без валидации."""
+
+    name: str
+    value: Union[bool, str]
+
+
+class PriceRecord(NamedTuple):
+    """Облегченная запись цены товара. Аналог Price без валидации."""
+
+    value: int
+
+
+class GoodRecord(NamedTuple):
+    """Облегченная запись товара из ассортимента МойСклад.
+
+    В отличие от Good, не проверяет строку ответа целиком, а забирает из нее только поля, используемые
+    при синхронизации. Атрибуты записи совпадают с атрибутами Good, поэтому запись можно передавать туда же,
+    куда передается Good.
+    """
+
+    # Уникальный идентификатор товара
+    good_id: str
+    # Наименование товара
+    name: str
+    # Количество товара, может отсутствовать, если товар - комплект
+    quantity: Optional[int]
+    # Имя папки товара. У модификаций отсутствует
+    path_name: Optional[str]
+    # Первый элемент - розничная цена * 100
+    price: Tuple[PriceRecord, ...]
+    # Поле модификации в карточке товара
+    modifications: Optional[Tuple[ModificationRecord, ...]]
+    # uuid родительского товара. Применимо только для модификаций товаров
+    parent_id: str
+    # Дополнительные, пользовательские аттрибуты для товара
+    attributes: Optional[Tuple[AttributeRecord, ...]]
+    # Объем продукции
+    volume: Optional[float]
+    # Дата и время последнего изменения карточки товара
+    updated: Optional[datetime.datetime]
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "GoodRecord":
+        """Метод создает запись из строки JSON ответа сервиса."""
+        characteristics = row.get("characteristics")
+        attributes = row.get("attributes")
+        parent = row.get("product")
+        updated = row.get("updated")
+        quantity = row.get("quantity")
+        volume = row.get("volume")
+        return cls(
+            good_id=row["id"],
+            name=row["name"],
+            quantity=int(quantity) if quantity is not None else None,
+            path_name=row.get("pathName"),
+            price=tuple(PriceRecord(int(price["value"])) for price in row["salePrices"]),
+            modifications=tuple(ModificationRecord(mod["name"], mod["value"]) for mod in characteristics)
+            if characteristics is not None
+            else None,
+            # Ссылка на товар хранится в виде
+            # https://online.moysklad.ru/app/#good/edit?id=09f5f652-269e-11ec-0a80-02c5000e4cc9
+            parent_id=parent["meta"]["uuidHref"].split("?id=")[1] if parent else "",
+            attributes=tuple(AttributeRecord(attr["name"], attr["value"]) for attr in attributes)
+            if attributes is not None
+            else None,
+            volume=float(volume) if volume is not None else None,
+            updated=datetime.datetime.fromisoformat(updated) if updated else None,
+        )
+
+    def fingerprint(self) -> str:
+        """Метод возвращает отпечаток полей карточки товара, от которых зависит запись товара в БД."""
+        return Good._get_fingerprint(
+            name=self.name,
+            price=self.price,
+            path_name=self.path_name,
+            parent_id=self.parent_id,
+            modifications=self.modifications,
+            attributes=self.attributes,
+            volume=self.volume,
+        )
+
+    def parse_object(self) -> GoodTuple:
+        """Метод возвращает объект типа GoodTuple."""
+        return Good._parse_fields(
+            name=self.name,
+            modifications=self.modifications,
+            path_name=self.path_name,
+            attributes=self.attributes,
+            volume=self.volume,
+        )
+
+
+# Модификация, аттрибут, цена и товар могут быть как pydantic моделями, так и облегченными записями
+ModificationLike = Union[Modification, ModificationRecord]
+PriceLike = Union[Price, PriceRecord]
+AttributeLike = Union[Attributes, AttributeRecord]
+GoodLike = Union[Good, GoodRecord]
+
+
 class Position(BaseModel):
     """Класс описывает единицу товара, входящей в продажу."""
 
@@ -383,25 +611,39 @@ class MoySklad:
     # токен для работы с сервисом
     # https://dev.moysklad.ru/doc/api/remap/1.2/#mojsklad-json-api-obschie-swedeniq-autentifikaciq
     _token: str = ""
+    # блокировка, чтобы при одновременных ответах 401 токен обновлялся один раз
+    _token_lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+    # HTTP клиент с пулом соединений, через который выполняются все запросы к сервису
+    _client: MoySkladClient = field(default_factory=MoySkladClient, repr=False, compare=False)
+    # True - строки ассортимента проверяются pydantic моделью Good, False - разбираются в облегченные GoodRecord
+    validate: bool = False
+    # True - продажи и возвраты запрашиваются без карточек товаров, товары берутся из БД по id
+    lean_retail: bool = False
+    # источник розничных продаж: RETAIL_SOURCE_CHECKS или RETAIL_SOURCE_REPORT
+    retail_source: str = RETAIL_SOURCE_CHECKS
+    # количество пропущенных, обновленных и добавленных в БД товаров
+    save_stats: ms_model.SaveStats = field(default_factory=ms_model.SaveStats, compare=False)
+
+    def _parse_good(self, row: Dict[str, Any]) -> GoodLike:
+        """Метод возвращает товар, разобранный из строки ответа сервиса."""
+        return Good(**row) if self.validate else GoodRecord.from_row(row)
 
-    @staticmethod
-    def _exclude_returned_goods(
-            sold_goods: list[RetailDemandPosition], returned_goods: list[RetailReturnedPosition],
-    ) -> list[RetailDemandPosition]:
-        """Метод удаляет количество товара из списка returned_goods, в списке sold_goods."""
-        sold_goods_dict = {good.good_id: good for good in sold_goods}
-        for ret in returned_goods:
-            if sold_goods := sold_goods_dict.get(ret.good_id):
-                if sold_goods.quantity - ret.quantity < 1:
-                    del sold_goods_dict[ret.good_id]
-                else:
-                    sold_goods_dict[ret.good_id] = sold_goods._replace(quantity=(sold_goods.quantity - ret.quantity))
-        return list(sold_goods_dict.values())
+    @property
+    def transfer_stats(self) -> TransferStats:
+        """Статистика запросов к сервису: количество запросов, объем полученных данных и время."""
+        return self._client.stats
+
+    @property
+    def endpoint_transfer_stats(self) -> Dict[str, TransferStats]:
+        """Статистика запросов к сервису по endpoint'ам."""
+        return self._client.endpoint_stats
 
     def set_token(self, request_new: bool = True) -> bool:
         """Получение токена для доступа и работы с МС по JSON API 1.2. При успешном ответе возвращаем True, в случае ошибок False.
 
-        :param request_new: True, каждый раз будет запрашиваться новый токен,
+        Полученный токен сохраняется в общий для всех процессов кэш и используется повторно, пока не истечет
+        срок MOYSKLAD_TOKEN_TTL или пока сервис не ответит 401.
+        :param request_new: True, токен берется из кэша, а если его там нет - запрашивается новый,
             если False будет браться из moysklad_privatedata.py
         """
         if self._token:
@@ -409,6 +651,11 @@ class MoySklad:
 
         # если необходимо запросить новый токен у сервиса
         if request_new:
+            cached_token: Optional[str] = caches[SYNC_CACHE].get(TOKEN_CACHE_KEY)
+            if cached_token:
+                self._token = cached_token
+                return True
+
             # Получаем url запроса
             url: ms_urls.MoySkladUrl = ms_urls.get_url(
                 ms_urls.UrlType.TOKEN,
@@ -420,28 +667,129 @@ class MoySklad:
             header: Dict[str, Any] = ms_urls.get_headers(self._token)
 
             # отправляем запрос в МС для получения токена
-            response = requests.post(url.url, headers=header)
+            response = self._client.post(url.url, headers=header)
             # если получили ответ
             if response.ok:
                 # сохраняем токен
                 self._token = response.json()["access_token"]
+                caches[SYNC_CACHE].set(TOKEN_CACHE_KEY, self._token, timeout=TOKEN_TTL)
             else:
                 return False
         else:
             self._token = os.getenv("MOYSKLAD_TOKEN")
         return True
 
-    def get_assortment(self) -> List[Good]:
-        """Функция получения ассортимента товаров."""
+    def _refresh_token(self, stale_token: str) -> bool:
+        """Метод заменяет токен stale_token, на который сервис ответил 401, новым токеном.
+
+        Если токен уже заменен другим потоком, повторно не запрашивается.
+        """
+        with self._token_lock:
+            if self._token != stale_token:
+                return bool(self._token)
+            # Удаляем токен из кэша, только если другой процесс еще не положил туда новый
+            if caches[SYNC_CACHE].get(TOKEN_CACHE_KEY) == stale_token:
+                caches[SYNC_CACHE].delete(TOKEN_CACHE_KEY)
+            self._token = ""
+            return self.set_token(request_new=True)
+
+    def _get_page(self, url: ms_urls.MoySkladUrl) -> Optional[Dict[str, Any]]:
+        """Метод возвращает JSON ответ сервиса на запрос одной страницы. None - в случае ошибки.
+
+        Если включен кэш ответов, ответ берется из кэша.
+        """
+        return RESPONSE_CACHE.get_or_fetch(url.url, url.request_filter, lambda: self._request_page(url))
+
+    def _request_page(self, url: ms_urls.MoySkladUrl) -> Optional[Dict[str, Any]]:
+        """Метод запрашивает у сервиса одну страницу и возвращает JSON ответ. None - в случае ошибки.
+
+        Запросы выполняются клиентом _client через общий ограничитель частоты: ответы 429 повторяются после паузы,
+        указанной сервисом. Если сервис ответил 401, токен обновляется и запрос повторяется один раз.
+        """
+        token = self._token
+        response = self._client.get(url.url, url.request_filter, headers=ms_urls.get_headers(token))
+        if response.status_code == HTTPStatus.UNAUTHORIZED and self._refresh_token(stale_token=token):
+            response = self._client.get(url.url, url.request_filter, headers=ms_urls.get_headers(self._token))
+        if not response.ok:
+            return None
+        return response.json()
+
+    def _get_all_rows_parallel(
+        self,
+        _type: ms_urls.UrlType,
+        limit: int,
+        workers: int,
+        start_period: Optional[datetime.date] = None,
+        end_period: Optional[datetime.date] = None,
+        updated_from: Optional[datetime.datetime] = None,
+        lean: bool = False,
+        ids: Optional[Sequence[str]] = None,
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Метод возвращает строки всех страниц запроса, запрашивая страницы параллельно.
+
+        Первая страница запрашивается отдельно, из ее meta.size определяется общее количество строк. Оставшиеся
+        смещения запрашиваются одновременно на пуле из workers потоков. Страницы склеиваются в порядке смещений,
+        поэтому результат совпадает с последовательным обходом.
+        :param _type: тип запрашиваемых данных.
+        :param limit: размер страницы.
+        :param workers: максимальное количество одновременных запросов.
+        :param updated_from: если указан, запрашиваются только объекты, измененные начиная с этого момента.
+        :param lean: True - продажи запрашиваются без карточек товаров.
+        :param ids: id запрашиваемых товаров для UrlType.ASSORTMENT_BY_ID.
+        :return: Список строк. None - если хотя бы одна страница не получена или количество полученных строк
+            не совпадает с meta.size.
+        """
+        def get_page(offset: int) -> Optional[Dict[str, Any]]:
+            url: ms_urls.MoySkladUrl = ms_urls.get_url(
+                _type,
+                start_period=start_period,
+                end_period=end_period,
+                offset=offset,
+                updated_from=updated_from,
+                lean=lean,
+                ids=ids,
+            )
+            return self._get_page(url)
+
+        first_page = get_page(0)
+        if first_page is None:
+            return None
+
+        rows: List[Dict[str, Any]] = first_page.get("rows", [])
+        size: int = first_page.get("meta", {}).get("size", len(rows))
+
+        offsets = range(limit, size, limit)
+        if offsets:
+            with ThreadPoolExecutor(max_workers=max(1, min(workers, len(offsets)))) as pool:
+                # map возвращает результаты в порядке смещений, а не в порядке завершения запросов
+                for page in pool.map(get_page, offsets):
+                    if page is None:
+                        return None
+                    rows.extend(page.get("rows", []))
+
+        # Если во время запроса страниц данные изменились, строки могут задвоиться или потеряться
+        if len(rows) != size:
+            return None
+        return rows
+
+    def get_assortment(self, workers: int = 1) -> List[GoodLike]:
+        """Функция получения ассортимента товаров.
+
+        :param workers: количество одновременных запросов страниц. Если 1 - страницы запрашиваются последовательно.
+        """
         if not self._token:
             return []
+
+        if workers > 1:
+            rows = self._get_all_rows_parallel(ms_urls.UrlType.ASSORTMENT, limit=ms_urls.ASSORTMENT_LIMIT, workers=workers)
+            if rows is None:
+                return []
+            return [self._parse_good(good) for good in rows]
+
         # Т.к. сервис отдает список товаров страницами по 1000, то при запросе
         # необходимо указывать смещение.
         counter: int = 0  # счетчик количества запросов
 
-        # Получаем заголовки для запроса в сервис
-        header: Dict[str, Any] = ms_urls.get_headers(self._token)
-
         need_request: bool = True
         goods: List[Dict[str, Any]] = []
 
@@ -451,156 +799,448 @@ class MoySklad:
                 ms_urls.UrlType.ASSORTMENT,
                 start_period=None,
                 end_period=None,
-                offset=counter * 1000,
+                offset=counter * ms_urls.ASSORTMENT_LIMIT,
             )
 
-            response = requests.get(url.url, url.request_filter, headers=header)
-            if not response.ok:
+            page = self._get_page(url)
+            if page is None:
                 return []
 
-            rows: List[Dict[str, Any]] = response.json().get("rows")
+            page_rows: List[Dict[str, Any]] = page.get("rows") or []
             # Проверяем получили ли в ответе не пустой список товаров из
             # ассортимента
-            if len(rows) == 1000:
+            if len(page_rows) == ms_urls.ASSORTMENT_LIMIT:
                 counter += 1  # увеличиваем счетчик смещений
             # Если список товаров меньше 1000, то сбрасываем флаг о
             # необходимости дополнительных запросов
-            elif len(rows) < 1000:
+            elif len(page_rows) < ms_urls.ASSORTMENT_LIMIT:
                 need_request = False
             # Добавляем новые товары к существующим, расширяем список
-            goods.extend(rows)
+            goods.extend(page_rows)
 
-        return [Good(**good) for good in goods]
+        return [self._parse_good(good) for good in goods]
 
-    def sync_assortment(self) -> bool:
-        """Метод заполняет БД товарами из сервиса МойСклад."""
-        # Получаем токен для работы с сервисом МойСклад
-        if not self.set_token(request_new=True):
-            return False
+    def iter_assortment(self, workers: int = 1) -> Iterator[List[GoodLike]]:
+        """Генератор ассортимента товаров, отдающий товары постранично.
+
+        Пока вызывающий код обрабатывает текущую страницу (например, пишет ее в БД), следующие страницы уже
+        запрашиваются в фоне. В памяти одновременно находятся только страницы, запрошенные заранее.
+        :param workers: количество страниц, запрашиваемых заранее. Минимум - 1.
+        :raises MoySkladRequestError: если не удалось получить очередную страницу.
+        """
+        if not self._token:
+            return
+
+        def get_page(offset: int) -> Optional[Dict[str, Any]]:
+            url: ms_urls.MoySkladUrl = ms_urls.get_url(
+                ms_urls.UrlType.ASSORTMENT,
+                start_period=None,
+                end_period=None,
+                offset=offset,
+            )
+            return self._get_page(url)
+
+        first_page = get_page(0)
+        if first_page is None:
+            raise MoySkladRequestError("Не удалось получить первую страницу ассортимента.")
+
+        rows: List[Dict[str, Any]] = first_page.get("rows", [])
+        size: int = first_page.get("meta", {}).get("size", len(rows))
+        offsets = iter(range(ms_urls.ASSORTMENT_LIMIT, size, ms_urls.ASSORTMENT_LIMIT))
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            pending: Deque[Future[Optional[Dict[str, Any]]]] = deque()
+
+            def fill() -> None:
+                while len(pending) < max(1, workers):
+                    offset = next(offsets, None)
+                    if offset is None:
+                        return
+                    pending.append(pool.submit(get_page, offset))
+
+            fill()
+            yield [self._parse_good(good) for good in rows]
+
+            while pending:
+                page = pending.popleft().result()
+                if page is None:
+                    raise MoySkladRequestError("Не удалось получить страницу ассортимента.")
+                fill()
+                yield [self._parse_good(good) for good in page.get("rows", [])]
+
+    def get_assortment_changes(
+        self, since: datetime.datetime, workers: int = 1,
+    ) -> Optional[Tuple[List[GoodLike], List[str]]]:
+        """Метод возвращает товары, измененные с момента since.
+
+        :param since: момент, начиная с которого запрашиваются изменения.
+        :param workers: количество одновременных запросов страниц.
+        :return: Кортеж (товары из папки "Пиво", измененные с момента since; uuid товаров, измененных с момента since,
+            но находящихся вне папки "Пиво"). None - в случае ошибки.
+        """
+        if not self._token:
+            return None
+
+        changed_rows = self._get_all_rows_parallel(
+            ms_urls.UrlType.ASSORTMENT, limit=ms_urls.ASSORTMENT_LIMIT, workers=workers, updated_from=since,
+        )
+        # При переносе товара в другую папку у товара меняется поле updated, поэтому перенесенные из папки "Пиво"
+        # товары находятся среди всех измененных товаров, не попавших в выборку по папке
+        all_changed_rows = self._get_all_rows_parallel(
+            ms_urls.UrlType.ASSORTMENT_CHANGES, limit=ms_urls.ASSORTMENT_LIMIT, workers=workers, updated_from=since,
+        )
+        if changed_rows is None or all_changed_rows is None:
+            return None
+
+        changed_goods = [self._parse_good(good) for good in changed_rows]
+        changed_ids = {good.good_id for good in changed_goods}
+        moved_out_ids = [row["id"] for row in all_changed_rows if row["id"] not in changed_ids]
+        return changed_goods, moved_out_ids
+
+    def get_deleted_ids(self, since: datetime.datetime) -> Optional[List[str]]:
+        """Метод возвращает uuid товаров и модификаций, удаленных с момента since. None - в случае ошибки.
+
+        Удаления берутся из аудита: контексты аудита с событиями удаления, а затем события каждого контекста.
+        """
+        if not self._token:
+            return None
+
+        contexts = self._get_all_rows_parallel(
+            ms_urls.UrlType.AUDIT_DELETED, limit=ms_urls.AUDIT_LIMIT, workers=1, updated_from=since,
+        )
+        if contexts is None:
+            return None
+
+        deleted_ids: List[str] = []
+        for context in contexts:
+            events_href = context.get("events", {}).get("meta", {}).get("href")
+            if not events_href:
+                continue
+            events = self._get_page(ms_urls.MoySkladUrl(events_href, {}))
+            if events is None:
+                return None
+            for event in events.get("rows", []):
+                if event.get("eventType") != "delete":
+                    continue
+                # Ссылка на сущность хранится в виде https://online.moysklad.ru/api/remap/1.2/entity/product/<uuid>
+                entity_href: str = event.get("entity", {}).get("meta", {}).get("href", "")
+                if entity_href:
+                    deleted_ids.append(entity_href.rstrip("/").split("/")[-1])
+        return deleted_ids
+
+    @staticmethod
+    def _get_watermark(goods: List[GoodLike], watermark: Optional[datetime.datetime]) -> Optional[datetime.datetime]:
+        """Метод возвращает максимальное значение updated среди товаров goods и текущей отметки watermark."""
+        updated = [good.updated for good in goods if good.updated is not None]
+        if watermark is not None:
+            updated.append(watermark)
+        return max(updated) if updated else None
+
+    def _sync_assortment_full(self, workers: int, stream: bool) -> Tuple[bool, Optional[datetime.datetime]]:
+        """Метод загружает весь ассортимент папки "Пиво" и возвращает признак успеха и новую отметку синхронизации."""
+        watermark: Optional[datetime.datetime] = None
+
+        if stream:
+            saved: bool = False
+            try:
+                for ms_goods_page in self.iter_assortment(workers=workers):
+                    if ms_goods_page:
+                        saved = ms_model.MoySkladDBGood.save_objects_to_db(list_ms_goods=ms_goods_page, stats=self.save_stats) or saved
+                        watermark = self._get_watermark(ms_goods_page, watermark)
+            except MoySkladRequestError:
+                return False, None
+            return saved, watermark
 
         # Получаем ассортимент из МойСклад
-        ms_goods = self.get_assortment()
+        ms_goods = self.get_assortment(workers=workers)
         # Обновляем БД объектами ассортимента МойСклад
         if not ms_goods:
+            return False, None
+
+        saved = ms_model.MoySkladDBGood.save_objects_to_db(list_ms_goods=ms_goods, stats=self.save_stats)
+        return saved, self._get_watermark(ms_goods, None)
+
+    def _sync_assortment_incremental(
+        self, since: datetime.datetime, workers: int,
+    ) -> Tuple[bool, Optional[datetime.datetime]]:
+        """Метод загружает изменения ассортимента с момента since и возвращает признак успеха и новую отметку синхронизации."""
+        changes = self.get_assortment_changes(since=since, workers=workers)
+        deleted_ids = self.get_deleted_ids(since=since)
+        if changes is None or deleted_ids is None:
+            return False, None
+
+        changed_goods, moved_out_ids = changes
+        if changed_goods and not ms_model.MoySkladDBGood.save_objects_to_db(list_ms_goods=changed_goods, stats=self.save_stats):
+            return False, None
+
+        ms_model.MoySkladDBGood.delete_objects_from_db(uuids=set(moved_out_ids) | set(deleted_ids))
+        return True, self._get_watermark(changed_goods, since)
+
+    def sync_assortment(self, workers: int = 1, stream: bool = False, incremental: bool = False) -> bool:
+        """Метод заполняет БД товарами из сервиса МойСклад.
+
+        По умолчанию загружается весь ассортимент, вместе с актуальными остатками всех товаров.
+        :param workers: количество одновременных запросов страниц ассортимента.
+        :param stream: True - товары пишутся в БД постранично, по мере получения страниц. Только для полной синхронизации.
+        :param incremental: True - если синхронизация уже выполнялась, загрузить только товары, измененные после
+            последней успешной синхронизации. Движение товара по складу не меняет его поле updated, поэтому остатки
+            неизмененных товаров при такой синхронизации не обновляются.
+        """
+        # Получаем токен для работы с сервисом МойСклад
+        if not self.set_token(request_new=True):
             return False
 
-        return ms_model.MoySkladDBGood.save_objects_to_db(list_ms_goods=ms_goods)
+        since = ms_model.MoySkladDBSyncState.get_watermark(ASSORTMENT_SYNC_NAME) if incremental else None
 
-    def sync_retail_demand(self, date_: datetime.date) -> bool:
-        """Метод импортирует товары из сервиса МойСклад, проданные за текущую дату."""
-        # Получаем токен для работы с сервисом МойСклад
-        if not self.set_token(request_new=True):
+        if since is None:
+            saved, watermark = self._sync_assortment_full(workers=workers, stream=stream)
+        else:
+            saved, watermark = self._sync_assortment_incremental(since=since, workers=workers)
+
+        if saved and watermark is not None:
+            ms_model.MoySkladDBSyncState.set_watermark(ASSORTMENT_SYNC_NAME, watermark)
+        return saved
+
+    def sync_retail_demand(self, date_: datetime.date, workers: int = 1) -> bool:
+        """Метод импортирует товары из сервиса МойСклад, проданные за текущую дату.
+
+        :param workers: количество одновременных запросов страниц продаж и возвратов.
+        """
+        return self.sync_retail_demand_range(start_date=date_, end_date=date_, workers=workers)
+
+    def _get_retail_day(self, date_: datetime.date, workers: int = 1) -> Optional[List[RetailDemandPosition]]:
+        """Метод возвращает товары, проданные за день date_, за вычетом возвратов. None - в случае ошибки.
+
+        :param workers: количество одновременных запросов страниц продаж и возвратов.
+        """
+        sold_goods = self._aggregate_retail_by_period(
+            start_period=date_, end_period=None, data_type=ms_urls.UrlType.RETAIL_DEMAND, workers=workers,
+        )
+        returned_goods = self._aggregate_retail_by_period(
+            start_period=date_, end_period=None, data_type=ms_urls.UrlType.RETAIL_RETURN, workers=workers,
+        )
+        if sold_goods is None or returned_goods is None:
+            return None
+
+        # Возврат вычитается только из продаж за тот же день
+        return sold_goods.subtract(returned_goods).to_positions(RetailDemandPosition)
+
+    def sync_retail_demand_range(self, start_date: datetime.date, end_date: datetime.date, workers: int = 1) -> bool:
+        """Метод импортирует товары, проданные за каждый день периода start_date - end_date.
+
+        Дни запрашиваются одновременно, не более workers дней за раз. Оставшиеся потоки используются для
+        одновременного запроса страниц внутри дня. Продажи каждого дня группируются по дате создания чека
+        и сохраняются в БД независимо: перезаписываются только продажи за дни периода.
+        Если источник продаж - отчет (retail_source), продажи каждого дня берутся из отчета о прибыльности.
+        В облегченном режиме (lean_retail) и при получении продаж из отчета проданные товары, которых еще нет в БД,
+        запрашиваются и сохраняются отдельно.
+        :return: True, если удалось получить и сохранить все дни периода.
+        """
+        if start_date > end_date or not self.set_token(request_new=True):
             return False
 
-        # Получаем ассортимент из МойСклад
-        ms_sold_goods = self.get_retail_demand_by_period(
-            start_period=date_,
-            end_period=None,
+        days = [start_date + datetime.timedelta(days=day) for day in range((end_date - start_date).days + 1)]
+        days_by_date: Dict[str, List[RetailDemandPosition]] = {day.strftime("%Y-%m-%d"): [] for day in days}
+        failed_days: List[str] = []
+
+        get_retail_day = partial(
+            self._get_retail_report_day if self.retail_source == RETAIL_SOURCE_REPORT else self._get_retail_day,
+            workers=max(1, workers // len(days)),
         )
 
-        ms_returned_goods = self.get_retail_sales_return_by_period(
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(days)))) as pool:
+            for day, day_goods in zip(days, pool.map(get_retail_day, days)):
+                if day_goods is None:
+                    failed_days.append(day.strftime("%Y-%m-%d"))
+                    continue
+                for good in day_goods:
+                    # Чек, созданный за пределами периода, не должен перезаписывать продажи за другой день
+                    if good.demand_date in days_by_date:
+                        days_by_date[good.demand_date].append(good)
+
+        # Дни, которые не удалось получить, не трогаем, чтобы не потерять ранее сохраненные продажи
+        for failed_day in failed_days:
+            del days_by_date[failed_day]
+
+        # В облегченном режиме и в отчете карточек товаров нет, товары, которых еще нет в БД, запрашиваются отдельно
+        goods_resolved = True
+        if self.lean_retail or self.retail_source == RETAIL_SOURCE_REPORT:
+            good_ids = {good.good_id for day_goods in days_by_date.values() for good in day_goods}
+            goods_resolved = self._save_unknown_goods(good_ids=good_ids, workers=workers)
+
+        for demand_date, day_goods in days_by_date.items():
+            ms_model.MoySkladDBRetailDemand.save_objects_to_db(list_retail_demand=day_goods, demand_dates=[demand_date])
+
+        return not failed_days and goods_resolved
+
+    def _get_retail_report_day(self, date_: datetime.date, workers: int = 1) -> Optional[List[RetailDemandPosition]]:
+        """Метод возвращает товары, проданные за день date_, за вычетом возвратов, по отчету о прибыльности.
+
+        Продажи и возвраты суммирует сервис, поэтому чеки не загружаются. None - в случае ошибки.
+        :param workers: количество одновременных запросов страниц отчета.
+        """
+        if not self._token:
+            return None
+
+        rows = self._get_all_rows_parallel(
+            ms_urls.UrlType.PROFIT_BY_VARIANT,
+            limit=ms_urls.REPORT_LIMIT,
+            workers=workers,
             start_period=date_,
-            end_period=None,
+            end_period=date_,
         )
+        if rows is None:
+            return None
+        aggregation = RetailAggregation().add_report_rows(rows, demand_date=date_.strftime("%Y-%m-%d"))
+        return aggregation.to_positions(RetailDemandPosition)
+
+    def verify_retail_report(
+        self, start_date: datetime.date, end_date: datetime.date, workers: int = 1,
+    ) -> Optional[Dict[Tuple[str, str], Tuple[int, int]]]:
+        """Метод сверяет продажи за каждый день периода, полученные из чеков и из отчета о прибыльности.
+
+        Из чеков учитываются только продажи, созданные в тот же день.
+        :return: Расхождения {(id товара, день): (количество по чекам, количество по отчету)}.
+            None - если не удалось получить продажи хотя бы за один день.
+        """
+        if start_date > end_date or not self.set_token(request_new=True):
+            return None
+
+        mismatches: Dict[Tuple[str, str], Tuple[int, int]] = {}
+        for day in (start_date + datetime.timedelta(days=day) for day in range((end_date - start_date).days + 1)):
+            by_checks = self._get_retail_day(day, workers=workers)
+            by_report = self._get_retail_report_day(day, workers=workers)
+            if by_checks is None or by_report is None:
+                return None
+
+            demand_date = day.strftime("%Y-%m-%d")
+            checks = {good.good_id: good.quantity for good in by_checks if good.demand_date == demand_date}
+            report = {good.good_id: good.quantity for good in by_report}
+            for good_id in checks.keys() | report.keys():
+                if checks.get(good_id, 0) != report.get(good_id, 0):
+                    mismatches[(good_id, demand_date)] = (checks.get(good_id, 0), report.get(good_id, 0))
+        return mismatches
+
+    def get_assortment_by_ids(self, ids: Sequence[str], workers: int = 1) -> Optional[List[GoodLike]]:
+        """Метод возвращает товары папки "Пиво" с id из списка ids. None - в случае ошибки.
+
+        Товары запрашиваются частями по ASSORTMENT_IDS_LIMIT id, части запрашиваются одновременно.
+        """
+        chunks = [ids[start: start + ms_urls.ASSORTMENT_IDS_LIMIT] for start in range(0, len(ids), ms_urls.ASSORTMENT_IDS_LIMIT)]
+        if not chunks:
+            return []
 
-        # Обновляем БД объектами ассортимента МойСклад
-        if not ms_sold_goods:
-            return False
+        def get_chunk(chunk: Sequence[str]) -> Optional[List[Dict[str, Any]]]:
+            return self._get_all_rows_parallel(ms_urls.UrlType.ASSORTMENT_BY_ID, limit=ms_urls.ASSORTMENT_LIMIT, workers=1, ids=chunk)
 
-        if ms_returned_goods:
-            ms_sold_goods = self._exclude_returned_goods(sold_goods=ms_sold_goods, returned_goods=ms_returned_goods)
+        goods: List[GoodLike] = []
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(chunks)))) as pool:
+            for rows in pool.map(get_chunk, chunks):
+                if rows is None:
+                    return None
+                goods.extend(self._parse_good(row) for row in rows)
+        return goods
 
-        return ms_model.MoySkladDBRetailDemand.save_objects_to_db(list_retail_demand=ms_sold_goods)
+    def _save_unknown_goods(self, good_ids: Iterable[str], workers: int = 1) -> bool:
+        """Метод запрашивает и сохраняет в БД товары из good_ids, которых еще нет в БД.
+
+        Используется в облегченном режиме lean_retail, когда карточки проданных товаров не приходят вместе с продажами.
+        :return: True, если все неизвестные товары удалось запросить.
+        """
+        good_ids = set(good_ids)
+        known_ids = set(ms_model.MoySkladDBGood.objects.filter(uuid__in=good_ids).values_list("uuid", flat=True))
+        unknown_ids = sorted(good_ids - known_ids)
+        if not unknown_ids:
+            return True
+
+        goods = self.get_assortment_by_ids(unknown_ids, workers=workers)
+        if goods is None:
+            return False
+        if goods:
+            ms_model.MoySkladDBGood.save_objects_to_db(list_ms_goods=goods, stats=self.save_stats)
+        return True
 
     def get_retail_demand_by_period(
         self,
         start_period: Optional[datetime.date],
         end_period: Optional[datetime.date],
-    ) -> List[RetailDemandPosition]:
-        """Метод возвращает список, проданных товаров за период.
+        workers: int = 1,
+    ) -> Optional[List[RetailDemandPosition]]:
+        """Метод возвращает список, проданных товаров за период. None - если не удалось получить все продажи.
 
         :param start_period: начало запрашиваемого периода start_period 00:00:00.
-        :param end_period: конец запрашиваемого периода end_period 23:59:00.
+        :param end_period: конец запрашиваемого периода end_period 23:59:59.
+        :param workers: количество одновременных запросов страниц.
         """
-        rows: List[Dict[str, Any]] = self._get_retail_data_by_period(
-            start_period=start_period, end_period=end_period, data_type=ms_urls.UrlType.RETAIL_DEMAND,
+        sold_goods = self._aggregate_retail_by_period(
+            start_period=start_period, end_period=end_period, data_type=ms_urls.UrlType.RETAIL_DEMAND, workers=workers,
         )
-
-        goods: Dict[str, RetailDemandPosition] = {}
-
-        for retail_demand in rows:
-            for position in RetailDemand(**retail_demand).positions.all_:
-                if not goods.get(position.good.good_id):
-                    goods[position.good.good_id] = RetailDemandPosition(
-                        good_id=position.good.good_id,
-                        quantity=int(position.quantity),
-                        demand_date=RetailDemand(**retail_demand).created.strftime("%Y-%m-%d"),
-                    )
-                else:
-                    goods[position.good.good_id] = goods[position.good.good_id]._replace(
-                        quantity=goods[position.good.good_id].quantity + int(position.quantity),
-                    )
-        return list(goods.values())
+        return sold_goods.to_positions(RetailDemandPosition) if sold_goods is not None else None
 
     def get_retail_sales_return_by_period(
         self,
         start_period: Optional[datetime.date] = None,
         end_period: Optional[datetime.date] = None,
-    ) -> List[RetailReturnedPosition]:
-        """Метод возвращает список, возвращенных товаров за период.
+        workers: int = 1,
+    ) -> Optional[List[RetailReturnedPosition]]:
+        """Метод возвращает список, возвращенных товаров за период. None - если не удалось получить все возвраты.
 
         :param start_period: начало запрашиваемого периода start_period 00:00:00.
-        :param end_period: конец запрашиваемого периода end_period 23:59:00.
+        :param end_period: конец запрашиваемого периода end_period 23:59:59.
+        :param workers: количество одновременных запросов страниц.
+        """
+        returned_goods = self._aggregate_retail_by_period(
+            start_period=start_period, end_period=end_period, data_type=ms_urls.UrlType.RETAIL_RETURN, workers=workers,
+        )
+        return returned_goods.to_positions(RetailReturnedPosition) if returned_goods is not None else None
+
+    def _aggregate_retail_by_period(
+        self,
+        start_period: Optional[datetime.date],
+        end_period: Optional[datetime.date],
+        data_type: ms_urls.UrlType,
+        workers: int = 1,
+    ) -> Optional[RetailAggregation]:
+        """Метод возвращает количество проданных или возвращенных товаров за период по дням создания чека.
+
+        Каждый чек разбирается один раз, RetailDemand(**check) не создается.
+        Если включена проверка (validate), чеки предварительно проверяются моделью RetailDemand
+        (кроме облегченного режима lean_retail, в котором в позициях нет карточек товаров).
+        :return: Агрегация по дням. None - если не удалось получить все продажи (возвраты).
         """
-        rows: List[Dict[str, Any]] = self._get_retail_data_by_period(
-            start_period=start_period, end_period=end_period, data_type=ms_urls.UrlType.RETAIL_RETURN,
+        rows = self._get_retail_data_by_period(
+            start_period=start_period, end_period=end_period, data_type=data_type, workers=workers,
         )
+        if rows is None:
+            return None
 
-        goods: Dict[str, RetailReturnedPosition] = {}
-
-        for retail_returns in rows:
-            for position in RetailDemand(**retail_returns).positions.all_:
-                if not goods.get(position.good.good_id):
-                    goods[position.good.good_id] = RetailReturnedPosition(
-                        good_id=position.good.good_id,
-                        quantity=int(position.quantity),
-                        demand_date=RetailDemand(**retail_returns).created.isoformat(),
-                    )
-                else:
-                    goods[position.good.good_id] = goods[position.good.good_id]._replace(
-                        quantity=goods[position.good.good_id].quantity + int(position.quantity),
-                    )
-        return list(goods.values())
+        if self.validate and not self.lean_retail:
+            for check in rows:
+                RetailDemand(**check)
+        return RetailAggregation().add_checks(rows)
 
     def _get_retail_data_by_period(
             self, start_period: Optional[datetime.date], end_period: Optional[datetime.date],
-            data_type: ms_urls.UrlType,
-    ) -> List[Dict[str, Any]]:
+            data_type: ms_urls.UrlType, workers: int = 1,
+    ) -> Optional[List[Dict[str, Any]]]:
         """Метод возвращает список, проданных или списанных товаров за период.
 
+        Первая страница запрашивается отдельно, остальные страницы - одновременно, после того как из meta.size
+        первого ответа стало известно общее количество продаж.
         :param start_period: начало запрашиваемого периода start_period 00:00:00.
-        :param end_period: конец запрашиваемого периода end_period 23:59:00.
+        :param end_period: конец запрашиваемого периода end_period 23:59:59.
         :param data_type: тип запрашиваемых данных RETAIL_DEMAND - розничные продажи, RETAIL_RETURN - возвраты
+        :param workers: количество одновременных запросов страниц.
+        :return: Все продажи (возвраты) за период. None - если хотя бы одна страница не получена.
         """
-        if not self._token and (
-                data_type != ms_urls.UrlType.RETAIL_DEMAND or data_type != ms_urls.UrlType.RETAIL_RETURN
-        ):
-            return []
-
-        # Получаем заголовки для запроса в сервис
-        header: Dict[str, Any] = ms_urls.get_headers(self._token)
+        if not self._token or data_type not in (ms_urls.UrlType.RETAIL_DEMAND, ms_urls.UrlType.RETAIL_RETURN):
+            return None
 
-        # Получаем url для отправки запроса в сервис
-        url: ms_urls.MoySkladUrl = ms_urls.get_url(
-            _type=data_type,
+        return self._get_all_rows_parallel(
+            data_type,
+            limit=ms_urls.RETAIL_LIMIT,
+            workers=workers,
             start_period=start_period,
             end_period=end_period,
-            offset=0,
+            lean=self.lean_retail,
         )
-        response = requests.get(url.url, url.request_filter, headers=header)
-        if not response.ok:
-            return []
-
-        rows: List[Dict[str, Any]] | None = response.json().get("rows")
-
-        return rows
@@ -0,0 +1,127 @@
+"""Модуль содержит HTTP клиент для работы с сервисом МойСклад."""
+import re
+import threading
+import time
+from typing import Any, Dict, NamedTuple, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from Sync_app.moysklad.moysklad_ratelimit import LIMITER, MAX_CONCURRENCY, RateLimiter
+
+# Путь запроса к API, за которым следует endpoint: /api/remap/1.2/entity/assortment
+_API_PATH_RE = re.compile(r"^/api/remap/[\d.]+/")
+# Идентификатор объекта в пути запроса
+_UUID_RE = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+
+
+def get_endpoint(url: str) -> str:
+    """Функция возвращает endpoint запроса url без идентификаторов объектов, например entity/product."""
+    path = _API_PATH_RE.sub("", urlsplit(url).path)
+    return "/".join(part for part in path.strip("/").split("/") if not _UUID_RE.match(part))
+
+
+class TransferStats(NamedTuple):
+    """Класс описывает статистику запросов клиента."""
+
+    # Количество выполненных запросов, включая повторы
+    requests: int = 0
+    # Количество байт, полученных по сети (в сжатом виде, если сервис сжал ответ)
+    bytes_received: int = 0
+    # Количество байт ответов после распаковки
+    bytes_decoded: int = 0
+    # Суммарное время запросов, сек
+    elapsed: float = 0.0
+
+    def add(self, received: int, decoded: int, elapsed: float) -> "TransferStats":
+        """Метод возвращает статистику, дополненную одним запросом."""
+        return TransferStats(
+            requests=self.requests + 1,
+            bytes_received=self.bytes_received + received,
+            bytes_decoded=self.bytes_decoded + decoded,
+            elapsed=self.elapsed + elapsed,
+        )
+
+    def __str__(self) -> str:
+        return (
+            f"запросов: {self.requests}, получено: {self.bytes_received / 2 ** 20:.2f} МиБ "
+            f"(распаковано: {self.bytes_decoded / 2 ** 20:.2f} МиБ), время запросов: {self.elapsed:.2f} с"
+        )
+
+
+class MoySkladClient:
+    """Класс описывает HTTP клиент сервиса МойСклад.
+
+    Клиент держит пул keep-alive соединений, выполняет запросы через общий ограничитель частоты и считает объем
+    полученных данных и время запросов, всего и по каждому endpoint'у. Сжатие ответов (Accept-Encoding: gzip, deflate)
+    requests запрашивает по умолчанию. Один экземпляр можно использовать из нескольких потоков.
+    """
+
+    def __init__(self, limiter: RateLimiter = LIMITER, pool_size: int = MAX_CONCURRENCY) -> None:
+        """Конструктор.
+
+        :param limiter: ограничитель частоты запросов.
+        :param pool_size: количество соединений, которые держатся открытыми.
+        """
+        self._limiter = limiter
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        self._lock = threading.Lock()
+        self._stats = TransferStats()
+        self._endpoint_stats: Dict[str, TransferStats] = {}
+
+    @property
+    def stats(self) -> TransferStats:
+        """Статистика запросов с момента создания клиента или последнего reset_stats()."""
+        return self._stats
+
+    @property
+    def endpoint_stats(self) -> Dict[str, TransferStats]:
+        """Статистика запросов по endpoint'ам: {endpoint: статистика}, см. get_endpoint()."""
+        with self._lock:
+            return dict(self._endpoint_stats)
+
+    def reset_stats(self) -> None:
+        """Метод обнуляет статистику запросов."""
+        with self._lock:
+            self._stats = TransferStats()
+            self._endpoint_stats = {}
+
+    def _count(self, response: requests.Response, elapsed: float) -> None:
+        decoded = len(response.content)
+        # tell() возвращает количество байт, прочитанных из соединения, т.е. до распаковки gzip
+        received = response.raw.tell() if response.raw is not None else 0
+        if not received:
+            received = int(response.headers.get("Content-Length", decoded))
+        endpoint = get_endpoint(response.url or "")
+        with self._lock:
+            self._stats = self._stats.add(received, decoded, elapsed)
+            self._endpoint_stats[endpoint] = self._endpoint_stats.get(endpoint, TransferStats()).add(received, decoded, elapsed)
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        params: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, Any]] = None,
+    ) -> requests.Response:
+        """Метод выполняет запрос к сервису с учетом лимитов сервиса и возвращает ответ."""
+
+        def send() -> requests.Response:
+            started = time.perf_counter()
+            response = self._session.request(method, url, params=params, headers=headers)
+            self._count(response, time.perf_counter() - started)
+            return response
+
+        return self._limiter.request(send)
+
+    def get(self, url: str, params: Optional[Dict[str, Any]] = None, headers: Optional[Dict[str, Any]] = None) -> requests.Response:
+        """Метод выполняет GET запрос."""
+        return self.request("GET", url, params=params, headers=headers)
+
+    def post(self, url: str, headers: Optional[Dict[str, Any]] = None) -> requests.Response:
+        """Метод выполняет POST запрос."""
+        return self.request("POST", url, headers=headers)
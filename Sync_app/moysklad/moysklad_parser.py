@@ -0,0 +1,106 @@
+"""Модуль содержит однопроходный разбор полного наименования товара МойСклад на составные части.
+
+Результат совпадает с пошаговым разбором статическими методами Good (_get_additional_info, _get_characteristics,
+_get_brewery, _get_name, _get_good_type), но строка разбирается один раз, а результаты запоминаются,
+поэтому неизменившиеся наименования повторно не разбираются.
+"""
+import os
+import re
+from functools import lru_cache
+from typing import Any, NamedTuple, Optional, Sequence, Tuple
+
+from Sync_app.moysklad.moysklad_constants import _TRASH, Characteristics, GoodType
+
+# Количество запоминаемых результатов разбора
+PARSE_CACHE_SIZE = int(os.getenv("MOYSKLAD_PARSE_CACHE_SIZE", 20000))
+# Версия разбора. Входит в отпечаток товара, поэтому при изменении разбора ее нужно увеличить,
+# чтобы все товары были разобраны и сохранены в БД заново
+PARSER_VERSION = 1
+
+# Дополнительная информация - последние скобки в наименовании, внутри могут быть одни вложенные скобки
+_ADDITIONAL_INFO_RE = re.compile(r"\(([^()]*(?:\([^()]*\)[^()]*)*)\)$")
+_GOOD_TYPES: Tuple[str, ...] = tuple(type_.value[0] for type_ in GoodType)
+_BEER: str = GoodType.BEER.value[0]
+_OTHER: str = GoodType.OTHER.value[0]
+
+
+class ParsedName(NamedTuple):
+    """Класс описывает части полного наименования товара. Поля совпадают с соответствующими полями GoodTuple."""
+
+    brewery: str = ""
+    name: str = ""
+    style: str = ""
+    og: float = 0.0
+    abv: float = 0.0
+    ibu: int = 0
+    is_alco: bool = False
+    bev_type: str = _OTHER
+
+
+def get_tara(modifications: Optional[Sequence[Any]]) -> Optional[str]:
+    """Функция возвращает значение первой модификации "Тара". Только оно влияет на разбор наименования."""
+    if modifications:
+        for mod in modifications:
+            if mod.name == "Тара":
+                return mod.value
+    return None
+
+
+def _get_characteristic(parts: Sequence[str], type_: Characteristics) -> float:
+    """Функция возвращает значение характеристики type_ из первой части, в которой она упомянута."""
+    for part in parts:
+        if type_.value in part:
+            return float(part.replace(f"{type_.value} ", "").replace(",", ".").replace("%", ""))
+    return 0
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_name(name: str, tara: Optional[str] = None, path_name: str = "") -> ParsedName:
+    """Функция раскладывает полное наименование товара на составные части.
+
+    :param name: полное наименование товара.
+    :param tara: значение модификации "Тара", см. get_tara().
+    :param path_name: папка товара. Используется как пивоварня, если ее нельзя выделить из наименования.
+    """
+    if not name:
+        return ParsedName()
+
+    full_name = name.replace(f" ({tara})", "") if tara is not None else name
+    for trash_element in _TRASH:
+        full_name = full_name.replace(trash_element, "")
+
+    match = _ADDITIONAL_INFO_RE.search(full_name)
+    add_info = match.group(1) if match else ""
+    if not add_info:
+        return ParsedName()
+
+    add_info_lower = add_info.lower()
+    bev_type = next((type_ for type_ in _GOOD_TYPES if type_ in add_info_lower), _BEER)
+
+    # Стиль - до первой ". ", характеристики - через ", " после нее
+    info_parts = add_info.split(". ")
+    style = info_parts[0]
+    abv = og = ibu = 0.0
+    if len(info_parts) > 1:
+        parts = [part.lower() for part in info_parts[1].split(", ")]
+        abv = _get_characteristic(parts, Characteristics.ABV)
+        og = _get_characteristic(parts, Characteristics.OG)
+        ibu = _get_characteristic(parts, Characteristics.IBU)
+
+    short_name = full_name.replace(f" ({add_info})", "")
+    if short_name.count(" - ") == 1:
+        brewery = short_name.split(" - ")[0]
+    else:
+        brewery = path_name.split("/")[-1]
+    good_name = short_name.replace(f"{brewery} - ", "") if brewery else short_name
+
+    return ParsedName(
+        brewery=brewery,
+        name=good_name,
+        style=style,
+        og=og,
+        abv=abv,
+        ibu=int(ibu),
+        is_alco=abv > 1,
+        bev_type=bev_type,
+    )
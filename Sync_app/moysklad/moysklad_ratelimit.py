@@ -0,0 +1,116 @@
+"""Модуль содержит ограничитель частоты запросов к сервису МойСклад.
+
+Ограничения сервиса https://dev.moysklad.ru/doc/api/remap/1.2/#mojsklad-json-api-obschie-swedeniq-ogranicheniq:
+не более 45 запросов за 3 секунды и не более 5 параллельных запросов от одного пользователя.
+О текущем состоянии лимита сервис сообщает заголовками ответа:
+X-RateLimit-Limit - количество запросов, доступных за период,
+X-RateLimit-Remaining - количество оставшихся запросов,
+X-Lognex-Retry-TimeInterval - период лимита, мс,
+X-Lognex-Reset - время до сброса лимита, мс (только в ответе 429),
+X-Lognex-Retry-After - время, через которое можно повторить запрос, мс (только в ответе 429).
+"""
+import threading
+import time
+from http import HTTPStatus
+from typing import Callable, Mapping, Optional
+
+import requests
+
+# Максимальное количество одновременных запросов, разрешенное сервисом
+MAX_CONCURRENCY = 5
+# Количество повторов запроса, на который сервис ответил 429 или 503
+MAX_RETRIES = 5
+# Пауза перед повтором, если сервис не прислал X-Lognex-Retry-After, сек. Удваивается с каждым повтором
+BACKOFF = 0.5
+
+_RETRY_STATUSES = (HTTPStatus.TOO_MANY_REQUESTS, HTTPStatus.SERVICE_UNAVAILABLE)
+
+
+def _header_ms(headers: Mapping[str, str], name: str) -> Optional[float]:
+    """Функция возвращает значение заголовка name, заданное в миллисекундах, в секундах."""
+    value = headers.get(name)
+    try:
+        return float(value) / 1000 if value is not None else None
+    except ValueError:
+        return None
+
+
+class RateLimiter:
+    """Класс ограничивает количество одновременных запросов и повторяет запросы, на которые сервис ответил 429.
+
+    Количество одновременных запросов подстраивается под заголовки ответов: при ответе 429 оно уменьшается вдвое,
+    при почти исчерпанном X-RateLimit-Remaining - на 1, а пока запас лимита большой - увеличивается на 1,
+    но не больше max_concurrency. Один экземпляр используется всеми потоками процесса.
+    """
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY, max_retries: int = MAX_RETRIES) -> None:
+        """Конструктор."""
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        # Текущее разрешенное количество одновременных запросов
+        self.concurrency = max_concurrency
+        # Количество выполняющихся запросов
+        self._active = 0
+        # Момент (time.monotonic), до которого новые запросы не отправляются
+        self._resume_at = 0.0
+        self._condition = threading.Condition()
+
+    def _acquire(self) -> None:
+        with self._condition:
+            while True:
+                delay = self._resume_at - time.monotonic()
+                if delay <= 0 and self._active < self.concurrency:
+                    self._active += 1
+                    return
+                self._condition.wait(timeout=delay if delay > 0 else None)
+
+    def _release(self, response: Optional[requests.Response], attempt: int) -> None:
+        with self._condition:
+            self._active -= 1
+            if response is not None:
+                self._update(response, attempt)
+            self._condition.notify_all()
+
+    def _update(self, response: requests.Response, attempt: int) -> None:
+        """Метод пересчитывает допустимое количество одновременных запросов по заголовкам ответа."""
+        if response.status_code in _RETRY_STATUSES:
+            self.concurrency = max(1, self.concurrency // 2)
+            retry_after = _header_ms(response.headers, "X-Lognex-Retry-After")
+            if retry_after is None:
+                retry_after = _header_ms(response.headers, "X-Lognex-Reset")
+            if retry_after is None:
+                retry_after = BACKOFF * 2 ** attempt
+            self._resume_at = max(self._resume_at, time.monotonic() + retry_after)
+            return
+
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        if remaining is None or not remaining.isdigit():
+            return
+        # Если оставшихся запросов меньше, чем может быть отправлено одновременно, снижаем параллельность
+        if int(remaining) <= self.concurrency:
+            self.concurrency = max(1, self.concurrency - 1)
+        elif int(remaining) > 2 * self.max_concurrency and self.concurrency < self.max_concurrency:
+            self.concurrency += 1
+
+    def request(self, send: Callable[[], requests.Response]) -> requests.Response:
+        """Метод выполняет запрос send с учетом лимитов сервиса.
+
+        Запрос, на который сервис ответил 429 или 503, повторяется не более max_retries раз после паузы,
+        указанной сервисом. Возвращается последний полученный ответ.
+        """
+        attempt = 0
+        while True:
+            self._acquire()
+            response: Optional[requests.Response] = None
+            try:
+                response = send()
+            finally:
+                self._release(response, attempt)
+
+            if response.status_code not in _RETRY_STATUSES or attempt >= self.max_retries:
+                return response
+            attempt += 1
+
+
+# Ограничитель, общий для всех клиентов МойСклад процесса
+LIMITER = RateLimiter()
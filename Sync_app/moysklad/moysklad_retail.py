@@ -0,0 +1,90 @@
+"""Модуль содержит однопроходную агрегацию розничных продаж и возвратов МойСклад по товарам и дням.
+
+Каждый чек (строка ответа entity/retaildemand или entity/retailsalesreturn) разбирается один раз, количество
+каждого товара прибавляется к счетчику дня создания чека. Чеки могут быть запрошены как с развернутыми карточками
+товаров (expand=positions.assortment), так и в облегченном виде, только со ссылками на товары (expand=positions).
+"""
+import datetime
+from collections import defaultdict
+from typing import Any, Callable, Counter, DefaultDict, Dict, Iterable, List, TypeVar
+
+# Тип позиции, в которую выгружается результат агрегации: RetailDemandPosition или RetailReturnedPosition
+PositionType = TypeVar("PositionType")
+
+
+def get_position_good_id(position: Dict[str, Any]) -> str:
+    """Функция возвращает id товара позиции чека или строки отчета.
+
+    Если карточка товара не развернута, id берется из ссылки на товар, которая хранится в виде
+    https://online.moysklad.ru/api/remap/1.2/entity/product/7944ef04-f831-11e5-7a69-971500188b19
+    """
+    assortment: Dict[str, Any] = position["assortment"]
+    if "id" in assortment:
+        return assortment["id"]
+    return assortment["meta"]["href"].split("?")[0].rstrip("/").split("/")[-1]
+
+
+class RetailAggregation:
+    """Класс суммирует количество товаров в чеках по дням создания чека."""
+
+    def __init__(self) -> None:
+        """Конструктор."""
+        # Количество товаров по дням: {"2022-10-05": Counter({good_id: quantity})}
+        self.days: DefaultDict[str, Counter[str]] = defaultdict(Counter)
+        # Количество обработанных чеков
+        self.checks = 0
+
+    def add_check(self, check: Dict[str, Any]) -> None:
+        """Метод добавляет к счетчикам товары одного чека."""
+        # Дата создания чека хранится в виде "2022-10-05 12:34:56.789"
+        demand_date = datetime.datetime.fromisoformat(check["created"]).strftime("%Y-%m-%d")
+        day = self.days[demand_date]
+        for position in (check.get("positions") or {}).get("rows", []):
+            day[get_position_good_id(position)] += int(position["quantity"])
+        self.checks += 1
+
+    def add_checks(self, checks: Iterable[Dict[str, Any]]) -> "RetailAggregation":
+        """Метод добавляет к счетчикам товары всех чеков checks."""
+        for check in checks:
+            self.add_check(check)
+        return self
+
+    def add_report_rows(self, rows: Iterable[Dict[str, Any]], demand_date: str) -> "RetailAggregation":
+        """Метод добавляет к счетчикам дня demand_date строки отчета о прибыльности (report/profit/byvariant).
+
+        Сервис уже просуммировал продажи и возвраты, к счетчику прибавляется разница, если она не меньше 1.
+        """
+        day = self.days[demand_date]
+        for row in rows:
+            quantity = int(row.get("sellQuantity", 0)) - int(row.get("returnQuantity", 0))
+            if quantity > 0:
+                day[get_position_good_id(row)] += quantity
+        return self
+
+    def subtract(self, other: "RetailAggregation") -> "RetailAggregation":
+        """Метод возвращает новую агрегацию, в которой из количества каждого дня вычтено количество other за тот же день.
+
+        Товары, количество которых стало меньше 1, в результат не попадают.
+        """
+        result = RetailAggregation()
+        result.checks = self.checks
+        for demand_date, goods in self.days.items():
+            remaining = goods - other.days[demand_date] if demand_date in other.days else +goods
+            if remaining:
+                result.days[demand_date] = remaining
+        return result
+
+    def totals(self) -> Counter[str]:
+        """Метод возвращает количество каждого товара за все дни."""
+        totals: Counter[str] = Counter()
+        for goods in self.days.values():
+            totals.update(goods)
+        return totals
+
+    def to_positions(self, position_type: Callable[..., PositionType]) -> List[PositionType]:
+        """Метод возвращает количество товаров по дням в виде списка позиций position_type."""
+        return [
+            position_type(good_id=good_id, quantity=quantity, demand_date=demand_date)
+            for demand_date, goods in self.days.items()
+            for good_id, quantity in goods.items()
+        ]
@@ -2,9 +2,9 @@
 
 import base64
 import os
-from datetime import date
+from datetime import date, datetime
 from enum import Enum
-from typing import Any, Dict, NamedTuple, Optional
+from typing import Any, Dict, NamedTuple, Optional, Sequence
 from urllib.parse import urljoin
 
 from dotenv import load_dotenv
@@ -18,6 +18,12 @@ GEO_ORG_HREF = JSON_URL + "entity/organization/" + GEO_ORG_ID  # Ссылка н
 GEO_SHOP_ID = "5057e2b5-b498-11e7-7a34-5acf0002684b"  # d розничной точки "География"
 GEO_SHOP_HREF = JSON_URL + "entity/retailstore/" + GEO_SHOP_ID
 
+ASSORTMENT_LIMIT = 1000  # максимальный размер страницы ассортимента, отдаваемый сервисом
+AUDIT_LIMIT = 100  # максимальный размер страницы аудита, отдаваемый сервисом
+RETAIL_LIMIT = 100  # максимальный размер страницы продаж и возвратов при запросе с expand
+REPORT_LIMIT = 1000  # максимальный размер страницы отчетов
+ASSORTMENT_IDS_LIMIT = 100  # количество товаров, запрашиваемых по id одним запросом (ограничено длиной url)
+
 
 class UrlType(Enum):
     """Перечисление для определения, какой тип url необходимо сформировать.
@@ -25,12 +31,20 @@ class UrlType(Enum):
     token - для получения токена.
     retail_demand - для получения розничных продаж
     assortment - для получения ассортимента товаров
+    assortment_changes - для получения измененных товаров из всех папок
+    audit_deleted - для получения событий удаления товаров
+    assortment_by_id - для получения товаров папки "Пиво" по списку id
+    profit_by_variant - для получения отчета о прибыльности по товарам и модификациям
     """
 
     TOKEN = 1
     RETAIL_DEMAND = 2
     ASSORTMENT = 3
     RETAIL_RETURN = 4
+    ASSORTMENT_CHANGES = 5
+    AUDIT_DELETED = 6
+    ASSORTMENT_BY_ID = 7
+    PROFIT_BY_VARIANT = 8
 
 
 class MoySkladUrl(NamedTuple):
@@ -49,9 +63,9 @@ def get_headers(token: str = "") -> Dict[str, Any]:
     """
     headers: Dict[str, Any]
     if token:
+        # Ответы запрашиваются без форматирования JSON
         headers = {
             "Content-Type": "application/json",
-            "Lognex-Pretty-Print-JSON": "true",
             "Authorization": "Bearer " + token,
         }
     else:
@@ -65,6 +79,9 @@ def get_url(
     start_period: Optional[date],
     end_period: Optional[date],
     offset: int,
+    updated_from: Optional[datetime] = None,
+    lean: bool = False,
+    ids: Optional[Sequence[str]] = None,
 ) -> MoySkladUrl:
     """Функция для получения url.
 
@@ -76,6 +93,12 @@ def get_url(
     :type start_period: datetime.date
     :param offset: смещение для запроса списка товаров
     :type offset: int
+    :param updated_from: если указан, запрашиваются только товары, измененные начиная с этого момента
+    :type updated_from: datetime.datetime
+    :param lean: если True, в продажах разворачиваются только позиции, без карточек товаров (только ссылки на товары)
+    :type lean: bool
+    :param ids: id товаров для UrlType.ASSORTMENT_BY_ID
+    :type ids: Sequence[str]
 
     :returns: Возвращается объект Url
     :rtypes: Url
@@ -96,12 +119,11 @@ def get_url(
             end_period = start_period
 
         # формат даты документа YYYY-MM-DD HH:MM:SS
-        date_filter_from = f'moment>{start_period.strftime("%Y-%m-%d 00:00:00")}'
-        date_filter_to = f'moment<{end_period.strftime("%Y-%m-%d 23:59:00")}'
+        date_filter_from = f'moment>={start_period.strftime("%Y-%m-%d 00:00:00")}'
+        date_filter_to = f'moment<={end_period.strftime("%Y-%m-%d 23:59:59")}'
 
-        # Т.к. в запрашиваемом периоде может оказаться продаж больше, чем 100, а МойСклад отдает только страницами
-        # по 100 продаж за ответ, чтобы получить следующую страницу, нежно формировать новый запрос со смещением
-        # offset=200, следующий offset-300 и т.д. В данной реализации это не учтено, т.к. больше 100 продаж не выявлено
+        # МойСклад отдает продажи с развернутыми позициями страницами не более чем по 100 продаж за ответ,
+        # следующие страницы запрашиваются со смещением offset=100, offset=200 и т.д.
         request_filter = {
             "filter": [
                 f"organization={JSON_URL}entity/organization/{GEO_ORG_ID}",
@@ -109,9 +131,10 @@ def get_url(
                 date_filter_from,
                 date_filter_to,
             ],
-            "offset": "0",
-            "expand": "positions,positions.assortment",
-            "limit": "100",
+            "offset": offset,
+            # В облегченном режиме вместо карточки товара в позиции приходит только ссылка на товар
+            "expand": "positions" if lean else "positions,positions.assortment",
+            "limit": RETAIL_LIMIT,
         }
 
         if _type == UrlType.RETAIL_DEMAND:
@@ -126,6 +149,63 @@ def get_url(
         request_filter = {
             "filter": [f"productFolder={JSON_URL}entity/productfolder/{BEER_FOLDER_ID}"],
             "offset": offset,
+            "limit": ASSORTMENT_LIMIT,
+        }
+        if updated_from is not None:
+            request_filter["filter"].append(f'updated>={updated_from.strftime("%Y-%m-%d %H:%M:%S")}')
+        url = MoySkladUrl(urljoin(JSON_URL, "entity/assortment"), request_filter)
+
+    # если нужен url для запроса отчета о прибыльности. Отчет возвращает проданное и возвращенное количество
+    # каждого товара (модификации) за период, уже просуммированное сервисом
+    elif _type == UrlType.PROFIT_BY_VARIANT:
+        if start_period is None:
+            start_period = date.today()
+        if end_period is None:
+            end_period = start_period
+
+        request_filter = {
+            "momentFrom": start_period.strftime("%Y-%m-%d 00:00:00"),
+            "momentTo": end_period.strftime("%Y-%m-%d 23:59:59"),
+            "filter": [
+                f"organization={JSON_URL}entity/organization/{GEO_ORG_ID}",
+                f"productFolder={JSON_URL}entity/productfolder/{BEER_FOLDER_ID}",
+                f"retailStore={GEO_SHOP_HREF}",
+            ],
+            "offset": offset,
+            "limit": REPORT_LIMIT,
+        }
+        url = MoySkladUrl(urljoin(JSON_URL, "report/profit/byvariant"), request_filter)
+
+    # если нужен url для запроса товаров папки "Пиво" по списку id
+    elif _type == UrlType.ASSORTMENT_BY_ID:
+        request_filter = {
+            "filter": [f"productFolder={JSON_URL}entity/productfolder/{BEER_FOLDER_ID}"] + [f"id={id_}" for id_ in ids or []],
+            "offset": offset,
+            "limit": ASSORTMENT_LIMIT,
         }
         url = MoySkladUrl(urljoin(JSON_URL, "entity/assortment"), request_filter)
+
+    # если нужен url для запроса измененных товаров без фильтра по папке.
+    # Используется для поиска товаров, перенесенных из папки "Пиво"
+    elif _type == UrlType.ASSORTMENT_CHANGES:
+        request_filter = {
+            "filter": [f'updated>={(updated_from or datetime.now()).strftime("%Y-%m-%d %H:%M:%S")}'],
+            "offset": offset,
+            "limit": ASSORTMENT_LIMIT,
+        }
+        url = MoySkladUrl(urljoin(JSON_URL, "entity/assortment"), request_filter)
+
+    # если нужен url для запроса событий удаления товаров и модификаций
+    elif _type == UrlType.AUDIT_DELETED:
+        request_filter = {
+            "filter": [
+                f'moment>={(updated_from or datetime.now()).strftime("%Y-%m-%d %H:%M:%S")}',
+                "eventType=delete",
+                "entityType=product",
+                "entityType=variant",
+            ],
+            "offset": offset,
+            "limit": AUDIT_LIMIT,
+        }
+        url = MoySkladUrl(urljoin(JSON_URL, "audit"), request_filter)
     return url
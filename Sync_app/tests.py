@@ -1,3 +1,953 @@
-from django.test import TestCase
+import datetime
+import random
+from http import HTTPStatus
+from decimal import Decimal
+from typing import Any, Counter, Dict, List, Optional, Set, Tuple
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+import Sync_app.googledrive.googledrive_class_lib as gs_class
+import Sync_app.googledrive.googledrive_diff as gs_diff
+import Sync_app.googledrive.googledrive_suggestions as gs_suggest
+import Sync_app.googledrive.googlesheets_constants as gs_const
+import Sync_app.konturmarket.konturmarket_class_lib as km_class
+import Sync_app.models.googlesheets_models as gs_models
+import Sync_app.models.konturmarket_models as km_models
+import Sync_app.models.moysklad_models as ms_models
+import Sync_app.moysklad.moysklad_class_lib as ms_class
+import Sync_app.moysklad.moysklad_urls as ms_urls
+from Sync_app.common.benchmarks import (
+    NAME_CORPUS, synthetic_assortment_row, synthetic_retail_check,
+)
+from Sync_app.common.http_cache import ENDPOINT_TTL, HTTP_CACHE, ResponseCache, get_ttl
+from Sync_app.konturmarket.konturmarket_allocation import Allocation, allocate
+from Sync_app.moysklad.moysklad_client import TransferStats, get_endpoint
+from Sync_app.moysklad.moysklad_ratelimit import BACKOFF, RateLimiter
+from Sync_app.moysklad.moysklad_retail import RetailAggregation, get_position_good_id
+
+
+def create_ms_good(index: int, **fields: Any) -> ms_models.MoySkladDBGood:
+    """Функция создает в БД товар МойСклад с номером index. Поля товара можно переопределить параметрами fields."""
+    values = dict(
+        uuid=f"good-{index:031d}", parent_uuid="", full_name=f"Пивоварня - Пиво {index}", path_name="", style="",
+        price=100, brewery="Пивоварня", name=f"Пиво {index}", abv=5, og=12, ibu=0, is_alco=True, bev_type="beer",
+        capacity=0.5,
+    )
+    values.update(fields)
+    return ms_models.MoySkladDBGood.objects.create(**values)
+
+
+def create_km_good(index: int, capacity: float = 0.5) -> km_models.KonturMarketDBGood:
+    """Функция создает в БД товар ЕГАИС с номером index."""
+    producer, _ = km_models.KonturMarketDBProducer.objects.get_or_create(fsrar="test", short_name="test", full_name="test")
+    return km_models.KonturMarketDBGood.objects.create(
+        egais_code=f"code{index:015d}", full_name=f"ЕГАИС {index}", capacity=capacity, kind_code=261, fsrar=producer,
+    )
+
+
+class MoySkladDBGoodDeleteTest(TestCase):
+    """Удаление товаров, удаленных в МойСклад или перенесенных из папки "Пиво"."""
+
+    def test_goods_with_history_are_archived(self) -> None:
+        sold = create_ms_good(1, fingerprint="sold")
+        linked = create_ms_good(2, fingerprint="linked")
+        unused = create_ms_good(3)
+        kept = create_ms_good(4)
+        ms_models.MoySkladDBRetailDemand.objects.create(uuid=sold, demand_date=datetime.date(2022, 10, 5), quantity=2)
+        linked.egais_code.add(create_km_good(1))
+
+        deleted, archived = ms_models.MoySkladDBGood.delete_objects_from_db([sold.uuid, linked.uuid, unused.uuid])
+
+        self.assertEqual((deleted, archived), (1, 2))
+        self.assertFalse(ms_models.MoySkladDBGood.objects.filter(uuid=unused.uuid).exists())
+        self.assertEqual(
+            set(ms_models.MoySkladDBGood.objects.filter(is_archived=True).values_list("uuid", "fingerprint")),
+            {(sold.uuid, ""), (linked.uuid, "")},
+        )
+        self.assertFalse(ms_models.MoySkladDBGood.objects.get(uuid=kept.uuid).is_archived)
+        # История продаж и связи с ЕГАИС сохраняются
+        self.assertEqual(ms_models.MoySkladDBRetailDemand.objects.filter(uuid=sold).count(), 1)
+        self.assertEqual(linked.egais_code.count(), 1)
+
+
+def create_assortment_row(index: int, updated: str, **fields: Any) -> Dict[str, Any]:
+    """Функция возвращает строку ассортимента с номером index и временем изменения updated."""
+    row = synthetic_assortment_row(index)
+    row.update(updated=updated, **fields)
+    return row
+
+
+class MoySkladIncrementalSyncTest(TestCase):
+    """Инкрементальная синхронизация ассортимента МойСклад."""
+
+    def test_changes_are_applied_and_watermark_advances(self) -> None:
+        rows = [create_assortment_row(index, "2022-10-01 10:00:00.000") for index in range(4)]
+        ms_models.MoySkladDBGood.save_objects_to_db([ms_class.GoodRecord.from_row(row) for row in rows])
+        since = datetime.datetime(2022, 10, 1, 10)
+        ms_models.MoySkladDBSyncState.set_watermark(ms_class.ASSORTMENT_SYNC_NAME, since)
+        # Товар 0 продавался, поэтому после переноса из папки "Пиво" он архивируется, а не удаляется
+        ms_models.MoySkladDBRetailDemand.objects.create(
+            uuid_id=rows[0]["id"], demand_date=datetime.date(2022, 10, 1), quantity=1,
+        )
+
+        changed = create_assortment_row(2, "2022-10-05 12:00:00.000", quantity=1000)
+        added = create_assortment_row(10, "2022-10-05 11:00:00.000")
+        ms = ms_class.MoySklad(_token="test")
+        with mock.patch.object(
+            ms, "get_assortment_changes",
+            return_value=([ms_class.GoodRecord.from_row(changed), ms_class.GoodRecord.from_row(added)], [rows[0]["id"]]),
+        ) as get_changes, mock.patch.object(ms, "get_deleted_ids", return_value=[rows[1]["id"]]), mock.patch.object(
+            ms, "get_assortment",
+        ) as get_assortment:
+            self.assertTrue(ms.sync_assortment(incremental=True))
+
+        get_changes.assert_called_once_with(since=since, workers=1)
+        get_assortment.assert_not_called()
+        self.assertTrue(ms_models.MoySkladDBGood.objects.get(uuid=rows[0]["id"]).is_archived)
+        self.assertFalse(ms_models.MoySkladDBGood.objects.filter(uuid=rows[1]["id"]).exists())
+        self.assertEqual(ms_models.MoySkladDBStock.objects.get(uuid_id=changed["id"]).quantity, 1000)
+        self.assertTrue(ms_models.MoySkladDBGood.objects.filter(uuid=added["id"], is_archived=False).exists())
+        self.assertFalse(ms_models.MoySkladDBGood.objects.get(uuid=rows[3]["id"]).is_archived)
+        self.assertEqual(
+            ms_models.MoySkladDBSyncState.get_watermark(ms_class.ASSORTMENT_SYNC_NAME), datetime.datetime(2022, 10, 5, 12),
+        )
+
+    def test_full_sync_by_default(self) -> None:
+        ms_models.MoySkladDBSyncState.set_watermark(ms_class.ASSORTMENT_SYNC_NAME, datetime.datetime(2022, 10, 1))
+        row = create_assortment_row(1, "2022-10-05 12:00:00.000")
+        ms = ms_class.MoySklad(_token="test")
+        with mock.patch.object(ms, "get_assortment", return_value=[ms_class.GoodRecord.from_row(row)]), mock.patch.object(
+            ms, "get_assortment_changes",
+        ) as get_changes:
+            self.assertTrue(ms.sync_assortment())
+
+        get_changes.assert_not_called()
+        self.assertEqual(
+            ms_models.MoySkladDBSyncState.get_watermark(ms_class.ASSORTMENT_SYNC_NAME), datetime.datetime(2022, 10, 5, 12),
+        )
+
+
+class MoySkladClientStatsTest(TestCase):
+    """Учет запросов к МойСклад по endpoint'ам."""
+
+    def test_endpoint_without_ids_and_params(self) -> None:
+        self.assertEqual(get_endpoint("https://api.moysklad.ru/api/remap/1.2/entity/assortment?limit=1000"), "entity/assortment")
+        self.assertEqual(
+            get_endpoint("https://api.moysklad.ru/api/remap/1.2/entity/retaildemand/0b9a5c3e-1234-11ec-0a80-0a1b2c3d4e5f/positions"),
+            "entity/retaildemand/positions",
+        )
+
+    def test_stats_add(self) -> None:
+        stats = TransferStats().add(100, 400, 0.5).add(50, 200, 0.25)
+        self.assertEqual(stats, TransferStats(requests=2, bytes_received=150, bytes_decoded=600, elapsed=0.75))
+
+
+# Кэши в памяти процесса вместо файловых кэшей settings.py
+LOCMEM_CACHES = {
+    name: {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": f"tests-{name}"}
+    for name in ("default", ms_class.SYNC_CACHE, HTTP_CACHE)
+}
+
+
+def create_response(status: int, body: Optional[Dict[str, Any]] = None, headers: Optional[Dict[str, str]] = None) -> mock.Mock:
+    """Функция возвращает ответ сервиса со статусом status, JSON телом body и заголовками headers."""
+    return mock.Mock(status_code=status, ok=status < 400, json=mock.Mock(return_value=body), headers=headers or {})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class MoySkladTokenRefreshTest(TestCase):
+    """Обновление токена МойСклад после ответа 401."""
+
+    def setUp(self) -> None:
+        caches[ms_class.SYNC_CACHE].clear()
+        self.client_mock = mock.Mock()
+        self.ms = ms_class.MoySklad(_token="stale", _client=self.client_mock)
+        self.url = ms_urls.get_url(ms_urls.UrlType.ASSORTMENT, start_period=None, end_period=None, offset=0)
+
+    def test_request_is_repeated_with_new_token(self) -> None:
+        caches[ms_class.SYNC_CACHE].set(ms_class.TOKEN_CACHE_KEY, "stale")
+        self.client_mock.get.side_effect = [create_response(HTTPStatus.UNAUTHORIZED), create_response(HTTPStatus.OK, {"rows": []})]
+        self.client_mock.post.return_value = create_response(HTTPStatus.OK, {"access_token": "fresh"})
+
+        self.assertEqual(self.ms._request_page(self.url), {"rows": []})
+
+        self.assertEqual(self.client_mock.get.call_count, 2)
+        self.assertEqual(self.client_mock.get.call_args.kwargs["headers"], ms_urls.get_headers("fresh"))
+        self.client_mock.post.assert_called_once()
+        self.assertEqual(caches[ms_class.SYNC_CACHE].get(ms_class.TOKEN_CACHE_KEY), "fresh")
+
+    def test_token_replaced_by_other_thread_is_not_requested(self) -> None:
+        self.ms._token = "fresh"
+
+        self.assertTrue(self.ms._refresh_token(stale_token="stale"))
+
+        self.assertEqual(self.ms._token, "fresh")
+        self.client_mock.post.assert_not_called()
+
+    def test_token_replaced_by_other_process_is_taken_from_cache(self) -> None:
+        caches[ms_class.SYNC_CACHE].set(ms_class.TOKEN_CACHE_KEY, "other")
+
+        self.assertTrue(self.ms._refresh_token(stale_token="stale"))
+
+        self.assertEqual(self.ms._token, "other")
+        self.client_mock.post.assert_not_called()
+
+    def test_request_is_not_repeated_without_token(self) -> None:
+        self.client_mock.get.return_value = create_response(HTTPStatus.UNAUTHORIZED)
+        self.client_mock.post.return_value = create_response(HTTPStatus.UNAUTHORIZED)
+
+        self.assertIsNone(self.ms._request_page(self.url))
+
+        self.client_mock.get.assert_called_once()
+        self.assertIsNone(caches[ms_class.SYNC_CACHE].get(ms_class.TOKEN_CACHE_KEY))
+
+
+class FakeClock:
+    """Часы для RateLimiter: ожидание не блокирует поток, а сдвигает время и запоминается."""
+
+    def __init__(self) -> None:
+        self.now = 100.0
+        self.waits: List[float] = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        if timeout is None:
+            raise AssertionError("ожидание освобождения слота в однопоточном тесте")
+        self.waits.append(timeout)
+        self.now += timeout
+        return True
+
+
+class RateLimiterTest(TestCase):
+    """Паузы и количество одновременных запросов RateLimiter по ответам сервиса."""
+
+    def setUp(self) -> None:
+        self.clock = FakeClock()
+        self.limiter = RateLimiter()
+        mock.patch("Sync_app.moysklad.moysklad_ratelimit.time", monotonic=self.clock.monotonic).start()
+        mock.patch.object(self.limiter._condition, "wait", self.clock.wait).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def request(self, *responses: mock.Mock) -> int:
+        """Метод выполняет запрос, на который сервис по очереди отвечает responses, и возвращает статус ответа."""
+        send = mock.Mock(side_effect=responses)
+        status = self.limiter.request(send).status_code
+        self.assertEqual(send.call_count, len(responses))
+        return status
+
+    def test_retry_after_header(self) -> None:
+        status = self.request(
+            create_response(HTTPStatus.TOO_MANY_REQUESTS, headers={"X-Lognex-Retry-After": "1500", "X-Lognex-Reset": "3000"}),
+            create_response(HTTPStatus.OK),
+        )
+        self.assertEqual(status, HTTPStatus.OK)
+        self.assertEqual(self.clock.waits, [1.5])
+
+    def test_reset_header(self) -> None:
+        self.request(create_response(HTTPStatus.TOO_MANY_REQUESTS, headers={"X-Lognex-Reset": "2000"}), create_response(HTTPStatus.OK))
+        self.assertEqual(self.clock.waits, [2.0])
+
+    def test_backoff_without_headers(self) -> None:
+        self.request(
+            create_response(HTTPStatus.TOO_MANY_REQUESTS),
+            create_response(HTTPStatus.SERVICE_UNAVAILABLE),
+            create_response(HTTPStatus.TOO_MANY_REQUESTS),
+            create_response(HTTPStatus.OK),
+        )
+        self.assertEqual(self.clock.waits, [BACKOFF, 2 * BACKOFF, 4 * BACKOFF])
+
+    def test_retries_are_limited(self) -> None:
+        self.limiter.max_retries = 2
+        response = create_response(HTTPStatus.TOO_MANY_REQUESTS, headers={"X-Lognex-Retry-After": "500"})
+        self.assertEqual(self.request(response, response, response), HTTPStatus.TOO_MANY_REQUESTS)
+        self.assertEqual(self.clock.waits, [0.5, 0.5])
+
+    def test_concurrency_is_halved_on_429(self) -> None:
+        concurrency = []
+        too_many_requests = create_response(HTTPStatus.TOO_MANY_REQUESTS, headers={"X-Lognex-Retry-After": "10"})
+        for _ in range(4):
+            self.request(too_many_requests, create_response(HTTPStatus.OK))
+            concurrency.append(self.limiter.concurrency)
+        self.assertEqual(concurrency, [2, 1, 1, 1])
+
+    def test_concurrency_follows_remaining_header(self) -> None:
+        concurrency = []
+        for remaining in ("5", "4", "abc", "10", "11", "11", "11", "11"):
+            self.request(create_response(HTTPStatus.OK, headers={"X-RateLimit-Remaining": remaining}))
+            concurrency.append(self.limiter.concurrency)
+        self.assertEqual(concurrency, [4, 3, 3, 3, 4, 5, 5, 5])
+        self.assertEqual(self.clock.waits, [])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ResponseCacheTest(TestCase):
+    """Кэш ответов внешних сервисов ResponseCache."""
+
+    url = "https://api.moysklad.ru/api/remap/1.2/entity/assortment"
+
+    def setUp(self) -> None:
+        caches[HTTP_CACHE].clear()
+        self.cache = ResponseCache(enabled=True)
+        self.fetch = mock.Mock()
+        self.fetch.side_effect = lambda: {"call": self.fetch.call_count}
+
+    def get(self, url: Optional[str] = None, params: Optional[Dict[str, Any]] = None) -> Optional[Any]:
+        return self.cache.get_or_fetch(url or self.url, params, self.fetch)
+
+    def test_ttl_by_endpoint(self) -> None:
+        self.assertEqual(get_ttl(self.url + "?limit=1000"), ENDPOINT_TTL["entity/assortment"])
+        self.assertEqual(get_ttl("https://sheets.googleapis.com/v4/spreadsheets/id/values:batchGet"), ENDPOINT_TTL["spreadsheets"])
+        self.assertEqual(get_ttl("https://api.moysklad.ru/api/remap/1.2/security/token"), 0)
+
+    def test_response_is_cached_by_url_and_params(self) -> None:
+        self.assertEqual(self.get(params={"offset": 0}), {"call": 1})
+        self.assertEqual(self.get(params={"offset": 0}), {"call": 1})
+        self.assertEqual(self.get(params={"offset": 1000}), {"call": 2})
+        self.assertEqual(self.fetch.call_count, 2)
+
+    def test_disabled_cache_is_not_used(self) -> None:
+        self.cache.configure(enabled=False)
+        self.assertEqual(self.get(), {"call": 1})
+        self.assertEqual(self.get(), {"call": 2})
+
+    def test_endpoint_without_ttl_is_not_cached(self) -> None:
+        url = "https://api.moysklad.ru/api/remap/1.2/security/token"
+        self.assertEqual(self.get(url), {"call": 1})
+        self.assertEqual(self.get(url), {"call": 2})
+
+    def test_response_expires_after_endpoint_ttl(self) -> None:
+        ttl = ENDPOINT_TTL["entity/assortment"]
+        with mock.patch("time.time", return_value=1_000_000.0) as now:
+            self.get()
+            now.return_value += ttl - 1
+            self.assertEqual(self.get(), {"call": 1})
+            now.return_value += 2
+            self.assertEqual(self.get(), {"call": 2})
+
+    def test_bypass_refreshes_cached_response(self) -> None:
+        self.get()
+        self.cache.configure(bypass=True)
+        self.assertEqual(self.get(), {"call": 2})
+        self.cache.configure(bypass=False)
+        self.assertEqual(self.get(), {"call": 2})
+        self.assertTrue(self.cache.enabled)
+
+    def test_failed_response_is_not_cached(self) -> None:
+        self.fetch.side_effect = [None, {"call": 2}]
+        self.assertIsNone(self.get())
+        self.assertEqual(self.get(), {"call": 2})
+
+
+class GoodRecordTest(TestCase):
+    """Разбор строк ассортимента облегченной записью GoodRecord и pydantic моделью Good."""
+
+    def test_record_equals_model(self) -> None:
+        for index in range(200):
+            row = synthetic_assortment_row(index)
+            record, good = ms_class.GoodRecord.from_row(row), ms_class.Good(**row)
+            with self.subTest(name=row["name"]):
+                self.assertEqual(record.parse_object(), good.parse_object())
+                self.assertEqual(record.fingerprint(), good.fingerprint())
+                self.assertEqual((record.good_id, record.quantity, record.parent_id), (good.good_id, good.quantity, good.parent_id))
+
+
+class NameParserTest(TestCase):
+    """Однопроходный разбор наименований parse_name() и пошаговый разбор Good."""
+
+    def test_one_pass_equals_by_steps(self) -> None:
+        rows = [
+            {"id": str(index), "name": name, "pathName": path_name, "salePrices": [{"value": 0}]}
+            for index, (name, path_name) in enumerate(NAME_CORPUS)
+        ]
+        rows.extend(synthetic_assortment_row(index) for index in range(200))
+        for row in rows:
+            record = ms_class.GoodRecord.from_row(row)
+            with self.subTest(name=record.name):
+                self.assertEqual(
+                    ms_class.Good._parse_fields(
+                        name=record.name,
+                        modifications=record.modifications,
+                        path_name=record.path_name,
+                        attributes=record.attributes,
+                        volume=record.volume,
+                    ),
+                    ms_class.Good._parse_fields_by_steps(
+                        name=record.name,
+                        modifications=record.modifications,
+                        path_name=record.path_name,
+                        attributes=record.attributes,
+                        volume=record.volume,
+                    ),
+                )
+
+
+def create_check(index: int, created: str, goods: Dict[str, int]) -> Dict[str, Any]:
+    """Функция возвращает чек в формате JSON ответа МойСклад со ссылками на товары goods: {id товара: количество}."""
+    return {
+        "id": str(index),
+        "name": f"{index:05d}",
+        "created": created,
+        "positions": {
+            "rows": [
+                {"quantity": float(quantity), "assortment": {"meta": {"href": f"{ms_urls.JSON_URL}entity/product/{good_id}"}}}
+                for good_id, quantity in goods.items()
+            ],
+        },
+    }
+
+
+class RetailAggregationTest(TestCase):
+    """Агрегация розничных продаж и возвратов по товарам и дням."""
+
+    def test_quantity_by_good_and_day(self) -> None:
+        aggregation = RetailAggregation().add_checks(
+            [
+                create_check(1, "2022-10-05 10:00:00.000", {"good-1": 2, "good-2": 1}),
+                create_check(2, "2022-10-05 23:59:59.999", {"good-1": 3}),
+                create_check(3, "2022-10-06 00:00:00.000", {"good-1": 1}),
+            ],
+        )
+        self.assertEqual(aggregation.checks, 3)
+        self.assertEqual(
+            set(aggregation.to_positions(ms_class.RetailDemandPosition)),
+            {
+                ms_class.RetailDemandPosition(good_id="good-1", quantity=5, demand_date="2022-10-05"),
+                ms_class.RetailDemandPosition(good_id="good-2", quantity=1, demand_date="2022-10-05"),
+                ms_class.RetailDemandPosition(good_id="good-1", quantity=1, demand_date="2022-10-06"),
+            },
+        )
+
+    def test_returns_subtracted_from_same_day(self) -> None:
+        sold = RetailAggregation().add_checks(
+            [
+                create_check(1, "2022-10-05 10:00:00.000", {"good-1": 5, "good-2": 2}),
+                create_check(2, "2022-10-06 10:00:00.000", {"good-1": 1}),
+            ],
+        )
+        returned = RetailAggregation().add_checks(
+            [
+                create_check(3, "2022-10-05 12:00:00.000", {"good-1": 2, "good-2": 2}),
+                create_check(4, "2022-10-07 12:00:00.000", {"good-1": 1}),
+            ],
+        )
+        self.assertEqual(
+            sold.subtract(returned).to_positions(ms_class.RetailDemandPosition),
+            [
+                ms_class.RetailDemandPosition(good_id="good-1", quantity=3, demand_date="2022-10-05"),
+                ms_class.RetailDemandPosition(good_id="good-1", quantity=1, demand_date="2022-10-06"),
+            ],
+        )
+
+    def test_good_id_from_link(self) -> None:
+        good_id = "7944ef04-f831-11e5-7a69-971500188b19"
+        for href in (f"{ms_urls.JSON_URL}entity/product/{good_id}", f"{ms_urls.JSON_URL}entity/variant/{good_id}?expand=product"):
+            with self.subTest(href=href):
+                self.assertEqual(get_position_good_id({"assortment": {"meta": {"href": href}}}), good_id)
+        self.assertEqual(get_position_good_id({"assortment": {"id": good_id, "meta": {"href": ""}}}), good_id)
+
+    def test_equals_model_based_aggregation(self) -> None:
+        day = datetime.date(2022, 10, 5)
+        checks = [synthetic_retail_check(index, day) for index in range(300)]
+        # Разбор чеков pydantic моделями, как до RetailAggregation
+        expected: Counter[Tuple[str, str]] = Counter()
+        for check in checks:
+            retail_demand = ms_class.RetailDemand(**check)
+            assert retail_demand.positions is not None
+            for position in retail_demand.positions.all_:
+                expected[(position.good.good_id, retail_demand.created.strftime("%Y-%m-%d"))] += int(position.quantity)
+
+        for lean in (False, True):
+            with self.subTest(lean=lean):
+                aggregation = RetailAggregation().add_checks([synthetic_retail_check(index, day, lean=lean) for index in range(300)])
+                positions = aggregation.to_positions(ms_class.RetailDemandPosition)
+                self.assertEqual({(position.good_id, position.demand_date): position.quantity for position in positions}, dict(expected))
+
+
+class MoySkladDBGoodSaveTest(TestCase):
+    """Запись товаров и остатков МойСклад пакетами."""
+
+    def save(self, rows: List[Dict[str, Any]]) -> ms_models.SaveStats:
+        stats = ms_models.SaveStats()
+        ms_models.MoySkladDBGood.save_objects_to_db([ms_class.GoodRecord.from_row(row) for row in rows], stats=stats, batch_size=7)
+        return stats
+
+    def test_insert_skip_and_update(self) -> None:
+        rows = [synthetic_assortment_row(index) for index in range(30)]
+        stats = self.save(rows)
+        self.assertEqual((stats.inserted, stats.updated, stats.skipped), (30, 0, 0))
+        self.assertEqual(ms_models.MoySkladDBGood.objects.count(), 30)
+
+        self.assertEqual(self.save(rows).skipped, 30)
+
+        # У первого товара изменился только остаток, у второго - наименование
+        rows[0]["quantity"] = 1000
+        rows[1]["name"] = rows[1]["name"].replace("Beer 1 ", "Renamed ")
+        stats = self.save(rows)
+        self.assertEqual((stats.inserted, stats.updated, stats.skipped), (0, 2, 28))
+        self.assertEqual(ms_models.MoySkladDBStock.objects.get(uuid_id=rows[0]["id"]).quantity, 1000)
+        self.assertEqual(ms_models.MoySkladDBGood.objects.get(uuid=rows[1]["id"]).name, "Renamed")
+        self.assertEqual(ms_models.MoySkladDBGood.objects.count(), 30)
+        self.assertEqual(ms_models.MoySkladDBStock.objects.count(), 30)
+
+    def test_rejected_goods_are_reported(self) -> None:
+        rows = [synthetic_assortment_row(index) for index in range(3)]
+        rows[2]["name"] = rows[1]["name"]
+        stats = self.save(rows)
+        self.assertEqual((stats.inserted, stats.rejected), (2, 1))
+        self.assertEqual(list(stats.errors), [rows[2]["id"]])
+        self.assertIn(f"full_name: совпадает с товаром {rows[1]['id']}", stats.errors[rows[2]["id"]])
+        self.assertFalse(ms_models.MoySkladDBGood.objects.filter(uuid=rows[2]["id"]).exists())
+
+
+class MoySkladDBRetailDemandSaveTest(TestCase):
+    """Перезапись розничных продаж МойСклад за день."""
+
+    def setUp(self) -> None:
+        self.goods = [create_ms_good(index) for index in range(3)]
+        saved_sales = ((self.goods[0], "2022-10-05", 5), (self.goods[1], "2022-10-05", 3), (self.goods[0], "2022-10-06", 7))
+        for good, demand_date, quantity in saved_sales:
+            ms_models.MoySkladDBRetailDemand.objects.create(uuid=good, demand_date=demand_date, quantity=quantity)
+
+    def get_sales(self) -> Dict[Tuple[str, str], int]:
+        return {
+            (str(demand_date), uuid): quantity
+            for demand_date, uuid, quantity in ms_models.MoySkladDBRetailDemand.objects.values_list("demand_date", "uuid", "quantity")
+        }
+
+    def test_day_is_replaced(self) -> None:
+        day_sales = [
+            ms_class.RetailDemandPosition(good_id=self.goods[0].uuid, quantity=2, demand_date="2022-10-05"),
+            ms_class.RetailDemandPosition(good_id=self.goods[2].uuid, quantity=1, demand_date="2022-10-05"),
+            ms_class.RetailDemandPosition(good_id=self.goods[0].uuid, quantity=4, demand_date="2022-10-05"),
+            # Товара нет в БД
+            ms_class.RetailDemandPosition(good_id="unknown", quantity=1, demand_date="2022-10-05"),
+        ]
+        kept_id = ms_models.MoySkladDBRetailDemand.objects.get(uuid=self.goods[0], demand_date="2022-10-05").id
+
+        self.assertTrue(ms_models.MoySkladDBRetailDemand.save_objects_to_db(day_sales))
+
+        # Повторы товара за день просуммированы, пропавший из продаж товар удален, продажи за 2022-10-06 не изменились
+        self.assertEqual(
+            self.get_sales(),
+            {
+                ("2022-10-05", self.goods[0].uuid): 6,
+                ("2022-10-05", self.goods[2].uuid): 1,
+                ("2022-10-06", self.goods[0].uuid): 7,
+            },
+        )
+        self.assertTrue(ms_models.MoySkladDBRetailDemand.objects.filter(id=kept_id, quantity=6).exists())
+
+    def test_day_without_sales_is_cleared(self) -> None:
+        self.assertFalse(ms_models.MoySkladDBRetailDemand.save_objects_to_db([], demand_dates=["2022-10-06"]))
+        self.assertEqual(self.get_sales(), {("2022-10-05", self.goods[0].uuid): 5, ("2022-10-05", self.goods[1].uuid): 3})
+
+
+def create_km_stock(index: int, producer: int, quantity: float, capacity: Optional[float] = 0.5) -> km_class.StockEGAIS:
+    """Функция возвращает остаток товара ЕГАИС с номером index производителя producer в формате ответа Контур.Маркет."""
+    return km_class.StockEGAIS.parse_obj(
+        {
+            "quantity": quantity,
+            "shopQuantity": quantity,
+            "productInfo": {
+                "fullName": f"ЕГАИС {index}",
+                "egaisCode": f"code{index:015d}",
+                "capacity": capacity,
+                "productKindCode": 261,
+                "producer": {
+                    "shortName": f"Пивоварня {producer}", "name": f"ООО Пивоварня {producer}", "inn": "", "fsrarId": str(producer),
+                },
+            },
+        },
+    )
+
+
+class KonturMarketDBGoodSaveTest(TestCase):
+    """Запись производителей, товаров и остатков ЕГАИС пакетами."""
+
+    def test_upsert_without_duplicates(self) -> None:
+        stocks = [create_km_stock(index, producer=index % 3, quantity=index) for index in range(20)]
+        # Повтор кода АП: сохраняется последнее значение
+        stocks.append(create_km_stock(0, producer=0, quantity=5, capacity=None))
+        km_models.KonturMarketDBGood.save_objects_to_db(stocks, batch_size=4)
+
+        self.assertEqual(km_models.KonturMarketDBProducer.objects.count(), 3)
+        self.assertEqual(km_models.KonturMarketDBGood.objects.count(), 20)
+        self.assertEqual(km_models.KonturMarketDBStock.objects.count(), 20)
+        good = km_models.KonturMarketDBGood.objects.get(egais_code=f"code{0:015d}")
+        self.assertTrue(good.is_draft)
+        self.assertEqual(good.konturmarketdbstock.quantity, 5)
+
+        # Повторная запись обновляет существующие строки
+        km_models.KonturMarketDBGood.save_objects_to_db([create_km_stock(1, producer=1, quantity=100)])
+        self.assertEqual(km_models.KonturMarketDBStock.objects.get(egais_code_id=f"code{1:015d}").quantity, 100)
+        self.assertEqual(km_models.KonturMarketDBGood.objects.count(), 20)
+
+
+class SalesJournalTest(TestCase):
+    """Журнал розничных продаж алкоголя за день."""
+
+    day = datetime.date(2022, 10, 5)
+
+    def create_sale(self, good: ms_models.MoySkladDBGood, quantity: int, day: Optional[datetime.date] = None) -> None:
+        ms_models.MoySkladDBRetailDemand.objects.create(uuid=good, demand_date=day or self.day, quantity=quantity)
+
+    def create_code(self, index: int, stock: int) -> km_models.KonturMarketDBGood:
+        km_good = create_km_good(index)
+        km_models.KonturMarketDBStock.objects.create(egais_code=km_good, quantity=stock)
+        return km_good
+
+    def test_journal_in_one_query(self) -> None:
+        beer = create_ms_good(1, full_name="Пиво 1")
+        beer.egais_code.add(self.create_code(1, stock=3), self.create_code(2, stock=10), self.create_code(3, stock=0))
+        self.create_sale(beer, 12)
+        self.create_sale(beer, 4, day=self.day - datetime.timedelta(days=1))
+        # Не попадают в журнал: разливное пиво, комбуча, товар без кода ЕГАИС
+        draft = create_ms_good(2, is_draft=True)
+        draft.egais_code.add(self.create_code(4, stock=10))
+        self.create_sale(draft, 1)
+        kombucha = create_ms_good(3, bev_type="kombucha")
+        kombucha.egais_code.add(self.create_code(5, stock=10))
+        self.create_sale(kombucha, 1)
+        self.create_sale(create_ms_good(4), 1)
+
+        with self.assertNumQueries(1):
+            journal = km_models.KonturMarketDBGood.get_sales_journal_from_db(self.day)
+
+        # Первым списывается код с наибольшим остатком
+        self.assertEqual(
+            [(row["commercial_name"], row["alcCode"], row["quantity"]) for row in journal],
+            [("Пиво 1", f"code{2:015d}", 10), ("Пиво 1", f"code{1:015d}", 2)],
+        )
+
+
+class AllocationTest(TestCase):
+    """Распределение проданного количества по кодам ЕГАИС."""
+
+    def test_largest_stock_first(self) -> None:
+        self.assertEqual(
+            allocate(sold=[12, 3], links=[["a", "b", "c"], ["a", "b"]], stock={"a": 3, "b": 10, "c": 0}),
+            [Allocation(0, "b", 10), Allocation(0, "a", 2), Allocation(1, "a", 1)],
+        )
+        # При равных остатках первым списывается меньший код
+        self.assertEqual(allocate(sold=[1], links=[["b", "a"]], stock={"a": 5, "b": 5}), [Allocation(0, "a", 1)])
+
+    def test_invalid_links(self) -> None:
+        with self.assertRaises(ValueError):
+            allocate(sold=[1, 2], links=[["a"]], stock={"a": 1})
+
+    def test_properties_on_random_data(self) -> None:
+        # Списания положительные, только с кодов продажи, не больше остатков и продаж. Продажа списывается полностью,
+        # если у ее кодов остался остаток. Результат не зависит от порядка связанных кодов
+        rnd = random.Random(20)
+        for case in range(1000):
+            codes = [f"code{index}" for index in range(rnd.randint(1, 8))]
+            stock = {code: rnd.randint(0, 10) for code in codes}
+            sold = [rnd.randint(0, 12) for _ in range(rnd.randint(0, 10))]
+            links = [rnd.sample(codes, rnd.randint(1, len(codes))) for _ in sold]
+            allocations = allocate(sold, links, stock)
+
+            with self.subTest(case=case, sold=sold, links=links, stock=stock):
+                by_code: Counter[str] = Counter()
+                by_sale: Counter[int] = Counter()
+                for allocation in allocations:
+                    self.assertGreater(allocation.quantity, 0)
+                    self.assertIn(allocation.egais_code, links[allocation.sale])
+                    by_code[allocation.egais_code] += allocation.quantity
+                    by_sale[allocation.sale] += allocation.quantity
+                for code, quantity in by_code.items():
+                    self.assertLessEqual(quantity, stock[code])
+                for sale, quantity in enumerate(sold):
+                    self.assertLessEqual(by_sale[sale], quantity)
+                    if by_sale[sale] < quantity:
+                        self.assertTrue(all(stock[code] == by_code[code] for code in links[sale]))
+                self.assertEqual(allocate(sold, [list(reversed(codes_)) for codes_ in links], stock), allocations)
+
+
+def create_compliance_table(goods: int) -> List[List[str]]:
+    """Функция создает в БД товары МойСклад и ЕГАИС и возвращает таблицу соответствия для них.
+
+    Каждое третье пиво выпускается в двух объемах, каждая десятая строка таблицы без кода ЕГАИС,
+    каждая седьмая - с названием, которого нет в МойСклад.
+    """
+    for index in range(goods):
+        create_km_good(index, capacity=0.33 if index % 3 else 0.5)
+        for capacity in (0.33, 0.5) if index % 3 == 0 else (0.33,):
+            create_ms_good(
+                index * 2 + (capacity == 0.5), brewery=f"Brewery {index % 50}", name=f"Beer {index}", capacity=capacity,
+            )
+
+    table: List[List[str]] = []
+    for index in range(goods):
+        name = f"Brewery {index % 50} - {'beer' if index % 7 else 'Unknown'} {index}"
+        table.append([name] if index % 10 == 0 else [name, f"code{index:015d}"])
+    return table
+
+
+class CompilanceMatcherTest(TestCase):
+    """Сопоставление таблицы соответствия с товарами МойСклад и ЕГАИС."""
+
+    through = ms_models.MoySkladDBGood.egais_code.through
+
+    def get_links(self) -> Set[Tuple[str, str]]:
+        return set(self.through.objects.values_list("moyskladdbgood_id", "konturmarketdbgood_id"))
+
+    def test_match_rules(self) -> None:
+        table = create_compliance_table(goods=30)
+        not_matched = gs_class.GoogleSheets.db_set_matches(table)
+
+        # Строки без кода ЕГАИС (0, 10, 20) и с неизвестным названием (7, 14, 21, 28)
+        self.assertEqual(not_matched, [table[index] for index in (0, 7, 10, 14, 20, 21, 28)])
+        # Название сравнивается без учета регистра, при двух объемах выбирается объем товара ЕГАИС
+        expected = {
+            (f"good-{index * 2 + (index % 3 == 0):031d}", f"code{index:015d}")
+            for index in range(30)
+            if index % 10 and index % 7
+        }
+        self.assertEqual(self.get_links(), expected)
+
+        # Повторное сопоставление не дублирует связи
+        gs_class.GoogleSheets.db_set_matches(table)
+        self.assertEqual(self.through.objects.count(), len(expected))
+
+    def test_draft_and_archived_goods_are_not_matched(self) -> None:
+        create_km_good(1)
+        create_ms_good(1, brewery="Brewery", name="Draft", is_draft=True)
+        create_ms_good(2, brewery="Brewery", name="Archived", is_archived=True)
+        table = [["Brewery - Draft", f"code{1:015d}"], ["Brewery - Archived", f"code{1:015d}"]]
+        self.assertEqual(gs_class.GoogleSheets.db_set_matches(table), table)
+        self.assertFalse(self.get_links())
+
+    def test_query_count_does_not_depend_on_table_size(self) -> None:
+        table = create_compliance_table(goods=300)
+        counts = []
+        for rows in (30, 300):
+            self.through.objects.all().delete()
+            with CaptureQueriesContext(connection) as queries:
+                gs_class.GoogleSheets.db_set_matches(table[:rows])
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+def create_candidate(index: int, brewery: str, name: str, capacity: Optional[Decimal] = Decimal("0.5")) -> gs_suggest.MatchCandidate:
+    """Функция возвращает товар МойСклад с номером index для подбора похожих товаров."""
+    return gs_suggest.MatchCandidate(
+        uuid=f"good-{index:031d}", full_name=f"{brewery} - {name}", brewery=brewery, name=name, capacity=capacity,
+    )
+
+
+class SuggestionIndexTest(TestCase):
+    """Подбор похожих товаров по обратному индексу триграмм."""
+
+    def test_only_rare_trigrams_generate_candidates(self) -> None:
+        # Триграммы слов Common и Stout есть у всех товаров и считаются частыми
+        candidates = [create_candidate(index, "Common", f"Stout w{index:02d}") for index in range(gs_suggest.FREQUENT_TRIGRAM_MIN + 10)]
+        candidates.append(create_candidate(99, "Common", "Stout Zebra"))
+        index = gs_suggest.SuggestionIndex(candidates)
+
+        # Остальные товары похожи на строку больше MIN_SIMILARITY, но только частыми триграммами
+        self.assertGreater(
+            gs_suggest.get_similarity(gs_suggest.get_trigrams("Common Stout Zebra"), gs_suggest.get_trigrams("Common Stout w00")),
+            gs_suggest.MIN_SIMILARITY,
+        )
+        self.assertEqual([suggestion.candidate for suggestion in index.suggest("Common Stout Zebra")], [candidates[-1]])
+        # Если редких триграмм в строке нет, кандидаты ищутся по частым
+        self.assertEqual(len(index.suggest("Common Stout")), gs_suggest.SUGGESTIONS_COUNT)
+
+    def test_brewery_and_capacity_bonus(self) -> None:
+        alpha = create_candidate(1, "Alpha", "Nightfall", capacity=Decimal("0.5"))
+        gamma = create_candidate(2, "Gamma", "Nightfall", capacity=Decimal("0.33"))
+        index = gs_suggest.SuggestionIndex([gamma, alpha])
+        similarity = gs_suggest.get_similarity(gs_suggest.get_trigrams("nightfall"), gs_suggest.get_trigrams("alpha nightfall"))
+
+        self.assertEqual(
+            index.suggest("nightfall", brewery="ALPHA", capacity=Decimal("0.330")),
+            [
+                gs_suggest.Suggestion(alpha, round(similarity + gs_suggest.BREWERY_WEIGHT, 3)),
+                gs_suggest.Suggestion(gamma, round(similarity + gs_suggest.CAPACITY_WEIGHT, 3)),
+            ],
+        )
+        # Без пивоварни и объема надбавок нет
+        self.assertEqual(
+            index.suggest("nightfall"),
+            [gs_suggest.Suggestion(alpha, round(similarity, 3)), gs_suggest.Suggestion(gamma, round(similarity, 3))],
+        )
+
+    def test_min_similarity_cutoff(self) -> None:
+        close = create_candidate(1, "Gamma", "Nightingale", capacity=None)
+        # Совпадение объема не спасает товар, название которого похоже меньше MIN_SIMILARITY
+        distant = create_candidate(2, "Gamma", "Nightingale Porter", capacity=Decimal("0.5"))
+        query = gs_suggest.get_trigrams("Alpha Night")
+        self.assertGreaterEqual(gs_suggest.get_similarity(query, gs_suggest.get_trigrams("Gamma Nightingale")), gs_suggest.MIN_SIMILARITY)
+        self.assertLess(gs_suggest.get_similarity(query, gs_suggest.get_trigrams("Gamma Nightingale Porter")), gs_suggest.MIN_SIMILARITY)
+
+        suggestions = gs_suggest.SuggestionIndex([distant, close]).suggest("Alpha Night", brewery="Alpha", capacity=Decimal("0.5"))
+        self.assertEqual([suggestion.candidate for suggestion in suggestions], [close])
+
+    def test_equal_scores_are_ordered_by_uuid(self) -> None:
+        candidates = [create_candidate(index, "Alpha", "Nightfall") for index in (5, 3, 4, 1)]
+        index = gs_suggest.SuggestionIndex(candidates)
+        uuids = [suggestion.candidate.uuid for suggestion in index.suggest("Alpha Nightfall")]
+        self.assertEqual(uuids, [f"good-{number:031d}" for number in (1, 3, 4)])
+        self.assertEqual(index.suggest("Alpha Nightfall", count=0), [])
+        self.assertEqual(index.suggest("  "), [])
+
+    def test_match_suggestions_from_db(self) -> None:
+        create_km_good(1, capacity=0.33)
+        create_ms_good(1, brewery="Alpha", name="Nightfall", full_name="Alpha - Nightfall 0.5", capacity=0.5)
+        create_ms_good(2, brewery="Alpha", name="Nightfall", full_name="Alpha - Nightfall 0.33", capacity=0.33)
+        create_ms_good(3, brewery="Alpha", name="Nightfall Draft", is_draft=True)
+        table = [["Alpha - Nightfal", f"code{1:015d}"], [" "], ["Alpha - Nightfal"]]
+
+        result = gs_class.GoogleSheets.get_match_suggestions(table, count=5)
+
+        # Пустая строка пропускается, при известном коде ЕГАИС первым предлагается товар с его объемом
+        self.assertEqual([gs_row for gs_row, _ in result], [table[0], table[2]])
+        with_capacity, without_capacity = ([suggestion.candidate.uuid for suggestion in suggestions] for _, suggestions in result)
+        self.assertEqual(with_capacity, [f"good-{2:031d}", f"good-{1:031d}"])
+        self.assertEqual(without_capacity, [f"good-{1:031d}", f"good-{2:031d}"])
+
+
+def create_sheets(value_ranges: List[List[List[str]]]) -> gs_class.GoogleSheets:
+    """Функция возвращает GoogleSheets, сервис которого отвечает на values().batchGet диапазонами value_ranges."""
+    service = mock.MagicMock()
+    service.spreadsheets().values().batchGet().execute.return_value = {
+        "valueRanges": [{"values": values} for values in value_ranges],
+    }
+    return gs_class.GoogleSheets(service=service, connection_ok=True)
+
+
+class GoogleSheetsReadTest(TestCase):
+    """Чтение диапазонов таблицы Google Sheets."""
+
+    def test_get_data_skips_blank_rows_in_sheet_order(self) -> None:
+        sheets = create_sheets([[["b", "2"], [], ["", " "], ["a", "1"]]])
+        self.assertEqual(sheets.get_data("id", "Лист", "A1:B"), [["b", "2"], ["a", "1"]])
+
+    def test_get_data_empty_range(self) -> None:
+        sheets = create_sheets([[]])
+        self.assertEqual(sheets.get_data("id", "Лист", "A1:B"), [])
+
+    def test_sync_compl_table_reads_only_compliance_sheet(self) -> None:
+        sheets = create_sheets([[["Пивоварня - Пиво", "name", f"code{1:015d}"]]])
+        sheets.drive_service = mock.MagicMock()
+        sheets.drive_service.files().get().execute.return_value = {"version": "1", "modifiedTime": "2022-10-05T00:00:00Z"}
+
+        with mock.patch.object(gs_class.GoogleSheets, "get_access", return_value=True):
+            self.assertTrue(sheets.sync_compl_table())
+        _, kwargs = sheets.service.spreadsheets().values().batchGet.call_args
+        self.assertEqual(kwargs["ranges"], [f"{gs_const.LIST_NAME_EGAIS}!{gs_const.FIRST_CELL_EGAIS}:{gs_const.LAST_COLUMN_EGAIS}"])
+        self.assertEqual(sheets.not_matched, [["Пивоварня - Пиво", f"code{1:015d}"]])
+
+
+class CompilanceTableSyncTest(TestCase):
+    """Применение изменений таблицы соответствия и повторное сопоставление несопоставленных строк."""
+
+    def test_unchanged_table_retries_not_matched_rows(self) -> None:
+        create_km_good(1)
+        create_km_good(2)
+        create_ms_good(1, brewery="Пивоварня", name="Пиво 1")
+        table = [["Пивоварня - Пиво 1", f"code{1:015d}"], ["Пивоварня - Пиво 2", f"code{2:015d}"]]
+        self.assertEqual(gs_class.GoogleSheets.db_apply_changes(table), [table[1]])
+
+        # Таблица не менялась, товара второй строки по-прежнему нет
+        create_ms_good(3, brewery="Другая пивоварня", name="Пиво 2")
+        self.assertEqual(gs_class.GoogleSheets.db_retry_not_matched(), [table[1]])
+
+        # Товар второй строки появился в БД после синхронизации
+        second = create_ms_good(2, brewery="Пивоварня", name="Пиво 2")
+        self.assertEqual(gs_class.GoogleSheets.db_retry_not_matched(), [])
+        self.assertEqual(list(second.egais_code.values_list("egais_code", flat=True)), [f"code{2:015d}"])
+        self.assertFalse(gs_models.GoogleSheetsDBCompilanceRow.get_not_matched())
+        # Если несопоставленных строк нет, товары из БД не загружаются
+        with self.assertNumQueries(1):
+            self.assertEqual(gs_class.GoogleSheets.db_retry_not_matched(), [])
+
+    def test_unchanged_revision_skips_reading(self) -> None:
+        create_km_good(1)
+        sheets = create_sheets([[["Пивоварня - Пиво 1", "name", f"code{1:015d}"]]])
+        sheets.drive_service = mock.MagicMock()
+        sheets.drive_service.files().get().execute.return_value = {"version": "1", "modifiedTime": "2022-10-05T00:00:00Z"}
+        with mock.patch.object(gs_class.GoogleSheets, "get_access", return_value=True):
+            self.assertTrue(sheets.sync_compl_table())
+            self.assertFalse(sheets.compl_table_unchanged)
+            self.assertEqual(len(sheets.not_matched), 1)
+
+            create_ms_good(1, brewery="Пивоварня", name="Пиво 1")
+            sheets.service.spreadsheets().values().batchGet.reset_mock()
+            self.assertTrue(sheets.sync_compl_table())
+        self.assertTrue(sheets.compl_table_unchanged)
+        sheets.service.spreadsheets().values().batchGet.assert_not_called()
+        self.assertEqual(sheets.not_matched, [])
+        self.assertEqual(ms_models.MoySkladDBGood.egais_code.through.objects.count(), 1)
+
+
+def apply_blocks(current: List[List[Any]], blocks: List[gs_diff.CellBlock]) -> List[List[str]]:
+    """Функция записывает блоки в копию диапазона current так, как это сделает Google Sheets, и возвращает результат."""
+    sheet = [[gs_diff.normalize_value(value) for value in row] for row in current]
+    for block in blocks:
+        for row_offset, values in enumerate(block.values):
+            row = block.row + row_offset
+            sheet.extend([] for _ in range(row + 1 - len(sheet)))
+            sheet[row].extend("" for _ in range(block.column + len(values) - len(sheet[row])))
+            sheet[row][block.column: block.column + len(values)] = [gs_diff.normalize_value(value) for value in values]
+    return strip_range(sheet)
+
+
+def strip_range(sheet: List[List[str]]) -> List[List[str]]:
+    """Функция отбрасывает пустые ячейки в конце строк и пустые строки в конце диапазона, как Google Sheets."""
+    sheet = [row[: max((index + 1 for index, value in enumerate(row) if value), default=0)] for row in sheet]
+    while sheet and not sheet[-1]:
+        sheet.pop()
+    return sheet
+
+
+class SheetDiffTest(TestCase):
+    """Вычисление изменений диапазона Google Sheets."""
+
+    def test_normalize_numbers(self) -> None:
+        for value in (Decimal("250.00"), 250.0, 250, "250", Decimal("2.5E+2")):
+            with self.subTest(value=value):
+                self.assertEqual(gs_diff.normalize_value(value), "250")
+        self.assertEqual(gs_diff.normalize_value(Decimal("0.330")), gs_diff.normalize_value(0.33))
+        self.assertEqual(gs_diff.normalize_value(1e21), "1000000000000000000000")
+        # Коды с ведущими нулями остаются строками
+        self.assertEqual(gs_diff.normalize_value("0012"), "0012")
+        self.assertEqual(gs_diff.normalize_value(None), "")
+        self.assertEqual(gs_diff.normalize_value(True), "TRUE")
+
+    def test_equal_numbers_are_not_rewritten(self) -> None:
+        self.assertEqual(gs_diff.get_changed_blocks(current=[["a", 250, 0.5]], data=[["a", Decimal("250.00"), "0.50"]]), [])
+
+    def test_blocks(self) -> None:
+        blocks = gs_diff.get_changed_blocks(
+            current=[["a", 1, 2], ["b", 1, 2], ["c", 1, 2]],
+            data=[["a", 5, 6], ["b", 7, 8], ["c", 1, 2], ["d"]],
+        )
+        self.assertEqual(blocks, [gs_diff.CellBlock(0, 1, [[5, 6], [7, 8]]), gs_diff.CellBlock(3, 0, [["d"]])])
+        self.assertEqual(gs_diff.count_cells(blocks), 5)
+        self.assertEqual(gs_diff.get_block_range(blocks[0], *gs_diff.parse_start_cell("B2:H")), "C2:D3")
+        self.assertEqual(gs_diff.column_letters(gs_diff.column_index("AZ")), "AZ")
+
+    def test_applied_blocks_give_data(self) -> None:
+        rnd = random.Random(25)
+        current: List[List[Any]] = [
+            [f"Товар {row}", f"Пивоварня {row % 5}", "Стиль", rnd.choice((0.33, 0.5)), rnd.randint(0, 20), 250.0, ""]
+            for row in range(200)
+        ]
+        for case in range(50):
+            data = [list(row) for row in current]
+            for _ in range(rnd.randint(0, 100)):
+                data[rnd.randrange(len(data))][rnd.randrange(7)] = rnd.choice((rnd.randint(0, 1000), "", Decimal("250.00")))
+            del data[len(data) - rnd.randint(0, 20):]
+            data.extend([f"Новый товар {row}", "Пивоварня", "", 0.5, 1, 300] for row in range(rnd.randint(0, 20)))
+
+            with self.subTest(case=case):
+                blocks = gs_diff.get_changed_blocks(current=current, data=data)
+                expected = strip_range([[gs_diff.normalize_value(value) for value in row] for row in data])
+                self.assertEqual(apply_blocks(current, blocks), expected)